@@ -0,0 +1,77 @@
+-- Materialized summaries behind the views. Rows are refreshed only for the (entry_id, gameweek)
+-- pairs listed in the temporary table summary_refresh (entry_id NULL = every entry of that gameweek)
+BEGIN TRANSACTION;
+
+CREATE TABLE IF NOT EXISTS "ManagerGameweekSummary_MT" (
+entry_id INTEGER,
+gameweek INTEGER,
+player_name TEXT,
+points INTEGER,
+points_on_bench INTEGER,
+total_points INTEGER,
+gameweek_rank INTEGER,
+overall_rank INTEGER,
+week_transfers INTEGER,
+week_transfers_cost INTEGER,
+captain_element INTEGER,
+captain_multiplier INTEGER,
+captain_points INTEGER,
+bench_points INTEGER,
+PRIMARY KEY (entry_id, gameweek));
+CREATE INDEX IF NOT EXISTS ManagerGameweekSummary_MT_gameweek_index ON "ManagerGameweekSummary_MT" (gameweek);
+
+DELETE FROM "ManagerGameweekSummary_MT"
+WHERE EXISTS (SELECT 1 FROM summary_refresh AS r WHERE r.gameweek = "ManagerGameweekSummary_MT".gameweek AND (r.entry_id IS NULL OR r.entry_id = "ManagerGameweekSummary_MT".entry_id));
+
+INSERT INTO "ManagerGameweekSummary_MT"
+SELECT
+h.entry_id
+,h.gameweek
+,u.player_name
+,h.points
+,h.points_on_bench
+,h.total_points
+,h.gameweek_rank
+,h.overall_rank
+,h.week_transfers
+,h.week_transfers_cost
+,(SELECT p.element FROM gameweekPicks AS p WHERE p.entry_id = h.entry_id AND p.gameweek = h.gameweek AND p.is_captain = 1) AS captain_element
+,(SELECT p.multiplier FROM gameweekPicks AS p WHERE p.entry_id = h.entry_id AND p.gameweek = h.gameweek AND p.is_captain = 1) AS captain_multiplier
+,(SELECT SUM(b.total_points * p.multiplier) FROM gameweekPicks AS p INNER JOIN gameweekPerformance AS b ON p.element = b.element AND p.gameweek = b.round
+  WHERE p.entry_id = h.entry_id AND p.gameweek = h.gameweek AND p.is_captain = 1) AS captain_points
+,COALESCE((SELECT SUM(b.total_points) FROM gameweekPicks AS p INNER JOIN gameweekPerformance AS b ON p.element = b.element AND p.gameweek = b.round
+  WHERE p.entry_id = h.entry_id AND p.gameweek = h.gameweek AND p.position > 11), 0) AS bench_points
+FROM userTeamHistory AS h
+INNER JOIN users AS u
+ON h.entry_id = u.entry
+WHERE EXISTS (SELECT 1 FROM summary_refresh AS r WHERE r.gameweek = h.gameweek AND (r.entry_id IS NULL OR r.entry_id = h.entry_id));
+
+CREATE TABLE IF NOT EXISTS "TransferGain_MT" (
+entry_id INTEGER,
+gameweek INTEGER,
+transfers INTEGER,
+transfers_cost INTEGER,
+points_in INTEGER,
+points_out INTEGER,
+net_gain INTEGER,
+PRIMARY KEY (entry_id, gameweek));
+CREATE INDEX IF NOT EXISTS TransferGain_MT_gameweek_index ON "TransferGain_MT" (gameweek);
+
+DELETE FROM "TransferGain_MT"
+WHERE EXISTS (SELECT 1 FROM summary_refresh AS r WHERE r.gameweek = "TransferGain_MT".gameweek AND (r.entry_id IS NULL OR r.entry_id = "TransferGain_MT".entry_id));
+
+INSERT INTO "TransferGain_MT"
+SELECT entry_id, gameweek, transfers, transfers_cost, points_in, points_out, points_in - points_out - transfers_cost AS net_gain
+FROM (
+SELECT
+t.entry_id
+,t.gameweek
+,COUNT(*) AS transfers
+,COALESCE((SELECT h.week_transfers_cost FROM userTeamHistory AS h WHERE h.entry_id = t.entry_id AND h.gameweek = t.gameweek), 0) AS transfers_cost
+,SUM(COALESCE((SELECT SUM(b.total_points) FROM gameweekPerformance AS b WHERE b.element = t.player_in AND b.round = t.gameweek), 0)) AS points_in
+,SUM(COALESCE((SELECT SUM(b.total_points) FROM gameweekPerformance AS b WHERE b.element = t.player_out AND b.round = t.gameweek), 0)) AS points_out
+FROM userTransferHistory AS t
+WHERE EXISTS (SELECT 1 FROM summary_refresh AS r WHERE r.gameweek = t.gameweek AND (r.entry_id IS NULL OR r.entry_id = t.entry_id))
+GROUP BY t.entry_id, t.gameweek);
+
+COMMIT;
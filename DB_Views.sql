@@ -102,4 +102,12 @@ INNER JOIN
 premierTeams_LK AS e
 ON b.opponent_team = e.id
 INNER JOIN users AS f
-ON a.entry_id = f.entry;
\ No newline at end of file
+ON a.entry_id = f.entry;
+
+-- Views over the materialized summaries of DB_Summaries.sql, read these instead of summing
+-- gameweekPicks and gameweekPerformance again (the _MT tables are created after this script runs)
+DROP VIEW IF EXISTS "ManagerGameweekSummary_V";
+CREATE VIEW "ManagerGameweekSummary_V" AS SELECT "player_name","gameweek","points","points_on_bench","total_points","gameweek_rank","overall_rank","week_transfers","week_transfers_cost","captain_element",c.web_name AS captain_name,"captain_multiplier","captain_points","bench_points" FROM ManagerGameweekSummary_MT AS a LEFT JOIN playerInfo_LK AS c ON a.captain_element = c.id;
+
+DROP VIEW IF EXISTS "TransferGain_V";
+CREATE VIEW "TransferGain_V" AS SELECT "player_name","gameweek","transfers","transfers_cost","points_in","points_out","net_gain" FROM TransferGain_MT INNER JOIN users ON TransferGain_MT."entry_id" = users."entry";
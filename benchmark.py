@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Fantasy Premier League 2017-2018 scraper
+
+@author: Theodoros Panagiotakos
+"""
+
+# End to end benchmark: runs the whole fpl_info.py pipeline against a local MockFPLServer and
+# reports requests/sec, wall time, time per stage, database size and peak memory.
+# Every benchmark is appended to a json lines file so that the numbers can be tracked over time.
+#
+# python benchmark.py --managers 500 --gameweeks 20 --latency 0.02
+
+import argparse
+import datetime
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import mock_server as ms
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, the peak memory is not reported there
+    resource = None
+
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_FILE = "benchmark_results.jsonl"
+
+
+def peak_rss_mb():
+    '''
+    Returns the peak resident memory of this process or of its finished child processes
+    (the league workers) in MB, None where it cannot be measured
+    '''
+    if resource is None:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+def files_size(workdir, pattern):
+    return sum(os.path.getsize(path) for path in glob.glob(os.path.join(workdir, pattern)))
+
+def _pipeline_process(workdir, rebuild, settings, results):
+    '''
+    Runs fpl_info.run() in its own process (so that its peak memory is its own), with
+    params.py overridden by settings and the pipeline's log written to pipeline.log in workdir
+    '''
+    sys.path.insert(0, REPO_DIR)
+    os.chdir(workdir)
+    import params
+    # before the pipeline modules are imported, they copy the parameters
+    params.configure(settings)
+    import logging
+    import metrics as mt
+    import fpl_info
+    logging.basicConfig(filename = "pipeline.log", level = params.LOG_LEVEL, format = fpl_info.LOG_FORMAT)
+    fpl_info.views_file = os.path.join(REPO_DIR, fpl_info.views_file)
+    fpl_info.summaries_file = os.path.join(REPO_DIR, fpl_info.summaries_file)
+
+    stage_times = {}
+    started = time.perf_counter()
+    leagues = fpl_info.run(params.USER_LEAGUE, rebuild, stage_times, params.LEAGUE_WORKERS, settings)
+    wall_time = time.perf_counter() - started
+    mt.registry.write("run_report.json", "metrics.prom", {"leagues": leagues, "rows": mt.registry.pivot("db_upsert_rows_total", "table", "result")})
+    results.put({"wall_time": wall_time, "stage_times": stage_times, "peak_rss_mb": peak_rss_mb(), "leagues": leagues,
+                 "downloaded_mb": mt.registry.total("fpl_downloaded_bytes_total") / (1024 * 1024),
+                 "rows_written": mt.registry.total("db_rows_written_total")})
+
+def run_pipeline(server, workdir, rebuild, settings):
+    '''
+    Runs the pipeline once against server and measures it
+
+    Input: server = the MockFPLServer
+           workdir = the folder of the databases and the cache
+           rebuild = True for a full download, False for an incremental run
+           settings = a dictionary {params name : value} overriding params.py
+
+    Output: a dictionary with the measures of the run
+    '''
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    requests, errors = server.requests, server.errors
+    overrides = {"FPL_URL": server.url, "USER_LEAGUE": {"benchmark": server.season.league_ids}}
+    overrides.update(settings)
+    process = context.Process(target = _pipeline_process, args = (workdir, rebuild, overrides, results))
+    process.start()
+    measures = results.get()
+    process.join()
+    measures["requests"] = server.requests - requests
+    measures["injected_errors"] = server.errors - errors
+    measures["requests_per_sec"] = measures["requests"] / measures["wall_time"] if measures["wall_time"] else 0
+    measures["db_mb"] = files_size(workdir, "fpl_*.db*") / (1024 * 1024)
+    measures["cache_mb"] = files_size(workdir, "fpl_http_cache.db*") / (1024 * 1024)
+    return measures
+
+def report(name, measures):
+    print("{0}: {1:.1f} s, {2} requests ({3:.1f} req/s, {4} injected errors, {5:.1f} MB), {6} rows written, databases {7:.1f} MB, cache {8:.1f} MB, peak RSS {9}".format(
+          name, measures["wall_time"], measures["requests"], measures["requests_per_sec"], measures["injected_errors"], measures["downloaded_mb"],
+          measures["rows_written"], measures["db_mb"], measures["cache_mb"], "{0:.0f} MB".format(measures["peak_rss_mb"]) if measures["peak_rss_mb"] else "n/a"))
+    for stage, seconds in sorted(measures["stage_times"].items(), key = lambda item: -item[1]):
+        print("    {0:<26} {1:8.2f} s".format(stage, seconds))
+
+def benchmark(managers = 200, players = 300, gameweeks = 10, latency = 0.0, error_rate = 0.0, settings = None, runs = ("rebuild", "incremental"), output = RESULTS_FILE, label = "", leagues = 1):
+    '''
+    Serves a mock season and runs the pipeline on it: a full download ("rebuild") followed by
+    runs with nothing new to download ("incremental"), in a fresh temporary folder.
+
+    Output: the benchmark record appended to output
+    '''
+    season = ms.MockSeason(managers, players, gameweeks, leagues = leagues)
+    server = ms.MockFPLServer(season, latency = latency, error_rate = error_rate)
+    server.start()
+    record = {"date": datetime.datetime.now().isoformat(timespec = "seconds"), "label": label, "leagues": leagues,
+              "managers": managers, "players": players, "gameweeks": gameweeks, "latency": latency,
+              "error_rate": error_rate, "settings": settings or {}, "runs": []}
+    try:
+        with tempfile.TemporaryDirectory(prefix = "fpl_benchmark_") as workdir:
+            for run in runs:
+                measures = run_pipeline(server, workdir, run == "rebuild", settings or {})
+                measures["run"] = run
+                record["runs"].append(measures)
+                report(run, measures)
+    finally:
+        server.shutdown()
+        server.server_close()
+    if output:
+        with open(output, "a") as f:
+            f.write(json.dumps(record) + "\n")
+    return record
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "End to end benchmark of fpl_info.py against a local mock of the FPL api")
+    parser.add_argument("--managers", type = int, default = 200, help = "managers in every league")
+    parser.add_argument("--leagues", type = int, default = 1)
+    parser.add_argument("--league-workers", type = int, help = "LEAGUE_WORKERS of the run")
+    parser.add_argument("--players", type = int, default = 300)
+    parser.add_argument("--gameweeks", type = int, default = 10)
+    parser.add_argument("--latency", type = float, default = 0.0, help = "seconds added to every response")
+    parser.add_argument("--error-rate", type = float, default = 0.0, help = "share of the requests answered with 429/503")
+    parser.add_argument("--workers", type = int, help = "MAX_WORKERS of the run")
+    parser.add_argument("--rate", type = float, default = 1000.0, help = "REQUEST_RATE of the run, requests per second")
+    parser.add_argument("--runs", nargs = "+", default = ["rebuild", "incremental"], choices = ["rebuild", "incremental"])
+    parser.add_argument("--output", default = RESULTS_FILE, help = "json lines file the results are appended to")
+    parser.add_argument("--label", default = "", help = "name of the benchmark in the results file")
+    args = parser.parse_args()
+
+    settings = {"REQUEST_RATE": args.rate, "REQUEST_BURST": max(1, int(args.rate))}
+    if args.workers:
+        settings["MAX_WORKERS"] = args.workers
+    if args.league_workers:
+        settings["LEAGUE_WORKERS"] = args.league_workers
+    benchmark(args.managers, args.players, args.gameweeks, args.latency, args.error_rate, settings, args.runs, args.output, args.label, args.leagues)
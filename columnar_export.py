@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+Fantasy Premier League 2017-2018 scraper
+
+@author: Theodoros Panagiotakos
+"""
+
+# Columnar export of the league tables for the analysis tools. Every table is split in one
+# folder per gameweek holding one NumPy .npy file per column:
+#
+#   {export_dir}/{table}/gameweek={n}/{column}.npy
+#   {export_dir}/{table}/manifest.json
+#
+# so that a column of a gameweek can be loaded memory mapped (np.load(mmap_mode = "r")) without
+# reading the others. Integer columns are int64, real columns and columns holding NULLs are
+# float64 (NULL = NaN) and text columns fixed width unicode, the same for every gameweek of a
+# column (a column is float64 in every partition once one of them holds a NULL).
+
+import json
+import logging
+import os
+import shutil
+import params
+
+try:
+    import numpy as np
+except ImportError:
+    # the export is skipped without numpy
+    np = None
+
+log = logging.getLogger(__name__)
+
+
+EXPORT_DIR = params.EXPORT_DIR
+# Exported tables {table : (gameweek column, table whose gameweek counts tell when a partition changed)}
+EXPORT_TABLES = {"gameweekPerformance": ("round", "gameweekPerformance"),
+                 "gameweekPicks": ("gameweek", "gameweekPicks"),
+                 "userTeamHistory": ("gameweek", "userTeamHistory"),
+                 "UserGameweekPerformance_V": ("gameweek", "gameweekPicks")}
+MANIFEST_FILE = "manifest.json"
+
+
+def _partition_dir(export_dir, table, gameweek):
+    return os.path.join(export_dir, table, "gameweek={0}".format(gameweek))
+
+def _read_manifest(export_dir, table):
+    try:
+        with open(os.path.join(export_dir, table, MANIFEST_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"partitions": {}}
+
+def _write_manifest(export_dir, table, manifest):
+    path = os.path.join(export_dir, table, MANIFEST_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent = 1)
+    os.replace(path + ".tmp", path)
+
+# Kinds of the exported columns, each one holds the values of the kinds before it
+KINDS = ["int", "float", "text"]
+# {dtype kind character : column kind}
+DTYPE_KINDS = {"i": "int", "f": "float", "U": "text"}
+
+def column_kind(values):
+    '''
+    Returns the kind of array the values of a column need: "text" when the column holds text,
+    "float" when it holds real numbers or NULL, "int" otherwise (None for no values)
+    '''
+    if not values:
+        return None
+    if any(isinstance(value, str) for value in values):
+        return "text"
+    if any(value is None or isinstance(value, float) for value in values):
+        return "float"
+    return "int"
+
+def widest(*kinds):
+    ''' Returns the kind holding the values of all the kinds given (None for none) '''
+    return max((kind for kind in kinds if kind is not None), key = KINDS.index, default = None)
+
+def table_kinds(partitions):
+    '''
+    Returns the kind of every column of a table from the dtypes of its exported partitions
+    '''
+    kinds = {}
+    for partition in partitions.values():
+        for name, dtype in partition["columns"].items():
+            kinds[name] = widest(kinds.get(name), DTYPE_KINDS.get(np.dtype(dtype).kind))
+    return kinds
+
+def column_array(values, kind = None):
+    '''
+    Converts the values of a column into a NumPy array: int64, float64 (NULL = NaN)
+    or fixed width unicode when the column holds text. kind forces a wider array than the
+    values need, so that every partition of a column has the same dtype.
+    '''
+    kind = widest(kind, column_kind(values)) or "float"
+    if kind == "text":
+        return np.array(["" if value is None else str(value) for value in values], dtype = str)
+    if kind == "float":
+        return np.array([np.nan if value is None else value for value in values], dtype = np.float64)
+    return np.array(values, dtype = np.int64)
+
+def write_partition(connection, export_dir, table, gameweek_column, gameweek, kinds = None):
+    '''
+    Writes the rows of a table for one gameweek as one .npy file per column,
+    replacing the partition written before
+
+    Input: kinds = {column name : kind} of the table (see table_kinds()), the columns are
+                   written with them and they are widened to hold the values of the partition
+
+    Output: columns = {column name : dtype string}
+    '''
+    kinds = {} if kinds is None else kinds
+    cursor = connection.execute('SELECT * FROM "{0}" WHERE "{1}" = ?'.format(table, gameweek_column), (gameweek,))
+    names = [description[0] for description in cursor.description]
+    rows = cursor.fetchall()
+    columns = list(zip(*rows)) if rows else [() for name in names]
+    folder = _partition_dir(export_dir, table, gameweek)
+    shutil.rmtree(folder + ".tmp", ignore_errors = True)
+    os.makedirs(folder + ".tmp")
+    dtypes = {}
+    for name, values in zip(names, columns):
+        kinds[name] = widest(kinds.get(name), column_kind(values))
+        array = column_array(list(values), kinds[name])
+        np.save(os.path.join(folder + ".tmp", name + ".npy"), array)
+        dtypes[name] = array.dtype.str
+    shutil.rmtree(folder, ignore_errors = True)
+    os.replace(folder + ".tmp", folder)
+    return dtypes
+
+def export_tables(connection, export_dir = EXPORT_DIR, touched_gameweeks = None, tables = EXPORT_TABLES):
+    '''
+    Exports the tables of our DB to columnar files, one partition per gameweek.
+    A partition is written again when its gameweek was touched by the run or when its
+    row count changed, partitions of gameweeks no longer in the DB are removed.
+    Every partition of a column has the same dtype: when a partition needs a wider one
+    (e.g. the first NULL of an integer column) the others are written again with it.
+
+    Input: connection = the connection with the DB
+           export_dir = the folder of the export
+           touched_gameweeks = the gameweeks changed by this run, None rewrites every partition
+           tables = {table : (gameweek column, table counting the rows of a gameweek)}
+
+    Output: written = a dictionary {table : list of the gameweeks written}
+    '''
+    written = {}
+    if np is None:
+        log.warning("numpy is not installed, columnar export skipped")
+        return written
+    # the TEMP views of the partitioned tables included (see gameweek_partitions.py)
+    existing = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view') "
+                                                     "UNION SELECT name FROM sqlite_temp_master WHERE type = 'view'")}
+    for table, (gameweek_column, count_table) in tables.items():
+        if table not in existing or count_table not in existing:
+            continue
+        count_column = gameweek_column if count_table == table else "gameweek"
+        counts = {str(gameweek): rows for gameweek, rows in
+                  connection.execute('SELECT "{1}", COUNT(*) FROM "{0}" WHERE "{1}" IS NOT NULL GROUP BY "{1}"'.format(count_table, count_column))}
+        os.makedirs(os.path.join(export_dir, table), exist_ok = True)
+        manifest = _read_manifest(export_dir, table)
+        partitions = manifest["partitions"]
+        changed = [gameweek for gameweek, rows in counts.items()
+                   if touched_gameweeks is None or int(gameweek) in touched_gameweeks
+                   or partitions.get(gameweek, {}).get("source_rows") != rows]
+        for gameweek in set(partitions) - set(counts):
+            shutil.rmtree(_partition_dir(export_dir, table, gameweek), ignore_errors = True)
+            del partitions[gameweek]
+        kinds = table_kinds(partitions)
+        for gameweek in changed:
+            columns = write_partition(connection, export_dir, table, gameweek_column, int(gameweek), kinds)
+            partitions[gameweek] = {"source_rows": counts[gameweek], "columns": columns}
+        widened = [gameweek for gameweek, partition in partitions.items()
+                   if any(kinds.get(name) not in (None, DTYPE_KINDS.get(np.dtype(dtype).kind)) for name, dtype in partition["columns"].items())]
+        for gameweek in widened:
+            partitions[gameweek]["columns"] = write_partition(connection, export_dir, table, gameweek_column, int(gameweek), kinds)
+        changed = set(changed) | set(widened)
+        _write_manifest(export_dir, table, manifest)
+        written[table] = sorted(int(gameweek) for gameweek in changed)
+        log.info("Table %s exported, %s gameweek partitions written", table, len(changed))
+    return written
+
+def partitions(export_dir, table):
+    '''
+    Returns the exported gameweeks of a table
+    '''
+    return sorted(int(gameweek) for gameweek in _read_manifest(export_dir, table)["partitions"])
+
+def load_partition(export_dir, table, gameweek, columns = None, mmap = True):
+    '''
+    Loads columns of one gameweek of an exported table, memory mapped by default (no copy)
+
+    Output: a dictionary {column name : array}
+    '''
+    folder = _partition_dir(export_dir, table, gameweek)
+    if columns is None:
+        columns = _read_manifest(export_dir, table)["partitions"][str(gameweek)]["columns"]
+    return {name: np.load(os.path.join(folder, name + ".npy"), mmap_mode = "r" if mmap else None) for name in columns}
+
+def load_table(export_dir, table, columns = None, gameweeks = None):
+    '''
+    Loads columns of an exported table for the given gameweeks (all by default),
+    concatenating the gameweek partitions
+
+    Output: a dictionary {column name : array}
+    '''
+    gameweeks = partitions(export_dir, table) if gameweeks is None else gameweeks
+    loaded = [load_partition(export_dir, table, gameweek, columns) for gameweek in gameweeks]
+    if not loaded:
+        return {}
+    return {name: np.concatenate([partition[name] for partition in loaded]) for name in loaded[0]}
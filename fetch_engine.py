@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+Fantasy Premier League 2017-2018 scraper
+
+@author: Theodoros Panagiotakos
+"""
+
+import atexit
+import logging
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import http_client as hc
+import payload_archive as pa
+import params
+
+log = logging.getLogger(__name__)
+
+
+MAX_WORKERS = params.MAX_WORKERS
+PARSE_WORKERS = params.PARSE_WORKERS
+# Archived pages sent to a parse worker at once
+REPLAY_CHUNK_SIZE = 64
+
+
+def fetch_json(url, client = None):
+    '''
+    Downloads a single url and returns its parsed json response
+    
+    Input: url = the FPL page to download
+           client = the FPLClient to use, defaults to http_client.default_client()
+    '''
+    client = client or hc.default_client()
+    return client.get_json(url)
+
+def _fetch_job(key, url, client):
+    try:
+        return key, fetch_json(url, client)
+    except hc.FPLRequestError as e:
+        log.error("There was a problem with the JSON file for link: %s: %s", url, e)
+        return key, None
+
+def _by_priority(jobs, client):
+    '''
+    Returns the (key, url) items of jobs in the priority order of the client's scheduler,
+    so that the pages of the current gameweek are submitted to the pool first
+    '''
+    if client.scheduler is None:
+        return list(jobs.items())
+    return sorted(jobs.items(), key = lambda item: client.scheduler.priority(item[1]))
+
+def iter_fetch_batch(jobs, max_workers = MAX_WORKERS, client = None):
+    '''
+    Downloads a batch of urls concurrently and yields the responses as they arrive
+    
+    Input:  jobs = a dictionary {key : url}, the key identifies the job for the caller
+            max_workers = the maximum number of downloads running at the same time
+            client = the FPLClient shared by the workers, defaults to http_client.default_client()
+            
+    Output: yields tuples (key, jsonResponse) in completion order, the jobs are started in the
+            priority order of the client's scheduler. jsonResponse is None
+            when the download failed after all the client's retries
+    '''
+    client = client or hc.default_client()
+    with ThreadPoolExecutor(max_workers = max_workers) as executor:
+        futures = [executor.submit(_fetch_job, key, url, client) for key, url in _by_priority(jobs, client)]
+        for future in as_completed(futures):
+            yield future.result()
+
+def fetch_batch(jobs, max_workers = MAX_WORKERS, client = None):
+    '''
+    Downloads a batch of urls concurrently and returns all the responses
+    
+    Input:  jobs = a dictionary {key : url}
+            max_workers = the maximum number of downloads running at the same time
+            client = the FPLClient shared by the workers
+            
+    Output: results = a dictionary {key : jsonResponse} (None for failed downloads)
+    '''
+    return dict(iter_fetch_batch(jobs, max_workers, client))
+
+def _run_job(key, url, handler, parse, client):
+    key, jsonResponse = _fetch_job(key, url, client)
+    if jsonResponse is None:
+        return
+    try:
+        handler(key, parse(key, jsonResponse) if parse is not None else jsonResponse)
+    except BaseException as e:
+        log.error("There was a problem with processing the JSON file for link: %s: %s", url, e)
+
+def run_batch(jobs, handler, max_workers = MAX_WORKERS, client = None, parse = None):
+    '''
+    Downloads a batch of urls concurrently and calls handler(key, jsonResponse) in the
+    download worker for every successful response. Used with pipeline.DBWriter so that
+    the workers parse the responses and queue the rows for the database writer.
+    When the client replays its archive and parse is given, the archived pages are decoded
+    and parsed in worker processes instead (see replay_batch()).
+    The jobs are started in the priority order of the client's scheduler.
+    
+    Input:  jobs = a dictionary {key : url}
+            handler = the function processing each response
+            max_workers = the maximum number of downloads running at the same time
+            client = the FPLClient shared by the workers
+            parse = a picklable function parse(key, jsonResponse), when given the handler
+                    is called with its result instead of the json response
+    '''
+    client = client or hc.default_client()
+    if client.replay and parse is not None:
+        return replay_batch(jobs, handler, parse, client.archive)
+    with ThreadPoolExecutor(max_workers = max_workers) as executor:
+        futures = [executor.submit(_run_job, key, url, handler, parse, client) for key, url in _by_priority(jobs, client)]
+        for future in as_completed(futures):
+            future.result()
+
+_parse_pool = None
+
+def parse_pool():
+    '''
+    Returns the pool of processes parsing archived pages, created on first use and
+    shut down when the program exits. The exit handlers do not run in worker processes
+    (e.g. the league workers of fpl_info.run), they call shutdown_parse_pool() themselves.
+    '''
+    global _parse_pool
+    if _parse_pool is None:
+        _parse_pool = ProcessPoolExecutor(max_workers = PARSE_WORKERS, mp_context = multiprocessing.get_context("spawn"))
+    return _parse_pool
+
+def shutdown_parse_pool():
+    '''
+    Shuts down the parse_pool() processes, if they were started
+    '''
+    global _parse_pool
+    if _parse_pool is not None:
+        _parse_pool.shutdown()
+        _parse_pool = None
+
+atexit.register(shutdown_parse_pool)
+
+def _parse_archived(parse, items):
+    '''
+    Runs in a parse worker: decodes and parses a chunk of archived pages
+
+    Output: a list of (key, url, parsed response, error message or None)
+    '''
+    results = []
+    for key, url, payload in items:
+        try:
+            results.append((key, url, parse(key, hc.loads(pa.decompress(payload))), None))
+        except Exception as e:
+            results.append((key, url, None, "{0}: {1}".format(type(e).__name__, e)))
+    return results
+
+def replay_batch(jobs, handler, parse, archive, chunk_size = REPLAY_CHUNK_SIZE):
+    '''
+    Reads the pages of a batch from the archive and parses them in the parse_pool() processes,
+    calling handler(key, parsed response) in this thread as the chunks complete.
+    Only a few chunks per worker are in flight, so memory does not grow with the batch.
+    
+    Input:  jobs = a dictionary {key : url}
+            handler = the function processing each parsed response
+            parse = a picklable function parse(key, jsonResponse)
+            archive = the PayloadArchive holding the pages
+    '''
+    def handle(results):
+        for key, url, parsed, error in results:
+            if error is not None:
+                log.error("There was a problem with processing the JSON file for link: %s: %s", url, error)
+                continue
+            try:
+                handler(key, parsed)
+            except BaseException as e:
+                log.error("There was a problem with processing the JSON file for link: %s: %s", url, e)
+
+    pool = parse_pool()
+    window = 2 * (PARSE_WORKERS or os.cpu_count() or 1)
+    items = list(jobs.items())
+    pending = deque()
+    for start in range(0, len(items), chunk_size):
+        chunk = items[start:start + chunk_size]
+        payloads = archive.compressed(url for key, url in chunk)
+        for key, url in chunk:
+            if url not in payloads:
+                log.error("There was a problem with the JSON file for link: %s: page not available in the archive", url)
+        pending.append(pool.submit(_parse_archived, parse, [(key, url, payloads[url]) for key, url in chunk if url in payloads]))
+        while len(pending) >= window:
+            handle(pending.popleft().result())
+    while pending:
+        handle(pending.popleft().result())
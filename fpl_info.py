@@ -8,10 +8,27 @@ Fantasy Premier League 2017-2018 scraper
 #The link with the FPL json data
 #https://fantasy.premierleague.com/drf/leagues-classic-standings/42407
 
+import functools
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+import multiprocessing
 import get_data as gd
 import manage_sqllite as sq
+import columnar_export as ce
+import fetch_engine as fe
+import gameweek_partitions as gp
+import http_client as hc
+import pipeline as pl
+import metrics as mt
+import scheduler as sc
 import params
 
+log = logging.getLogger(__name__)
+
 ###### Values used for testing
 # player_id = 355 # Id of Jermain Defoe
 # alefantos_id = 129099
@@ -24,9 +41,16 @@ USER_LEAGUE = params.USER_LEAGUE
 
 #FPL_LEAGUE_ID = 42407
 START_PAGE = 1
+# Number of leagues processed in parallel, each in its own process
+LEAGUE_WORKERS = params.LEAGUE_WORKERS
+LOG_FORMAT = "%(asctime)s %(levelname)s %(processName)s %(name)s: %(message)s"
+# Number of league entries written to the users table in one transaction
+USERS_CHUNK_SIZE = params.USERS_CHUNK_SIZE
 leagueStandingUrl = gd.FPL_URL + gd.LEAGUE_CLASSIC_STANDING_SUBURL
 
-rebuild_value = True
+# True drops and re-downloads every table, False only fetches what is missing from the DB.
+# A RETRANSFORM run always rebuilds, from the archived pages
+rebuild_value = params.REBUILD or params.RETRANSFORM
 
 '''
 # Database file
@@ -34,6 +58,10 @@ database = "fpl.db"
 '''
 # Views file
 views_file = "DB_Views.sql"
+# Materialized summary tables file
+summaries_file = "DB_Summaries.sql"
+# Database file shared by all the leagues (lookups and player performance)
+global_database = params.GLOBAL_DATABASE
 
 
 # Table for users
@@ -55,73 +83,235 @@ gameweek_picks_table = "gameweekPicks"
 gameweek_subs_table = "gameweekSubs"
 '''
 # List of performance tables
-performance_table_list = ["gameweekDeadline", "gameweekPicks", "gameweekSubs", "gameweekPerformance"]
+performance_table_list = ["gameweekDeadline", "gameweekPicks", "gameweekSubs"]
+# Table for player performance (league independent, kept in the global database)
+player_performance_table_name = "gameweekPerformance"
 # List of lookup tables
 lookup_table_list = ["playerPosition_LK","premierTeams_LK","statNames_LK","playerInfo_LK"]
 
 
-def users_data(dbase, table_name, fpl_league_id, league_standing_url, start_page = 1, rebuild = False):
+def resume_keys(keys, units, key_of):
+    '''
+    Returns the keys a stage downloads. When the stage is resumed (units from sq.ledger_resume)
+    its pending and failed units are retried and its completed units are skipped.
+    
+    Input: keys = the keys the stage found missing from the DB
+           units = the stage's units in the run ledger, None if the stage is not resumed
+           key_of = the function turning a ledger unit (entry_id, gameweek, element) into a key
+    '''
+    if units is None:
+        return list(keys)
+    done = {key_of(unit) for unit, status in units.items() if status == "done"}
+    retried = [key_of(unit) for unit, status in units.items() if status != "done"]
+    return [key for key in dict.fromkeys(retried + list(keys)) if key not in done]
+
+def finish_stage(dbase, endpoint, finished_gameweek = None):
+    '''
+    Closes a stage in the run ledger of dbase and reports the pages left unfetched.
+    When none is left the stage's mark moves to finished_gameweek (see dirty_after)
+    '''
+    connection, cursor = sq.connect(dbase)
+    failed = sq.ledger_finish(connection, endpoint)
+    if not failed and finished_gameweek is not None:
+        sq.set_stage_mark(connection, endpoint, finished_gameweek)
+    sq.close(connection)
+    if failed:
+        log.warning("%s %s pages left unfetched, the next run retries them: %s", len(failed), endpoint, failed)
+
+def fail_stage(dbase, endpoint):
+    '''
+    Marks a stage that raised as failed in the run ledger of dbase, so the run is not finished
+    '''
+    try:
+        connection, cursor = sq.connect(dbase)
+        sq.ledger_stage(connection, endpoint, "failed")
+        sq.close(connection)
+    except BaseException as e:
+        log.error("Issue with recording the failed stage %s: %s", endpoint, e)
+
+def dirty_after(connection, endpoint, current_gameweek, finished_gameweek):
+    '''
+    Returns the gameweek after which the pages of a stage are downloaded again even if stored:
+    its stored gameweeks are final only up to the last one downloaded after it was finished
+    (the stage mark), the current gameweek is always dirty until the bootstrap marks it finished
+    '''
+    if finished_gameweek is None:
+        finished_gameweek = current_gameweek - 1
+    mark = sq.stage_mark(connection, endpoint)
+    # tables written before the stage marks existed: the gameweeks before the current one are final
+    if mark is None:
+        mark = current_gameweek - 1
+    return min(mark, finished_gameweek)
+
+def start_run(dbase):
+    '''
+    Starts a run on dbase, resuming the stages of the last run if it did not finish
+    '''
+    try:
+        connection, cursor = sq.connect(dbase)
+        if sq.ledger_start_run(connection):
+            log.info("Resuming the unfinished run of %s", dbase)
+        sq.close(connection)
+    except BaseException as e:
+        log.error("Issue with starting the run ledger: %s", e)
+
+def finish_run(dbase):
+    '''
+    Marks the run on dbase as finished, or as failed when some of its stages failed or
+    did not finish (they are resumed by the next run)
+    
+    Output: True when the run finished
+    '''
     try:
-        player_ids = gd.getUserEntryIds(fpl_league_id, start_page, league_standing_url)
         connection, cursor = sq.connect(dbase)
+        unfinished = sq.ledger_finish_run(connection)
+        sq.close(connection)
+        if unfinished:
+            log.warning("Run of %s failed, the next run resumes: %s", dbase, ", ".join("{0} ({1})".format(endpoint, status) for endpoint, status in unfinished))
+        else:
+            log.info("Run of %s finished", dbase)
+        return not unfinished
+    except BaseException as e:
+        log.error("Issue with finishing the run ledger: %s", e)
+        return False
+
+def users_data(dbase, table_name, fpl_league_id, league_standing_url, start_page = 1, rebuild = False, chunk_size = USERS_CHUNK_SIZE):
+    '''
+    Loads every standings page of the league into the users table, chunk_size entries at a time.
+    The pages are recorded in the run ledger (endpoint standings, element = the page number),
+    a run with a page that failed is not finished and walks the standings again when resumed.
+    '''
+    try:
+        connection, cursor = sq.connect(dbase)
+        sq.ledger_stage(connection, "standings")
         if rebuild:
             sq.delete_table(connection,table_name)
             sq.drop_table(connection, table_name)
-        sq.users_table(connection, player_ids, table_name)
+        chunk = {}
+        pages_loaded = {}
+        for entry, entry_info in gd.iterLeagueEntries(fpl_league_id, league_standing_url, start_page, pages_loaded = pages_loaded):
+            chunk[entry] = entry_info
+            if len(chunk) >= chunk_size:
+                sq.users_table(connection, chunk, table_name)
+                chunk = {}
+        if chunk:
+            sq.users_table(connection, chunk, table_name)
+        sq.ledger_plan(connection, "standings", [(0, 0, page) for page in sorted(pages_loaded)])
+        sq.ledger_mark(connection, "standings", [(0, 0, page) for page, loaded in sorted(pages_loaded.items()) if loaded])
         sq.close(connection)
-        print ("Users data loaded in table {0}".format(table_name))
+        finish_stage(dbase, "standings")
+        log.info("Users data loaded in table %s", table_name)
     except BaseException as e:
-        print ("Issue with loading user's data")
-        print(str(e))
+        log.error("Issue with loading user's data: %s", e)
+        fail_stage(dbase, "standings")
+
+# Parsers of the pages downloaded by the stages, parse(key, jsonResponse). They run in the download
+# threads, or in the parse processes of fetch_engine when the tables are rebuilt from the archive
+def parse_history(user_id, jsonResponse):
+    return gd.parseUserTeamHistory(jsonResponse)
+
+def parse_transfers(user_id, jsonResponse):
+    return gd.parseUserTransferHistory(jsonResponse)
+
+def parse_picks(key, jsonResponse):
+    return gd.parseUserGameweekPicks(jsonResponse)
+
+def parse_live(player_teams, market, week, jsonResponse):
+    return gd.parseLiveGameweek(jsonResponse, week, player_teams, market.get(week))
 
-def user_history_data(dbase, user_table, tokens_table, history_table, rebuild = False):
+def parse_stats(element_id, jsonResponse):
+    return gd.parsePlayerStats(jsonResponse)
+
+def user_history_data(dbase, user_table, tokens_table, history_table, rebuild = False, current_gameweek = None, finished_gameweek = None):
+    '''
+    Loads the tokens and season history of the league's users. Without rebuild, users
+    whose history already reaches current_gameweek are skipped, unless current_gameweek
+    was not finished (finished_gameweek, see dirty_after) when it was downloaded.
+    A resumed stage only downloads the users it did not complete.
+    
+    Output: the list of user ids whose history was downloaded
+    '''
     try:
         connection, cursor = sq.connect(dbase)
         cursor.execute("PRAGMA busy_timeout = 30000")
         with connection:
             user_list = connection.execute("SELECT DISTINCT entry FROM {0}".format(user_table)).fetchall()        
-        if rebuild:
+        units = sq.ledger_resume(connection, "history")
+        sq.ledger_stage(connection, "history")
+        if rebuild and units is None:
             sq.delete_table(connection,tokens_table)
             sq.drop_table(connection, tokens_table)
             sq.delete_table(connection,history_table)
             sq.drop_table(connection, history_table)   
-        for user_id in user_list:
-            tokens, hist = gd.getUserTeamHistory(user_id[0])                    
-            print(user_id, tokens)
+        elif current_gameweek:
+            dirty = dirty_after(connection, "history", current_gameweek, finished_gameweek)
+            history_marks = sq.high_water_marks(connection, history_table, "entry_id", "gameweek")
+            user_list = [user_id for user_id in user_list if min(history_marks.get(user_id[0], 0), dirty) < current_gameweek]
+            log.info("%s users with missing gameweeks in %s", len(user_list), history_table)
+        user_ids = resume_keys([user_id[0] for user_id in user_list], units, lambda unit: unit[0])
+        sq.ledger_plan(connection, "history", [(user_id, 0, 0) for user_id in user_ids])
+        sq.close(connection)  
+        
+        def store_history(user_id, parsed):
+            tokens, hist = parsed
             if tokens:
-                sq.team_tokens_table(connection, user_id[0], tokens, tokens_table)
-            print("Tokens for user {0} successfully loaded".format(user_id[0]))
+                writer.submit(sq.team_tokens_table, user_id, tokens, tokens_table)
             if hist:
-                sq.team_history_table(connection, user_id[0], hist, history_table)
-            print("Team history for user {0} successfully loaded".format(user_id[0]))
-        sq.close(connection)  
+                writer.submit(sq.team_history_table, user_id, hist, history_table)
+            writer.submit(sq.ledger_mark, "history", [(user_id, 0, 0)])
+            log.debug("Tokens and team history for user %s queued", user_id)
+        
+        jobs = {user_id: gd.userTeamHistoryUrl(user_id) for user_id in user_ids}
+        with pl.DBWriter(dbase) as writer:
+            fe.run_batch(jobs, store_history, parse = parse_history)
+        finish_stage(dbase, "history", finished_gameweek)
+        return user_ids
     except BaseException as e:
-        print ("Issue with loading user:{0} tokens data".format(user_id))
-        print(str(e))
+        log.error("Issue with loading users' tokens data: %s", e)
+        fail_stage(dbase, "history")
         
-def transfer_history_data(dbase, user_table, transfer_table, rebuild = False):
+def transfer_history_data(dbase, user_table, transfer_table, rebuild = False, user_ids = None):
+    '''
+    Loads the transfer history of the league's users, or only of user_ids when given
+    (the users whose history changed in this run). A resumed stage only downloads the users
+    it did not complete.
+    '''
     try:
         connection, cursor = sq.connect(dbase)
         cursor.execute("PRAGMA busy_timeout = 30000")
         with connection:
             user_list = connection.execute("SELECT DISTINCT entry FROM {0}".format(user_table)).fetchall()
-        if rebuild:
+        units = sq.ledger_resume(connection, "transfers")
+        sq.ledger_stage(connection, "transfers")
+        if not rebuild and user_ids is not None:
+            user_ids = set(user_ids)
+            user_list = [user_id for user_id in user_list if user_id[0] in user_ids]
+        if rebuild and units is None:
             sq.delete_table(connection,transfer_table)
             sq.drop_table(connection, transfer_table)
-        for user_id in user_list:
-            transfers = gd.getUserTransferHistory(user_id[0])                      
-            if transfers:
-                sq.transfer_history_table(connection, user_id[0], transfers, transfer_table)
-            print("Transfer history for user {0} successfully loaded".format(user_id[0]))
+        user_ids = resume_keys([user_id[0] for user_id in user_list], units, lambda unit: unit[0])
+        sq.ledger_plan(connection, "transfers", [(user_id, 0, 0) for user_id in user_ids])
         sq.close(connection)          
+        
+        def store_transfers(user_id, transfers):
+            if transfers:
+                writer.submit(sq.transfer_history_table, user_id, transfers, transfer_table)
+            writer.submit(sq.ledger_mark, "transfers", [(user_id, 0, 0)])
+            log.debug("Transfer history for user %s queued", user_id)
+        
+        jobs = {user_id: gd.userTransferHistoryUrl(user_id) for user_id in user_ids}
+        with pl.DBWriter(dbase) as writer:
+            fe.run_batch(jobs, store_transfers, parse = parse_transfers)
+        finish_stage(dbase, "transfers")
     except BaseException as e:
-        print ("Issue with loading user:{0} transfer history".format(user_id[0]))
-        print(str(e))
+        log.error("Issue with loading users' transfer history: %s", e)
+        fail_stage(dbase, "transfers")
 
 def build_lookup_tables(dbase, lookup_tables, rebuild = False):
     try:
         connection, cursor = sq.connect(dbase)
         cursor.execute("PRAGMA busy_timeout = 30000")
+        sq.ledger_stage(connection, "lookups")
         if rebuild:
             for table in lookup_tables:
                 sq.delete_table(connection,table)
@@ -133,60 +323,412 @@ def build_lookup_tables(dbase, lookup_tables, rebuild = False):
         player_info = gd.getPlayerData()
         sq.player_lookup_table(connection, player_info, lookup_tables[3])
         sq.close(connection)
-        print ("Lookup tables completed succesfully")
+        finish_stage(dbase, "lookups")
+        log.info("Lookup tables completed succesfully")
         return gameweek
     except BaseException as e:
-        print ("Issue with creating lookup tables")                    
-        print (str(e))
+        log.error("Issue with creating lookup tables: %s", e)
+        fail_stage(dbase, "lookups")
     
         
-def gameweek_data(dbase, history_table, performance_table_list, player_lookup_table, rebuild = False):
+def gameweek_data(dbase, history_table, performance_table_list, rebuild = False, current_gameweek = None, finished_gameweek = None):
+    '''
+    Loads the gameweek picks, auto subs and deadlines of the league's users. Gameweeks
+    already stored are not downloaded again, except the ones that were not finished
+    (finished_gameweek, see dirty_after) when they were downloaded.
+    A resumed stage only downloads the user gameweeks it did not complete.
+    With PARTITION_GAMEWEEKS (params.py) the picks and auto subs are written to the partition
+    files of their gameweeks, one writer per file, and the partitions of the finished
+    gameweeks are sealed (see gameweek_partitions.py).
+    
+    Output: the list of (entry_id, gameweek) pairs whose picks were downloaded
+    '''
     try:
+        catalog = gp.catalog(dbase)
         connection, cursor = sq.connect(dbase)
         cursor.execute("PRAGMA busy_timeout = 30000")
         with connection:
             user_weeks = connection.execute("SELECT entry_id, MAX(gameweek), MIN(gameweek) FROM {0} GROUP BY entry_id".format(history_table)).fetchall()
-        print ("Userlist and corresponding gameweek range retrieval step completed")
-        if rebuild:
+        log.debug("Userlist and corresponding gameweek range retrieval step completed")
+        units = sq.ledger_resume(connection, "picks")
+        sq.ledger_stage(connection, "picks")
+        if rebuild and units is None:
+            # the partitions first, with the guard views named like the tables
+            if catalog is not None:
+                catalog.drop(connection)
             for table in performance_table_list:
                 sq.delete_table(connection,table)
                 sq.drop_table(connection, table)
-        deadline_table, picks_table, subs_table, player_table = performance_table_list
+        if catalog is not None:
+            catalog.migrate(connection)
+        # the picks already stored are read across the partitions
+        gp.attach(connection)
+        deadline_table, picks_table, subs_table = performance_table_list
         #sq.delete_table(connection,deadline_table)
         #sq.drop_table(connection, deadline_table)
         #sq.delete_table(connection,performance_table)
         #sq.drop_table(connection, performance_table)
-        for user_id, max_week, min_week in user_weeks:
-            for week in range(min_week,max_week+1):
-                deadline, picks, subs = gd.getUserGameweekPicks(user_id , week)
-                sq.gameweek_deadlines_table(connection, week, deadline, deadline_table)
-                sq.user_gameweek_picks_table(connection, week, user_id, picks, picks_table)
-                if len(subs) > 0:
-                    sq.user_gameweek_auto_subs_table(connection, week, user_id, subs, subs_table)
-                #sq.gameweek_performance_table(connection, week, user_id, week_perf, performance_table)
+        # Gameweeks already stored in the picks table are not downloaded again, unless they were not finished
+        picks_marks = sq.high_water_marks(connection, picks_table, "entry_id", "gameweek")
+        dirty = dirty_after(connection, "picks", current_gameweek, finished_gameweek) if current_gameweek else None
+        keys = [(user_id, week) for user_id, max_week, min_week in user_weeks
+                for week in range(max(min_week, min(picks_marks.get(user_id, 0), dirty if dirty is not None else max_week) + 1),max_week+1)]
+        keys = resume_keys(keys, units, lambda unit: unit[:2])
+        jobs = {(user_id, week): gd.userGameweekPicksUrl(user_id, week) for user_id, week in keys}
+        log.info("%s user gameweeks to download", len(jobs))
+        sq.ledger_plan(connection, "picks", [(user_id, week, 0) for user_id, week in keys])
+        partition_files = catalog.register(connection, [week for user_id, week in keys]) if catalog is not None else {}
+        sq.close(connection)
         
-        with connection:
-            max_player_id = connection.execute("SELECT MAX(id) FROM {0}".format(player_lookup_table)).fetchone()
-        print("Max player id : {0}".format(str(max_player_id)))
-        for i in range(1,int(max_player_id[0]+1)):
-            stats = gd.getPlayerStats(i)
+        def store_picks(key, parsed):
+            user_id, week = key
+            deadline, picks, subs = parsed
+            writer.submit(sq.gameweek_deadlines_table, week, deadline, deadline_table)
+            rows_writer = partition_writers[catalog.partition_file(week)] if catalog is not None else writer
+            rows_writer.submit(sq.user_gameweek_picks_table, week, user_id, picks, picks_table)
+            if len(subs) > 0:
+                rows_writer.submit(sq.user_gameweek_auto_subs_table, week, user_id, subs, subs_table)
+            if rows_writer is writer:
+                writer.submit(sq.ledger_mark, "picks", [(user_id, week, 0)])
+            else:
+                # marked done in the league database only once the partition committed the rows
+                rows_writer.submit_after(writer, sq.ledger_mark, "picks", [(user_id, week, 0)])
+            #sq.gameweek_performance_table(connection, week, user_id, week_perf, performance_table)
+        
+        with pl.DBWriter(dbase) as writer, ExitStack() as stack:
+            # the partition writers are closed first, their last ledger marks go to writer
+            partition_writers = {file: stack.enter_context(pl.DBWriter(file)) for file in partition_files}
+            fe.run_batch(jobs, store_picks, parse = parse_picks)
+        if catalog is not None and current_gameweek is not None:
+            connection, cursor = sq.connect(dbase)
+            catalog.seal(connection, current_gameweek if finished_gameweek is None else finished_gameweek + 1)
+            sq.close(connection)
+        finish_stage(dbase, "picks", finished_gameweek)
+        log.info("Gameweek user data completed succesfully")
+        return list(jobs)
+    except BaseException as e:
+        log.error("Issue with loading gameweek user data: %s", e)
+        fail_stage(dbase, "picks")
+
+def player_performance_data(dbase, player_table, current_gameweek, rebuild = False, finished_gameweek = None):
+    '''
+    Loads the gameweek performance of every player. The data do not depend on the league
+    so this runs once per run against the global database.
+    Every gameweek is downloaded from its live page, one request per gameweek, when it is not
+    stored yet or was not finished when it was downloaded (see dirty_after). The live page has
+    no market data (value, selected, transfers...), the rows of the current gameweek take it
+    from bootstrap-static and keep it when the gameweek is downloaded again, the rows of earlier
+    gameweeks first loaded by a rebuild have none.
+    The element-summary pages are only downloaded for the players missing from a live page
+    (or for every player if a live page failed).
+    A resumed stage only downloads the pages it did not complete.
+    '''
+    stage = "live"
+    try:
+        connection, cursor = sq.connect(dbase)
+        cursor.execute("PRAGMA busy_timeout = 30000")
+        live_units = sq.ledger_resume(connection, "live")
+        sq.ledger_stage(connection, "live")
+        if finished_gameweek is None:
+            finished_gameweek = current_gameweek - 1
+        if rebuild and live_units is None:
+            sq.delete_table(connection,player_table)
+            sq.drop_table(connection, player_table)
+        stored_rounds = sq.stored_values(connection, player_table, "round")
+        dirty = dirty_after(connection, "live", current_gameweek, finished_gameweek)
+        gameweeks = [week for week in range(1, current_gameweek + 1) if week not in stored_rounds or week > dirty]
+        gameweeks = resume_keys(gameweeks, live_units, lambda unit: unit[1])
+        sq.ledger_plan(connection, "live", [(0, week, 0) for week in gameweeks])
+        sq.close(connection)
+        log.info("%s gameweeks of player performance to download", len(gameweeks))
+        player_teams = {player["id"]: player["team"] for player in gd.getPlayerData()}
+        market = {current_gameweek: gd.getPlayerMarket()}
+        loaded_weeks = set()
+        missing_players = set()
+        
+        def store_live(week, parsed):
+            stats, missing = parsed
             if stats:
-                sq.player_performance_table(connection, stats, player_table)
-            
+                writer.submit(sq.player_performance_table, stats, player_table)
+            missing_players.update(missing)
+            loaded_weeks.add(week)
+            writer.submit(sq.ledger_mark, "live", [(0, week, 0)])
+        
+        def store_stats(element_id, stats):
+            if stats:
+                writer.submit(sq.player_performance_table, stats, player_table)
+            writer.submit(sq.ledger_mark, "element-summary", [(0, 0, element_id)])
+        
+        with pl.DBWriter(dbase) as writer:
+            fe.run_batch({week: gd.liveGameweekUrl(week) for week in gameweeks}, store_live, parse = functools.partial(parse_live, player_teams, market))
+            if len(loaded_weeks) < len(gameweeks):
+                log.warning("Live pages of gameweeks %s failed", sorted(set(gameweeks) - loaded_weeks))
+                missing_players.update(player_teams)
+        finish_stage(dbase, "live", finished_gameweek)
+        stage = "element-summary"
+        connection, cursor = sq.connect(dbase)
+        summary_units = sq.ledger_resume(connection, "element-summary")
+        players = resume_keys(sorted(missing_players), summary_units, lambda unit: unit[2])
+        sq.ledger_plan(connection, "element-summary", [(0, 0, i) for i in players])
         sq.close(connection)
-        print ("Gameweek user data completed succesfully")
+        log.info("%s players to complete from their element summary", len(players))
+        with pl.DBWriter(dbase) as writer:
+            fe.run_batch({i: gd.playerStatsUrl(i) for i in players}, store_stats, parse = parse_stats)
+        finish_stage(dbase, "element-summary")
+        log.info("Player performance data completed succesfully")
     except BaseException as e:
-        print ("Issue with loading gameweek user data for user:{0}".format(user_id))            
-        print (e.args)
+        log.error("Issue with loading player performance data: %s", e)
+        fail_stage(dbase, stage)
 
-def views_creation(dbase, views_script):
+def shared_data(dbase, shared_dbase, shared_tables):
+    '''
+    Copies the league independent tables of the global database into the league's database
+    so that the views of DB_Views.sql keep working on the league file alone
+    
+    Output: the set of the gameweeks whose player performance rows changed,
+            None when all of them may have changed (the table was copied whole)
+    '''
     try:
         connection, cursor = sq.connect(dbase)
+        cursor.execute("PRAGMA busy_timeout = 30000")
+        sq.ledger_stage(connection, "shared")
+        changed = sq.copy_shared_tables(connection, shared_dbase, shared_tables, {player_performance_table_name: "round"})
+        sq.close(connection)
+        if changed is None:
+            raise RuntimeError("the tables of {0} could not be copied".format(shared_dbase))
+        finish_stage(dbase, "shared")
+        log.info("Shared tables copied from %s", shared_dbase)
+        return changed.get(player_performance_table_name)
+    except BaseException as e:
+        log.error("Issue with copying the shared tables: %s", e)
+        fail_stage(dbase, "shared")
+
+def views_creation(dbase, views_script, summaries_script = None, refresh_keys = None, explain = False):
+    '''
+    Creates the views and refreshes the materialized summary tables for refresh_keys
+    (the (entry_id, gameweek) pairs touched by this run, None refreshes everything)
+    '''
+    try:
+        connection, cursor = sq.connect(dbase)
+        sq.ledger_stage(connection, "views")
+        # indexes of tables created before the index definitions existed
+        sq.create_indexes(connection)
         sq.create_views(connection, views_script)
+        # the partitioned tables and the views reading them, after the views they shadow,
+        # from the partitions of the gameweeks refreshed (all of them when none holds these)
+        gameweeks = [gameweek for entry_id, gameweek in refresh_keys or []]
+        if not gp.attach(connection, min(gameweeks, default = None), max(gameweeks, default = None)):
+            gp.attach(connection)
+        if summaries_script:
+            sq.refresh_summaries(connection, summaries_script, refresh_keys)
+        if explain:
+            sq.explain_views(connection)
         sq.close(connection)
-        print("Views created")
+        finish_stage(dbase, "views")
+        log.info("Views created")
     except:
-        print ("Issue with creating the views")          
+        log.error("Issue with creating the views")
+        fail_stage(dbase, "views")
+
+def export_data(dbase, export_dir, refresh_keys = None):
+    '''
+    Exports the league's tables to columnar files in export_dir (see columnar_export.py),
+    rewriting only the gameweeks in refresh_keys (all of them if None) and the changed ones
+    '''
+    try:
+        connection, cursor = gp.connect(dbase)
+        sq.ledger_stage(connection, "export")
+        touched_gameweeks = None if refresh_keys is None else {gameweek for entry_id, gameweek in refresh_keys}
+        ce.export_tables(connection, export_dir, touched_gameweeks)
+        sq.close(connection)
+        finish_stage(dbase, "export")
+    except BaseException as e:
+        log.error("Issue with exporting the tables: %s", e)
+        fail_stage(dbase, "export")
+
+def timed_stage(stage_times, function, *args, **kwargs):
+    '''
+    Calls the stage function(*args, **kwargs) and adds the seconds it took to
+    stage_times[function name] and to the fpl_stage_seconds_total metric
+    '''
+    started = time.perf_counter()
+    try:
+        return function(*args, **kwargs)
+    finally:
+        seconds = time.perf_counter() - started
+        stage_times[function.__name__] = stage_times.get(function.__name__, 0) + seconds
+        mt.registry.inc("fpl_stage_seconds_total", seconds, stage = function.__name__)
+        log.info("Stage %s took %.2f s", function.__name__, seconds)
+
+def global_data(rebuild = rebuild_value, stage_times = None):
+    '''
+    Creates and populates the league independent tables of the global database
+    
+    Output: current_gameweek = the current gameweek
+            finished_gameweek = the last finished gameweek
+    '''
+    stage_times = {} if stage_times is None else stage_times
+    # a run that did not finish is resumed, see the runLedger table
+    timed_stage(stage_times, start_run, global_database)
+    current_gameweek = timed_stage(stage_times, build_lookup_tables, global_database, lookup_table_list, rebuild)
+    # read from the bootstrap-static page build_lookup_tables loaded
+    finished_gameweek = gd.getFinishedGameweek() if current_gameweek is not None else None
+    timed_stage(stage_times, player_performance_data, global_database, player_performance_table_name, current_gameweek, rebuild, finished_gameweek)
+    timed_stage(stage_times, finish_run, global_database)
+    return current_gameweek, finished_gameweek
+
+def league_data(fpl_league_id, current_gameweek, rebuild = rebuild_value, views_script = views_file, summaries_script = summaries_file, stage_times = None, finished_gameweek = None):
+    '''
+    Builds the database of a league (after global_data)
+    
+    Output: True when the league's run finished (nothing left to resume)
+    '''
+    stage_times = {} if stage_times is None else stage_times
+    database = "fpl_{0}.db".format(fpl_league_id)
+    timed_stage(stage_times, start_run, database)
+    # Create and populate the users table in DB
+    timed_stage(stage_times, users_data, database, user_table_name, fpl_league_id, leagueStandingUrl, START_PAGE, rebuild)
+    
+    # Copy lookup tables and player performance from the global DB
+    changed_rounds = timed_stage(stage_times, shared_data, database, global_database, lookup_table_list + [player_performance_table_name])
+
+    # Create and populate the table in DB with information about users tokens and team history
+    updated_users = timed_stage(stage_times, user_history_data, database, user_table_name, token_table_name, history_table_name, rebuild, current_gameweek, finished_gameweek)
+    
+    # Create and populate the table in DB with information about users trasfer history
+    timed_stage(stage_times, transfer_history_data, database, user_table_name, transfer_table_name, rebuild, updated_users)
+            
+    # Create and populate the table in DB witn information about users gameweek performance and deadlines
+    updated_picks = timed_stage(stage_times, gameweek_data, database, history_table_name, performance_table_list, rebuild, current_gameweek, finished_gameweek)
+    
+    # Create the database views and refresh the summary tables for the gameweeks touched:
+    # the picks downloaded, every gameweek whose player performance rows changed and the
+    # current gameweek (its history changes until it is finished)
+    refresh_keys = None
+    if not rebuild and updated_picks is not None and changed_rounds is not None:
+        refresh_keys = updated_picks + [(None, week) for week in sorted(changed_rounds | {current_gameweek})]
+    timed_stage(stage_times, views_creation, database, views_script, summaries_script, refresh_keys, explain = params.EXPLAIN_VIEWS)
+    if params.EXPORT_DIR:
+        timed_stage(stage_times, export_data, database, os.path.join(params.EXPORT_DIR, "fpl_{0}".format(fpl_league_id)), refresh_keys)
+    return timed_stage(stage_times, finish_run, database)
+
+def _league_worker_init(rate, burst, bucket_state, log_level, log_file):
+    '''
+    Prepares a league worker process (called by params.configure() once the settings are
+    applied): it logs like the parent and its requests take their tokens from the parent's bucket
+    '''
+    logging.basicConfig(level = log_level, format = LOG_FORMAT, filename = log_file)
+    sc.use_shared_bucket(sc.SharedTokenBucket(rate, burst, state = bucket_state))
+
+def _league_job(fpl_league_id, current_gameweek, rebuild, views_script, summaries_script, finished_gameweek):
+    '''
+    Runs league_data in a league worker process and returns its outcome and metrics
+    '''
+    stage_times = {}
+    started = time.perf_counter()
+    try:
+        finished = league_data(fpl_league_id, current_gameweek, rebuild, views_script, summaries_script, stage_times, finished_gameweek)
+    finally:
+        # the exit handlers do not run in the worker, its parse processes would keep it alive
+        fe.shutdown_parse_pool()
+    return {"league_id": fpl_league_id, "status": "finished" if finished else "unfinished",
+            "seconds": time.perf_counter() - started, "stage_times": stage_times, "metrics": mt.registry.report()}
+
+def missing_archive_pages(archive, league_ids):
+    '''
+    Checks that a RETRANSFORM run can rebuild the tables from the archive before any table is
+    dropped: the bootstrap-static page, the live pages of the gameweeks (the player pages are only
+    needed for the players missing from them) and, for every league, its first standings page and the pages of the users and gameweeks
+    stored in its database.
+
+    Output: the list of the needed urls that are not in the archive
+    '''
+    if archive.missing([gd.PLAYERS_INFO_URL]):
+        return [gd.PLAYERS_INFO_URL]
+    current_gameweek = gd.getGameData()[0]
+    urls = [gd.liveGameweekUrl(week) for week in range(1, current_gameweek + 1)]
+    for fpl_league_id in league_ids:
+        urls.append(gd.userEntryIdsUrl(fpl_league_id, START_PAGE, leagueStandingUrl))
+        database = "fpl_{0}.db".format(fpl_league_id)
+        if not os.path.exists(database):
+            continue
+        connection, cursor = sq.connect(database)
+        for user_id in sq.stored_values(connection, user_table_name, "entry"):
+            urls += [gd.userTeamHistoryUrl(user_id), gd.userTransferHistoryUrl(user_id)]
+        try:
+            with connection:
+                user_weeks = connection.execute("SELECT entry_id, MIN(gameweek), MAX(gameweek) FROM {0} GROUP BY entry_id".format(history_table_name)).fetchall()
+        except sqlite3.OperationalError:
+            user_weeks = []
+        sq.close(connection)
+        urls += [gd.userGameweekPicksUrl(user_id, week) for user_id, min_week, max_week in user_weeks for week in range(min_week, max_week + 1)]
+    return archive.missing(urls)
+
+def run(user_league = USER_LEAGUE, rebuild = rebuild_value, stage_times = None, workers = LEAGUE_WORKERS, settings = None):
+    '''
+    Builds the global database and the database of every league in user_league.
+    With workers > 1 the leagues are processed in a pool of processes sharing one rate limit
+    (the workers read params.py again, changes made to it at runtime are seen by them only
+    when passed as settings).
+    
+    Input: user_league = a dictionary {name : list of league ids}
+           rebuild = True drops and downloads every table again
+           stage_times = a dictionary filled with the seconds spent in every stage function (used by benchmark.py)
+           workers = the number of leagues processed in parallel
+           settings = a dictionary {params name : value} the workers apply with params.configure()
+                      before loading the pipeline (the overrides this process was configured with)
+    
+    Output: leagues = a list with the outcome and timing of every league
+    '''
+    stage_times = {} if stage_times is None else stage_times
+    league_ids = [fpl_league_id for key in user_league for fpl_league_id in user_league[key]]
+    if gp.PARTITION_GAMEWEEKS > 0:
+        # refused before anything is written, the partitions of a season must fit in a connection
+        gp.validate_block(gp.PARTITION_GAMEWEEKS)
+    client = hc.default_client()
+    if rebuild and client.replay:
+        missing = missing_archive_pages(client.archive, league_ids)
+        if missing:
+            log.error("%s pages needed by the RETRANSFORM run are not in the archive (e.g. %s), no table was dropped", len(missing), missing[0])
+            raise hc.FPLOfflineError(missing[0], "{0} pages not available in the archive".format(len(missing)))
+    leagues = []
+    try:
+        current_gameweek, finished_gameweek = global_data(rebuild, stage_times)
+        if workers <= 1 or len(league_ids) <= 1:
+            for fpl_league_id in league_ids:
+                started = time.perf_counter()
+                finished = league_data(fpl_league_id, current_gameweek, rebuild, views_file, summaries_file, stage_times, finished_gameweek)
+                leagues.append({"league_id": fpl_league_id, "status": "finished" if finished else "unfinished",
+                                "seconds": time.perf_counter() - started})
+            return leagues
+    finally:
+        # the exit handlers do not run when this process is itself a worker (e.g. benchmark.py)
+        fe.shutdown_parse_pool()
+    
+    # spawned workers start without the parent's connections and threads
+    context = multiprocessing.get_context("spawn")
+    bucket = sc.SharedTokenBucket(context = context)
+    sc.use_shared_bucket(bucket)
+    log_file = next((handler.baseFilename for handler in logging.getLogger().handlers if isinstance(handler, logging.FileHandler)), None)
+    # the worker's modules are imported by the initializer, after the settings are applied
+    setup_args = (bucket.max_rate, bucket.burst, bucket.state, logging.getLogger().level, log_file)
+    with ProcessPoolExecutor(max_workers = min(workers, len(league_ids)), mp_context = context, initializer = params.configure,
+                             initargs = (settings or {}, __name__ + "._league_worker_init", setup_args)) as executor:
+        futures = {fpl_league_id: executor.submit(_league_job, fpl_league_id, current_gameweek, rebuild, views_file, summaries_file, finished_gameweek)
+                   for fpl_league_id in league_ids}
+        for fpl_league_id, future in futures.items():
+            try:
+                league = future.result()
+            except BaseException as e:
+                log.error("Issue with processing league %s: %s", fpl_league_id, e)
+                leagues.append({"league_id": fpl_league_id, "status": "failed", "error": str(e)})
+                continue
+            mt.registry.merge(league.pop("metrics"))
+            for stage, seconds in league["stage_times"].items():
+                stage_times[stage] = stage_times.get(stage, 0) + seconds
+            leagues.append(league)
+            log.info("League %s %s in %.1f s", fpl_league_id, league["status"], league["seconds"])
+    return leagues
 
 if __name__ == "__main__":
     # the main process will be here
@@ -211,23 +753,11 @@ if __name__ == "__main__":
     Get data and store them in DB tables
     '''
     
-    for key in USER_LEAGUE:
-        for fpl_league_id in USER_LEAGUE[key]:
-            database = "fpl_{0}.db".format(fpl_league_id)
-            # Create and populate the users table in DB
-            users_data(database, user_table_name, fpl_league_id, leagueStandingUrl, rebuild_value)
-            
-            # Create and populate lookup tables
-            current_gameweek = build_lookup_tables(database, lookup_table_list, rebuild_value)
-
-            # Create and populate the table in DB with information about users tokens and team history
-            user_history_data(database, user_table_name, token_table_name, history_table_name, rebuild_value)
-            
-            # Create and populate the table in DB with information about users trasfer history
-            transfer_history_data(database, user_table_name, transfer_table_name, rebuild_value)
-                    
-            # Create and populate the table in DB witn information about users gameweek performance and deadlines
-            gameweek_data(database, history_table_name, performance_table_list, lookup_table_list[3], rebuild_value )
-            
-            # Create the database views
-            views_creation(database, views_file)
+    logging.basicConfig(level = params.LOG_LEVEL, format = LOG_FORMAT)
+    leagues = run(USER_LEAGUE, rebuild_value)
+    # json run report (with the outcome of every league and the rows inserted, updated and left
+    # unchanged in every table) and Prometheus metrics of the run
+    rows = mt.registry.pivot("db_upsert_rows_total", "table", "result")
+    for table_name, counts in sorted(rows.items()):
+        log.info("Table %s: %s rows inserted, %s updated, %s unchanged", table_name, counts.get("inserted", 0), counts.get("updated", 0), counts.get("unchanged", 0))
+    mt.registry.write(params.METRICS_REPORT_FILE, params.METRICS_PROMETHEUS_FILE, {"leagues": leagues, "rows": rows})
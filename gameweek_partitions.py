@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+"""
+Fantasy Premier League 2017-2018 scraper
+
+@author: Theodoros Panagiotakos
+"""
+
+# Optional partitioning of the per-gameweek league tables (PARTITIONED_TABLES in params.py).
+# With PARTITION_GAMEWEEKS > 0 their rows are stored in one database file per block of
+# gameweeks next to the league database (fpl_80757_gw01-05.db, fpl_80757_gw06-10.db, ...)
+# instead of fpl_80757.db, so each file keeps small indexes, has its own write lock (the
+# blocks are written by parallel writers) and a block whose gameweeks are over is sealed:
+# checkpointed, vacuumed and never written again, cheap to back up.
+#
+# The partitionCatalog table of the league database lists the files. attach() attaches them
+# to a connection of the league database and creates TEMP views with the names of the tables,
+# the UNION ALL of the partitions, and TEMP copies of the views of DB_Views.sql reading them
+# (the views stored in a database can not read attached databases). Everything reading the
+# tables by name (summaries, export, analytics, query service) works unchanged on it.
+# The league database alone no longer holds the rows: it keeps a guard view with the name of
+# each partitioned table, whose error tells a direct sqlite3 or pandas reader to attach().
+
+import glob
+import logging
+import os
+import re
+import sqlite3
+import manage_sqllite as sq
+import params
+
+log = logging.getLogger(__name__)
+
+
+PARTITION_GAMEWEEKS = params.PARTITION_GAMEWEEKS
+PARTITIONED_TABLES = params.PARTITIONED_TABLES
+# Table of the league database listing its partition files
+CATALOG_TABLE = "partitionCatalog"
+# Column holding the gameweek of a row in every partitioned table
+GAMEWEEK_COLUMN = "gameweek"
+# Gameweeks of a season and databases a connection attaches at most (SQLITE_MAX_ATTACHED),
+# the partitions of a whole season must fit in it
+SEASON_GAMEWEEKS = 38
+MAX_ATTACHED = 10
+
+_create_view = re.compile(r"^\s*CREATE\s+VIEW", re.IGNORECASE)
+_create_table = re.compile(r"^\s*CREATE\s+TABLE\s+(IF\s+NOT\s+EXISTS\s+)?", re.IGNORECASE)
+
+
+def catalog_table(connection):
+    sq.get_writer(connection).ensure_schema(CATALOG_TABLE, ["CREATE TABLE IF NOT EXISTS {0} (file TEXT PRIMARY KEY, first_gameweek INTEGER, last_gameweek INTEGER, "
+                                                            "sealed INTEGER DEFAULT 0, updated TEXT)".format(CATALOG_TABLE)])
+
+def partitions(connection, first_gameweek = None, last_gameweek = None):
+    '''
+    Returns the partitions of the league database holding gameweeks in the range
+
+    Output: a list of (file, first_gameweek, last_gameweek, sealed), file relative to the
+            folder of the league database. Empty when the database is not partitioned.
+    '''
+    try:
+        return connection.execute("SELECT file, first_gameweek, last_gameweek, sealed FROM main.{0} WHERE last_gameweek >= ? AND first_gameweek <= ? "
+                                  "ORDER BY first_gameweek".format(CATALOG_TABLE),
+                                  (first_gameweek or 0, last_gameweek if last_gameweek is not None else 1 << 31)).fetchall()
+    except sqlite3.OperationalError:
+        return []
+
+def validate_block(block):
+    '''
+    Raises a ValueError when blocks of block gameweeks split a season in more partitions
+    than a connection can attach
+    '''
+    files = -(-SEASON_GAMEWEEKS // block)
+    if files > MAX_ATTACHED:
+        raise ValueError("PARTITION_GAMEWEEKS = {0} splits a season in {1} partitions but a connection attaches at most {2}, "
+                         "use blocks of at least {3} gameweeks".format(block, files, MAX_ATTACHED, -(-SEASON_GAMEWEEKS // MAX_ATTACHED)))
+
+def _guard_views(connection, table_names):
+    '''
+    Creates in the league database a view named like each partitioned table it no longer holds,
+    failing with a message pointing to attach() (which shadows it with the TEMP union view)
+    '''
+    for table_name in table_names:
+        if connection.execute("SELECT 1 FROM main.sqlite_master WHERE name = ?", (table_name,)).fetchone() is None:
+            connection.execute('CREATE VIEW main.{0} AS SELECT * FROM "{0} is partitioned, read it through gameweek_partitions.attach()"'.format(table_name))
+
+def _alias(file):
+    ''' Schema name of an attached partition (fpl_80757_gw01-05.db -> gw01_05) '''
+    return re.sub(r"\W", "_", re.search(r"(gw[\d-]+)\.db$", file).group(1))
+
+def _main_file(connection):
+    return next(row[2] for row in connection.execute("PRAGMA database_list") if row[1] == "main")
+
+def attach(connection, first_gameweek = None, last_gameweek = None, read_only = False, views = True):
+    '''
+    Attaches the partitions holding gameweeks in the range to a connection of the league
+    database (the ones already attached are kept) and creates the TEMP views reading them.
+    A partitioned table still present in the league database (rows written before the
+    partitioning) is part of its view. Create the views of DB_Views.sql before attach(),
+    dropping a view by name drops its TEMP copy.
+
+    Input: connection = a connection with the league database
+           first_gameweek, last_gameweek = the gameweeks needed, None for all
+           read_only = attach the files read only (connection opened with uri = True)
+           views = create the TEMP views
+
+    Output: the list of the attached schema names
+    '''
+    rows = partitions(connection, first_gameweek, last_gameweek)
+    if not rows:
+        return []
+    folder = os.path.dirname(_main_file(connection))
+    attached = {row[1] for row in connection.execute("PRAGMA database_list")}
+    limit = connection.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+    missing = [row for row in rows if _alias(row[0]) not in attached]
+    if len(attached - {"main", "temp"}) + len(missing) > limit:
+        raise sqlite3.OperationalError("{0} partitions needed but a connection attaches at most {1}, "
+                                       "narrow the gameweek range or raise PARTITION_GAMEWEEKS".format(len(rows), limit))
+    for file, first, last, sealed in missing:
+        path = os.path.join(folder, file)
+        connection.execute("ATTACH DATABASE ? AS {0}".format(_alias(file)), ("file:{0}?mode=ro".format(path) if read_only else path,))
+    schemas = [_alias(row[0]) for row in rows]
+    if views:
+        _create_views(connection, schemas)
+    return schemas
+
+def _create_views(connection, schemas):
+    ''' Creates the TEMP union views of the partitioned tables and of the views reading them '''
+    shadowed = set()
+    for table_name in PARTITIONED_TABLES:
+        sources = [schema for schema in ["main"] + schemas
+                   if connection.execute("SELECT 1 FROM {0}.sqlite_master WHERE type = 'table' AND name = ?".format(schema), (table_name,)).fetchone()]
+        if not sources:
+            continue
+        connection.execute("DROP VIEW IF EXISTS temp.{0}".format(table_name))
+        connection.execute("CREATE TEMP VIEW {0} AS {1}".format(table_name, " UNION ALL ".join("SELECT * FROM {0}.{1}".format(schema, table_name) for schema in sources)))
+        shadowed.add(table_name)
+    # views of the league database reading a partitioned table (or such a view), in creation order
+    for name, sql in connection.execute("SELECT name, sql FROM main.sqlite_master WHERE type = 'view' ORDER BY rowid").fetchall():
+        if name in PARTITIONED_TABLES:
+            # the guard views, replaced by the union views
+            continue
+        if any(re.search(r"\b{0}\b".format(shadow), sql) for shadow in shadowed):
+            connection.execute('DROP VIEW IF EXISTS temp."{0}"'.format(name))
+            connection.execute(_create_view.sub("CREATE TEMP VIEW", sql, count = 1))
+            shadowed.add(name)
+
+def connect(dbase, first_gameweek = None, last_gameweek = None):
+    '''
+    Connects to a league database (see sq.connect()) with its partitions attached
+    '''
+    connection, cursor = sq.connect(dbase)
+    attach(connection, first_gameweek, last_gameweek)
+    return connection, cursor
+
+def data_version(connection):
+    '''
+    Returns the PRAGMA data_version of the league database and of every attached partition,
+    it changes whenever another connection commits to one of them
+    '''
+    schemas = [row[1] for row in connection.execute("PRAGMA database_list") if row[1] != "temp"]
+    return tuple(connection.execute("PRAGMA {0}.data_version".format(schema)).fetchone()[0] for schema in schemas)
+
+
+class PartitionCatalog:
+    '''
+    The partition files of the per-gameweek tables of a league database, one per block of
+    block gameweeks
+    '''
+    def __init__(self, dbase, block = PARTITION_GAMEWEEKS, tables = PARTITIONED_TABLES):
+        validate_block(block)
+        self.dbase = dbase
+        self.block = block
+        self.tables = list(tables)
+
+    def bounds(self, gameweek):
+        ''' The first and last gameweek of the block of gameweek '''
+        first = (gameweek - 1) // self.block * self.block + 1
+        return first, first + self.block - 1
+
+    def partition_file(self, gameweek):
+        ''' The file of the block of gameweek, next to the league database '''
+        root, ext = os.path.splitext(self.dbase)
+        return "{0}_gw{1:02d}-{2:02d}{3}".format(root, *self.bounds(gameweek), ext)
+
+    def register(self, connection, gameweeks):
+        '''
+        Records the partitions of gameweeks in the catalog. A sealed partition written again
+        is unsealed until the next seal().
+
+        Input: connection = the connection with the league database
+               gameweeks = the gameweeks about to be written
+
+        Output: a dictionary {partition file : list of its gameweeks}
+        '''
+        files = {}
+        for gameweek in sorted(set(gameweeks)):
+            files.setdefault(self.partition_file(gameweek), []).append(gameweek)
+        try:
+            catalog_table(connection)
+            sq.flush(connection)
+            with connection:
+                for file, weeks in files.items():
+                    first, last = self.bounds(weeks[0])
+                    name = os.path.basename(file)
+                    if connection.execute("SELECT sealed FROM {0} WHERE file = ?".format(CATALOG_TABLE), (name,)).fetchone() == (1,):
+                        log.info("Partition %s was sealed, it is written again", name)
+                    connection.execute("INSERT INTO {0} (file, first_gameweek, last_gameweek, sealed, updated) VALUES (?, ?, ?, 0, datetime('now')) "
+                                       "ON CONFLICT (file) DO UPDATE SET sealed = 0, updated = excluded.updated".format(CATALOG_TABLE), (name, first, last))
+                if files:
+                    _guard_views(connection, self.tables)
+        except sqlite3.Error as e:
+            log.error("Error info: %s", e.args[0])
+        return files
+
+    def migrate(self, connection):
+        '''
+        Moves the rows of the partitioned tables stored in the league database (written before
+        the partitioning was enabled) to their partitions and drops the tables
+
+        Input: connection = the connection with the league database (without partitions attached)
+        '''
+        try:
+            sq.flush(connection)
+            for table_name in self.tables:
+                schema = connection.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table_name,)).fetchone()
+                if schema is None:
+                    continue
+                gameweeks = [row[0] for row in connection.execute("SELECT DISTINCT {1} FROM {0}".format(table_name, GAMEWEEK_COLUMN))]
+                files = self.register(connection, gameweeks)
+                for file, weeks in files.items():
+                    first, last = self.bounds(weeks[0])
+                    partition, cursor = sq.connect(file)
+                    sq.get_writer(partition).ensure_schema(table_name, [_create_table.sub("CREATE TABLE IF NOT EXISTS ", schema[0], count = 1)])
+                    partition.execute("ATTACH DATABASE ? AS league", (self.dbase,))
+                    with partition:
+                        partition.execute("INSERT OR IGNORE INTO main.{0} SELECT * FROM league.{0} WHERE {1} BETWEEN ? AND ?".format(table_name, GAMEWEEK_COLUMN), (first, last))
+                    partition.execute("DETACH DATABASE league")
+                    sq.close(partition)
+                sq.drop_table(connection, table_name)
+                with connection:
+                    _guard_views(connection, [table_name])
+                log.info("Table %s moved to %s partitions", table_name, len(files))
+        except sqlite3.Error as e:
+            log.error("Error info: %s", e.args[0])
+
+    def drop(self, connection):
+        '''
+        Deletes the partition files, the guard views and empties the catalog (rebuild)
+        '''
+        try:
+            catalog_table(connection)
+            sq.flush(connection)
+            folder = os.path.dirname(os.path.abspath(self.dbase))
+            for file, first, last, sealed in partitions(connection):
+                for path in glob.glob(os.path.join(folder, file) + "*"):
+                    os.remove(path)
+            with connection:
+                connection.execute("DELETE FROM {0}".format(CATALOG_TABLE))
+                for table_name in self.tables:
+                    connection.execute("DROP VIEW IF EXISTS main.{0}".format(table_name))
+            log.debug("Partitions of %s dropped", self.dbase)
+        except (sqlite3.Error, OSError) as e:
+            log.error("Error info: %s", e.args[0])
+
+    def seal(self, connection, current_gameweek):
+        '''
+        Seals the partitions whose gameweeks are all before current_gameweek: the file is
+        checkpointed into a single compact file (no -wal), the catalog marks it sealed
+
+        Output: the list of the sealed files
+        '''
+        sealed = []
+        try:
+            folder = os.path.dirname(os.path.abspath(self.dbase))
+            for file, first, last, is_sealed in partitions(connection):
+                if is_sealed or last >= current_gameweek:
+                    continue
+                partition = sqlite3.connect(os.path.join(folder, file), isolation_level = None)
+                partition.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                partition.execute("VACUUM")
+                partition.execute("PRAGMA journal_mode = DELETE")
+                partition.close()
+                sealed.append(file)
+            if sealed:
+                with connection:
+                    connection.executemany("UPDATE {0} SET sealed = 1, updated = datetime('now') WHERE file = ?".format(CATALOG_TABLE), [(file,) for file in sealed])
+                log.info("Partitions sealed: %s", ", ".join(sealed))
+        except sqlite3.Error as e:
+            log.error("Error info: %s", e.args[0])
+        return sealed
+
+
+def catalog(dbase):
+    '''
+    Returns the PartitionCatalog of a league database, None when the partitioning is disabled
+    '''
+    return PartitionCatalog(dbase) if PARTITION_GAMEWEEKS > 0 else None
@@ -6,9 +6,16 @@ Fantasy Premier League 2017-2018 scraper
 """
 
 #import fpl_info
-import requests
+import logging
 import json
+import re
+import threading
 import params
+import http_client as hc
+import fetch_engine as fe
+import records as rec
+
+log = logging.getLogger(__name__)
 
 
 FPL_URL = params.FPL_URL 
@@ -22,69 +29,134 @@ PLAYERS_INFO_FILENAME = params.PLAYERS_INFO_FILENAME
 USER_SUMMARY_URL = FPL_URL + USER_SUMMARY_SUBURL
 PLAYERS_INFO_URL = FPL_URL + PLAYERS_INFO_SUBURL
 
+# Every get* function downloads through the shared http client (http_client.py) and raises
+# one of its FPLRequestError subclasses instead of returning None when a page can not be loaded
+
+# Sections of bootstrap-static kept by loadBootstrap(), the rest of the page is skipped while parsing
+BOOTSTRAP_SECTIONS = ["current-event", "events", "element_types", "teams", "stats_options", "elements", "total-players"]
+# Fields kept for every player of the bootstrap-static "elements" list, the last ones are the
+# market data of the current gameweek (see getPlayerMarket())
+ELEMENT_FIELDS = ["id","element_type","web_name","team","now_cost","selected_by_percent","transfers_in_event","transfers_out_event"]
+
 # Dictionary with the position values. Used in getUserGameweekData()
 ELEMENT_TYPE = params.ELEMENT_TYPE #{1:"Goalkeeper", 2:"Defender", 3:"Midfielder", 4:"Attaker"}
 
 
 # Download all player data: https://fantasy.premierleague.com/drf/bootstrap-static
-def getPlayersInfo():
+def getPlayersInfo(client = None):
     ''' Creates a json file in local machine with all the data in the bootstrap_static page.'''
-    r = requests.get(PLAYERS_INFO_URL)
-    jsonResponse = r.json()
+    client = client or hc.default_client()
+    jsonResponse = client.get_json(PLAYERS_INFO_URL)
     with open(PLAYERS_INFO_FILENAME, 'w') as outfile:
         json.dump(jsonResponse, outfile)
         
 
+def userEntryIdsUrl(league_id, ls_page, league_Standing_Url):
+    ''' Returns the url of the standings page ls_page of league_id '''
+    return league_Standing_Url + str(league_id) + "?phase=1&le-page=1&ls-page=" + str(ls_page)
+
+def parseUserEntryIds(jsonResponse):
+    '''
+    Input:  jsonResponse = the parsed json of a standings page
+    
+    Output: entries as described in getUserEntryIds(), None when the page has no standings
+    '''
+    standings = jsonResponse["standings"]["results"]
+    # future thought to add the gameweek this league started scoring
+    if not standings:
+        log.debug("no more standings found!")
+        return None
+
+    entries = {}
+
+    for player in standings:
+        entries[player["entry"]] = [player["entry_name"],player["total"]]
+
+    return entries
+
 # Get users in league: https://fantasy.premierleague.com/drf/leagues-classic-standings/336217?phase=1&le-page=1&ls-page=5
 # In our case we try https://fantasy.premierleague.com/drf/leagues-classic-standings/42407
-def getUserEntryIds(league_id, ls_page, league_Standing_Url):
+def getUserEntryIds(league_id, ls_page, league_Standing_Url, client = None):
     ''' 
     Returns a dictionary with key= player_entry_code and value=[player_name,total_score]
     
     Input: league_id = league id
            ls_page = standings page number
            league_Standing_Url = combined url showing classical or h2h league
+           client = the shared FPLClient, defaults to http_client.default_client()
+    
+    Raises FPLRequestError (see http_client.py) when the page could not be downloaded
     '''
-    league_url = league_Standing_Url + str(league_id) + "?phase=1&le-page=1&ls-page=" + str(ls_page)
+    client = client or hc.default_client()
+    league_url = userEntryIdsUrl(league_id, ls_page, league_Standing_Url)
     try:
-        r = requests.get(league_url)
-        jsonResponse = r.json()
-        standings = jsonResponse["standings"]["results"]
-        # future thought to add the gameweek this league started scoring
-        if not standings:
-            print("no more standings found!")
-            return None
-    
-        entries = {}
-    
-        for player in standings:
-            entries[player["entry"]] = [player["entry_name"],player["total"]]
+        jsonResponse = client.get_json(league_url)
+        return parseUserEntryIds(jsonResponse)
+    except (KeyError, IndexError, TypeError) as e:
+        raise hc.FPLResponseError(league_url, "unexpected response format: " + str(e)) from e
+
+def iterLeagueEntries(league_id, league_Standing_Url, start_page = 1, window = fe.MAX_WORKERS, client = None, pages_loaded = None):
+    '''
+    Walks all the standings pages of a league and yields its entries one by one.
+    Pages are downloaded window at a time concurrently, so memory use does not grow with the league size.
     
-        return entries
-    except BaseException as e:
-        print("There was a problem with loading league_id:{0} for page:{1}".format(league_id, ls_page))
-        print(str(e))
-        return None
+    Input:  league_id = league id
+            league_Standing_Url = combined url showing classical or h2h league
+            start_page = the first standings page to read
+            window = the number of pages downloaded at the same time
+            client = the shared FPLClient, defaults to http_client.default_client()
+            pages_loaded = a dictionary filled with {page : True when it was loaded, False when it failed}
+            
+    Output: yields tuples (entry_id, [player_name, total_score]) in standings order.
+            Stops at the first page without standings (or with has_next false)
+    '''
+    pages_loaded = {} if pages_loaded is None else pages_loaded
+    page = start_page
+    while True:
+        jobs = {ls_page: userEntryIdsUrl(league_id, ls_page, league_Standing_Url) for ls_page in range(page, page + window)}
+        pages = fe.fetch_batch(jobs, window, client)
+        if all(jsonResponse is None for jsonResponse in pages.values()):
+            log.warning("Standings of league_id:%s could not be loaded after page:%s", league_id, page - 1)
+            pages_loaded[page] = False
+            return
+        for ls_page in sorted(pages):
+            jsonResponse = pages[ls_page]
+            pages_loaded[ls_page] = jsonResponse is not None
+            if jsonResponse is None:
+                log.warning("Skipping standings page:%s of league_id:%s", ls_page, league_id)
+                continue
+            try:
+                entries = parseUserEntryIds(jsonResponse)
+                has_next = jsonResponse["standings"].get("has_next", True)
+            except (KeyError, IndexError, TypeError) as e:
+                raise hc.FPLResponseError(jobs[ls_page], "unexpected response format: " + str(e)) from e
+            if not entries:
+                return
+            yield from entries.items()
+            if not has_next:
+                return
+        page += window
 
 # team picked by user. example: https://fantasy.premierleague.com/drf/entry/2677936/event/1/picks
 # with 2677936 being entry_id of the player
-def getUserGameweekData(entry_id, GWNumber):
+def getUserGameweekData(entry_id, GWNumber, client = None):
     '''
     Returns a dictionary "players{}" with keys = the players' element id and 
     value = several info regarding player's performance at that gameweek
     
     Input:  entry_id = team's entry id
             GWNumber = the gameweek to review
+            client = the shared FPLClient, defaults to http_client.default_client()
             
     Output: players{} = dictionary{element_id : info about player's performance that week}
             deadline = the transfer deadline for that gameweek
 
     '''
+    client = client or hc.default_client()
     eventSubUrl = "event/" + str(GWNumber)
     playerTeamUrlForSpecificGW = FPL_URL + TEAM_ENTRY_SUBURL + str(entry_id) + "/" + eventSubUrl
     try:
-        r = requests.get(playerTeamUrlForSpecificGW)
-        jsonResponse = r.json()
+        jsonResponse = client.get_json(playerTeamUrlForSpecificGW)
         
         # Get the gameweek deadline
         deadline = jsonResponse["fixtures"][0]["deadline_time_formatted"]
@@ -108,172 +180,353 @@ def getUserGameweekData(entry_id, GWNumber):
             players[pick["element"]] = selectionData
     
         return deadline, players
-    except BaseException as e:
-        print("There was a problem with the JSON file for team:{0} and gameweek:{1} / link: {3}".format(
-                entry_id,
-                GWNumber,
-                playerTeamUrlForSpecificGW))
-        print(str(e))
-        return None
+    except (KeyError, IndexError, TypeError) as e:
+        raise hc.FPLResponseError(playerTeamUrlForSpecificGW, "unexpected response format: " + str(e)) from e
     
 
-def getUserTeamHistory(entry_id):
+def userTeamHistoryUrl(entry_id):
+    ''' Returns the url of the season history of team entry_id '''
+    return FPL_URL + TEAM_ENTRY_SUBURL + str(entry_id) + "/history"
+
+def parseUserTeamHistory(jsonResponse):
+    '''
+    Input:  jsonResponse = the parsed json of the team history page
+
+    Output: tokens, history as described in getUserTeamHistory()
+    '''
+    # Get when the chips where played
+    tokens = {}
+    chips = jsonResponse["chips"]
+    for chip in chips:
+        tokens[chip["chip"]] = (chip["name"], chip["event"])
+
+    # Get the team's season history, one record per gameweek
+    history = [rec.team_history_from_json(gameweek) for gameweek in jsonResponse["history"]]
+    return tokens, history
+
+def getUserTeamHistory(entry_id, client = None):
     '''  
     Input:  entry_id = team's entry id
+            client = the shared FPLClient, defaults to http_client.default_client()
     
     Output: tokens = a dictionary with the tokens played { key=token_name ,
                                                           value=gameweek_played}
-            history = a dictionary with the team's history {key=gameweek ,
-                     value= a dictionary with various info about 
-                     (points, team_rank, transfers_made and team_money) }
+            history = a list of records.TeamHistory, one per gameweek (points, ranks,
+                      transfers made and team money)
     '''
+    client = client or hc.default_client()
     
-    histTeamUrl = FPL_URL + TEAM_ENTRY_SUBURL + str(entry_id) + "/history"
+    histTeamUrl = userTeamHistoryUrl(entry_id)
     try:
-        r = requests.get(histTeamUrl)
-        jsonResponse = r.json()
-        
-        # Get when the chips where played
-        tokens = {}
-        chips = jsonResponse["chips"]
-        for chip in chips:
-            tokens[chip["chip"]] = (chip["name"], chip["event"])
-            
-        # Get the team's season history
-        history = {}
-        hist = jsonResponse["history"]
-        for gameweek in hist:
-            gameweekHist = {}
-            gameweekHist["points"] = gameweek["points"]
-            gameweekHist["points_on_bench"] = gameweek["points_on_bench"]
-            gameweekHist["total_points"] = gameweek["total_points"]
-            gameweekHist["gameweek_rank"] = gameweek["rank"]
-            gameweekHist["overall_rank"] = gameweek["overall_rank"]
-            gameweekHist["week_transfers"] = gameweek["event_transfers"]
-            gameweekHist["week_transfers_cost"] = gameweek["event_transfers_cost"]
-            gameweekHist["team_value"] = gameweek["value"]
-            gameweekHist["money_in_bank"] = gameweek["bank"]
-            
-            # Add gameweek history to the history dictionary with key = gameweek_no            
-            history[gameweek["event"]] = gameweekHist
-        return tokens, history
+        jsonResponse = client.get_json(histTeamUrl)
+        return parseUserTeamHistory(jsonResponse)
         
-    except BaseException as e:
-        print("There was a problem with the JSON file for history of team:{0}".format(entry_id))
-        print(str(e))
-        return None        
+    except (KeyError, IndexError, TypeError) as e:
+        raise hc.FPLResponseError(histTeamUrl, "unexpected response format: " + str(e)) from e
 
 
-def getUserTransferHistory(entry_id):
+def userTransferHistoryUrl(entry_id):
+    ''' Returns the url of the transfer history of team entry_id '''
+    return FPL_URL + TEAM_ENTRY_SUBURL + str(entry_id) + "/transfers"
+
+def parseUserTransferHistory(jsonResponse):
+    '''
+    Input:  jsonResponse = the parsed json of the team transfers page
+
+    Output: transfers as described in getUserTransferHistory()
+    '''
+    # Get the team's transfer history, one record per transfer
+    return [rec.transfer_from_json(transfer) for transfer in jsonResponse["history"]]
+
+def getUserTransferHistory(entry_id, client = None):
     '''  
     Input:  entry_id = team's entry id
+            client = the shared FPLClient, defaults to http_client.default_client()
     
-    Output: transfers = a dictionary with the team's transfer history {key=gameweek ,
-                        value= a dictionary with various info about 
-                     (player_in, cost_in, player_out, cost_out and date) }
+    Output: transfers = a list of records.Transfer, one per transfer (gameweek, player_in,
+                        player_out, cost_in, cost_out and date)
     '''
-    histTeamUrl = FPL_URL + TEAM_ENTRY_SUBURL + str(entry_id) + "/transfers"
+    client = client or hc.default_client()
+    histTeamUrl = userTransferHistoryUrl(entry_id)
     try:
-        r = requests.get(histTeamUrl)
-        jsonResponse = r.json()
-                  
-        # Get the team's transfer history
-        transfers = {}
-        transf = jsonResponse["history"]
-        for gameweek in transf:
-            gameweekTransf = {}
-            gameweekTransf["player_in"] = gameweek["element_in"]
-            gameweekTransf["cost_in"] = gameweek["element_in_cost"]
-            gameweekTransf["player_out"] = gameweek["element_out"]
-            gameweekTransf["cost_out"] = gameweek["element_out_cost"]
-            gameweekTransf["date"] = gameweek["time_formatted"]
-            
-            # Add gameweek history to the history dictionary with key = gameweek_no
-            if gameweek["event"] in transfers:
-                transfers[gameweek["event"]].append(gameweekTransf)
-            else:
-                transfers[gameweek["event"]] = [gameweekTransf]
-        return transfers
+        jsonResponse = client.get_json(histTeamUrl)
+        return parseUserTransferHistory(jsonResponse)
         
-    except BaseException as e:
-        print("There was a problem with the transfer history of team:{0}".format(entry_id))
-        print(str(e))
-        return None
+    except (KeyError, IndexError, TypeError) as e:
+        raise hc.FPLResponseError(histTeamUrl, "unexpected response format: " + str(e)) from e
+
+def userGameweekPicksUrl(entry_id, GWNumber):
+    ''' Returns the url of the picks of team entry_id for gameweek GWNumber '''
+    eventSubUrl = "event/" + str(GWNumber) + "/picks"
+    return FPL_URL + TEAM_ENTRY_SUBURL + str(entry_id) + "/" + eventSubUrl
+
+def parseUserGameweekPicks(jsonResponse):
+    '''
+    Input:  jsonResponse = the parsed json of the gameweek picks page
+
+    Output: deadline, picks, subs as described in getUserGameweekPicks()
+    '''
+    # Get the gameweek deadline
+    deadline = jsonResponse["event"]["deadline_time_formatted"]
+
+    # Get the team's gameweek players
+    picks = [rec.pick_from_json(pick) for pick in jsonResponse["picks"]]
 
-def getUserGameweekPicks(entry_id, GWNumber):
+    # Get the team's gameweek automatic subs
+    subs = [rec.auto_sub_from_json(sub) for sub in jsonResponse["automatic_subs"]]
+
+    return deadline, picks, subs
+
+def getUserGameweekPicks(entry_id, GWNumber, client = None):
     '''
-    Returns a dictionary "picks{}" with keys = the players' element id and
-    value = several info regarding manager's selection at that gameweek
+    Returns the manager's selection for a gameweek
     
     Input:  entry_id = team's entry id
             GWNumber = the gameweek to review
+            client = the shared FPLClient, defaults to http_client.default_client()
             
     Output: deadline = the transfer deadline for that gameweek
-            picks = list of dictionaries with gameweek picks for entry_id team
-            subs = list of dictionaries with gameweek automatic substitutions            
+            picks = list of records.Pick with the gameweek picks for entry_id team
+            subs = list of records.AutoSub with the gameweek automatic substitutions
     '''
-    eventSubUrl = "event/" + str(GWNumber) + "/picks"
-    playerTeamUrlForSpecificGW = FPL_URL + TEAM_ENTRY_SUBURL + str(entry_id) + "/" + eventSubUrl
+    client = client or hc.default_client()
+    playerTeamUrlForSpecificGW = userGameweekPicksUrl(entry_id, GWNumber)
     try:
-        r = requests.get(playerTeamUrlForSpecificGW)
-        jsonResponse = r.json()
-        
-        # Get the gameweek deadline
-        deadline = jsonResponse["event"]["deadline_time_formatted"]
-    
-        # Get the team's gameweek players   
-        picks = jsonResponse["picks"]
+        jsonResponse = client.get_json(playerTeamUrlForSpecificGW)
+        return parseUserGameweekPicks(jsonResponse)
+    except (KeyError, IndexError, TypeError) as e:
+        raise hc.FPLResponseError(playerTeamUrlForSpecificGW, "unexpected response format: " + str(e)) from e
 
-        # Get the team's gameweek automatic subs
-        subs = jsonResponse["automatic_subs"]
-        
-        return deadline, picks, subs
-    except BaseException as e:
-        print("There was a problem with the JSON file for team:{0} and gameweek:{1} / link: {2}".format(
-                entry_id, GWNumber,playerTeamUrlForSpecificGW))
-        print(str(e))
-        return None
+def playerStatsUrl(element_id):
+    ''' Returns the url of the element summary of player element_id '''
+    eventSubUrl = "element-summary/" + str(element_id)
+    return FPL_URL + eventSubUrl
+
+def parsePlayerStats(jsonResponse):
+    '''
+    Input:  jsonResponse = the parsed json of the element summary page
+
+    Output: stats as described in getPlayerStats()
+    '''
+    # Get the gameweek stats for all players
+    return [rec.player_fixture_from_json(fixture) for fixture in jsonResponse["history"]]
 
-def getPlayerStats(element_id):
+def getPlayerStats(element_id, client = None):
     '''
-    Returns a dictionary "player_stats" with keys = the players' element id and
-    value = several info regarding player performance
+    Returns the performance of a player in every fixture of the season
     
     Input:  element_id = the player's id to collect the stats for
+            client = the shared FPLClient, defaults to http_client.default_client()
             
-    Output: stats_dict =  a dictionary of format { stat_title : stat_value }
-            where "element" is the key for the element_id
+    Output: stats = a list of records.PlayerFixture, one per fixture
     '''
-    eventSubUrl = "element-summary/" + str(element_id)
-    url = FPL_URL + eventSubUrl
+    client = client or hc.default_client()
+    url = playerStatsUrl(element_id)
     try:
-        r = requests.get(url)
-        jsonResponse = r.json()
+        jsonResponse = client.get_json(url)
+        return parsePlayerStats(jsonResponse)
+    except (KeyError, IndexError, TypeError) as e:
+        raise hc.FPLResponseError(url, "unexpected response format: " + str(e)) from e
+
+def liveGameweekUrl(GWNumber):
+    ''' Returns the url of the live stats of all the players for gameweek GWNumber '''
+    eventSubUrl = "event/" + str(GWNumber) + "/live"
+    return FPL_URL + eventSubUrl
+
+def _liveExplain(item):
+    '''
+    Returns (fixture_id, {stat_title : (value, points)}) for an entry of a player's live "explain" list.
+    Handles both the [ {stat : {points, name, value}}, fixture_id ] pairs of the drf api and
+    the {fixture, stats : [{identifier, points, value}]} objects of the newer api
+    '''
+    if isinstance(item, dict):
+        return item["fixture"], {stat["identifier"]: (stat["value"], stat["points"]) for stat in item["stats"]}
+    explained, fixture_id = item
+    return fixture_id, {title: (stat["value"], stat["points"]) for title, stat in explained.items()}
+
+def parseLiveGameweek(jsonResponse, GWNumber, player_teams, market = None):
+    '''
+    Converts the live page of a gameweek into rows with the same titles as the element-summary
+    "history" lists, one per player and fixture (two for a double gameweek, none for a blank one).
+    The live page has no market data (value, selected, transfers...), they are taken from market
+    when it is given and left out otherwise.
+    In a double gameweek only the stats explained per fixture are split, the rest are left out.
+    
+    Input:  jsonResponse = the parsed json of the live page
+            GWNumber = the gameweek of the page
+            player_teams = a dictionary {element_id : team id} (see getPlayerData())
+            market = the market data of the players in the gameweek (see getPlayerMarket())
             
-        # Get the gameweek stats for all players
-        stats_dict = jsonResponse["history"]
-        
-        return stats_dict
-    except BaseException as e:
-        print("There was a problem with the JSON file for player:{0} / link: {1}".format(element_id,url))
-        print(str(e))
-        return None
+    Output: stats_list = a list of records.PlayerFixture (the missing titles are None)
+            missing = set of element ids whose team played but are not in the page, or whose team is unknown
+    '''
+    fixtures = {fixture["id"]: fixture for fixture in jsonResponse["fixtures"] if fixture.get("event", GWNumber) == GWNumber}
+    playing_teams = {team for fixture in fixtures.values() for team in (fixture["team_h"], fixture["team_a"])}
+    elements = jsonResponse["elements"]
+    if isinstance(elements, list):
+        elements = {element["id"]: element for element in elements}
+    
+    stats_list = []
+    found = set()
+    for element_id, info in elements.items():
+        element_id = int(element_id)
+        team = player_teams.get(element_id)
+        if team is None:
+            continue
+        explain = [_liveExplain(item) for item in info["explain"]]
+        explain = [(fixture_id, explained) for fixture_id, explained in explain if fixture_id in fixtures]
+        for fixture_id, explained in explain:
+            fixture = fixtures[fixture_id]
+            was_home = fixture["team_h"] == team
+            stats = {"element": element_id,
+                     "round": GWNumber,
+                     "fixture": fixture_id,
+                     "was_home": was_home,
+                     "opponent_team": fixture["team_a"] if was_home else fixture["team_h"],
+                     "team_h_score": fixture["team_h_score"],
+                     "team_a_score": fixture["team_a_score"]}
+            if market and element_id in market:
+                stats.update(market[element_id])
+            if len(explain) == 1:
+                # single fixture: the gameweek totals are the fixture's stats
+                stats.update({title: value for title, value in info["stats"].items() if title not in stats})
+            else:
+                stats.update({title: value for title, (value, points) in explained.items()})
+                stats["total_points"] = sum(points for value, points in explained.values())
+            stats_list.append(rec.player_fixture_from_json(stats))
+        if explain:
+            found.add(element_id)
+    
+    missing = {element_id for element_id, team in player_teams.items() if team in playing_teams and element_id not in found}
+    return stats_list, missing
 
-def getGameData():
+def parseLivePoints(jsonResponse, GWNumber, player_teams):
+    '''
+    Reads the minutes and points of every player from the live page of a gameweek in play
+    
+    Input:  jsonResponse = the parsed json of the live page
+            GWNumber = the gameweek of the page
+            player_teams = a dictionary {element_id : team id} (see getPlayerData())
+            
+    Output: players = a dictionary {element_id : (minutes, total_points)}
+            done_teams = set of the teams whose fixtures of the gameweek are all finished
+                         (or that have no fixture), their players will not score any more
+            finished = True when every fixture of the gameweek is finished
+    '''
+    fixtures = [fixture for fixture in jsonResponse["fixtures"] if fixture.get("event", GWNumber) == GWNumber]
+    finished_teams = {}
+    for fixture in fixtures:
+        for team in (fixture["team_h"], fixture["team_a"]):
+            finished_teams[team] = finished_teams.get(team, True) and bool(fixture.get("finished", False))
+    done_teams = {team for team in set(player_teams.values()) if finished_teams.get(team, True)}
+    elements = jsonResponse["elements"]
+    if isinstance(elements, list):
+        elements = {element["id"]: element for element in elements}
+    players = {int(element_id): (info["stats"]["minutes"], info["stats"]["total_points"]) for element_id, info in elements.items()}
+    return players, done_teams, all(fixture.get("finished", False) for fixture in fixtures)
+
+_decoder = json.JSONDecoder()
+_whitespace = re.compile(r'[ \t\n\r]*')
+
+def _skipWhitespace(text, pos):
+    return _whitespace.match(text, pos).end()
+
+def _expect(text, pos, char):
+    ''' Checks that char is at pos (after whitespace) and returns the position after it '''
+    pos = _skipWhitespace(text, pos)
+    if text[pos:pos+1] != char:
+        raise ValueError("expected '{0}' at position {1}".format(char, pos))
+    return _skipWhitespace(text, pos + 1)
+
+def _decodeTrimmedList(text, pos, fields):
+    '''
+    Decodes the json list of objects starting at pos one object at a time, keeping only fields.
+    
+    Output: (the list of trimmed dictionaries, the position after the list)
+    '''
+    items = []
+    pos = _expect(text, pos, "[")
+    while text[pos] != "]":
+        item, pos = _decoder.raw_decode(text, pos)
+        items.append({field: item.get(field) for field in fields})
+        pos = _skipWhitespace(text, pos)
+        if text[pos] == ",":
+            pos = _skipWhitespace(text, pos + 1)
+    return items, pos + 1
+
+def parseBootstrap(text, sections = BOOTSTRAP_SECTIONS, element_fields = ELEMENT_FIELDS):
+    '''
+    Incremental parser of the bootstrap-static page. The top level object is decoded one member
+    at a time: unwanted sections are dropped as soon as they are read and the players of
+    "elements" are trimmed to element_fields one by one, so the whole object graph of the page
+    is never held in memory.
+    
+    Input:  text = the bootstrap-static page as a string
+            sections = the top level keys to keep
+            element_fields = the fields kept for every player
+            
+    Output: bootstrap = a dictionary {section : value} with the sections found
+    '''
+    bootstrap = {}
+    pos = _expect(text, 0, "{")
+    while text[pos] != "}":
+        key, pos = _decoder.raw_decode(text, pos)
+        pos = _expect(text, pos, ":")
+        if key == "elements" and key in sections:
+            value, pos = _decodeTrimmedList(text, pos, element_fields)
+        else:
+            value, pos = _decoder.raw_decode(text, pos)
+        if key in sections:
+            bootstrap[key] = value
+        del value
+        pos = _skipWhitespace(text, pos)
+        if text[pos] == ",":
+            pos = _skipWhitespace(text, pos + 1)
+    return bootstrap
+
+_bootstrap = None
+# the page _bootstrap was parsed from, an unchanged page is not parsed again
+_bootstrap_content = None
+_bootstrap_lock = threading.Lock()
+
+def loadBootstrap(client = None, refresh = False):
+    '''
+    Returns the sections of bootstrap-static we use (see BOOTSTRAP_SECTIONS). The page is
+    downloaded and parsed once per run and kept in memory for the next calls.
+    
+    Input:  client = the shared FPLClient, defaults to http_client.default_client()
+            refresh = download the page again even if it is already loaded, it is only
+                      parsed again if it changed
+    '''
+    global _bootstrap, _bootstrap_content
+    client = client or hc.default_client()
+    url = PLAYERS_INFO_URL
+    with _bootstrap_lock:
+        if _bootstrap is None or refresh:
+            content = client.get_content(url)
+            if _bootstrap is None or content != _bootstrap_content:
+                try:
+                    _bootstrap = parseBootstrap(content.decode("utf-8"))
+                except (ValueError, IndexError, AttributeError) as e:
+                    raise hc.FPLResponseError(url, "unexpected response format: " + str(e)) from e
+                _bootstrap_content = content
+            # Pages of the finished gameweeks never change, tell the cache and the scheduler
+            client.set_current_gameweek(_bootstrap.get("current-event"), finishedGameweek(_bootstrap) if "current-event" in _bootstrap else None)
+        return _bootstrap
+
+def getGameData(client = None):
     '''
     Returns several information regarding the game like: lookup tables, player positions, etc
     
+    Input:  client = the shared FPLClient, defaults to http_client.default_client()
+    
     Output: gameweek = the current gameweek
             element_types = a list of dictionaries for the available element types
             teams = a list of dictionaries for the teams
             stats_lookup = a list of dictionaries for the stats
     '''
-    eventSubUrl = "bootstrap-static"
-    url = FPL_URL + eventSubUrl
+    jsonResponse = loadBootstrap(client)
     try:
-        r = requests.get(url)
-        jsonResponse = r.json()
-            
         # Get the gameweek stats for all players
         gameweek = jsonResponse["current-event"] # an integer specifying finished gameweek
         element_types = jsonResponse["element_types"] # a list of dictionaries
@@ -281,30 +534,70 @@ def getGameData():
         stats_lookup = jsonResponse["stats_options"] # a list of dictionaries
         
         return gameweek, element_types, teams, stats_lookup
-    except BaseException as e:
-        print("There was a problem with the JSON file for link: {0}".format(url))
-        print(str(e))
-        return None
+    except (KeyError, IndexError, TypeError) as e:
+        raise hc.FPLResponseError(PLAYERS_INFO_URL, "unexpected response format: " + str(e)) from e
+
+def getFinishedGameweek(client = None):
+    '''
+    Returns the last gameweek whose fixtures are all finished (its pages do not change any more)
+    
+    Input:  client = the shared FPLClient, defaults to http_client.default_client()
+    
+    Output: gameweek = the last finished gameweek, the one before the current gameweek
+            when bootstrap-static has no "events" section (the current one is in play)
+    '''
+    return finishedGameweek(loadBootstrap(client))
 
-def getPlayerData():
+def finishedGameweek(jsonResponse):
+    '''
+    Returns the last finished gameweek of a parsed bootstrap-static page (see getFinishedGameweek())
+    '''
+    try:
+        current_gameweek = jsonResponse["current-event"]
+        if "events" not in jsonResponse:
+            return current_gameweek - 1
+        return max([event["id"] for event in jsonResponse["events"] if event.get("finished") and event["id"] <= current_gameweek], default = 0)
+    except (KeyError, IndexError, TypeError) as e:
+        raise hc.FPLResponseError(PLAYERS_INFO_URL, "unexpected response format: " + str(e)) from e
+
+def getPlayerData(client = None):
     '''
     Returns several information regarding the players like: player_name, position, etc
     
-    Output: player_info = a dictionary with key the element_id and values a dictionary with 
-            element_type(code for player_position) and web_name (the player's name)
+    Input:  client = the shared FPLClient, defaults to http_client.default_client()
+    
+    Output: player_info = a list of dictionaries, one per player, with its id, element_type
+            (code for player_position), web_name (the player's name), team and market data
+            (see ELEMENT_FIELDS)
     '''
-    eventSubUrl = "elements"
-    url = FPL_URL + eventSubUrl
+    # The players are the "elements" section of bootstrap-static, already trimmed to ELEMENT_FIELDS
     try:
-        r = requests.get(url)
-        jsonResponse = r.json()
-            
-        # Get the lookup info for all players
-        info_to_get = ["id","element_type","web_name"]
-        player_info = [{ attr:item[attr] for attr in info_to_get} for item in jsonResponse ]
-        
-        return player_info
-    except BaseException as e:
-        print("There was a problem with the JSON file for link: {0}".format(url))
-        print(str(e))
-        return None
+        return loadBootstrap(client)["elements"]
+    except KeyError as e:
+        raise hc.FPLResponseError(PLAYERS_INFO_URL, "unexpected response format: " + str(e)) from e
+
+def getPlayerMarket(client = None):
+    '''
+    Returns the market data of every player in the current gameweek from bootstrap-static,
+    with the titles of the element-summary "history" rows (the live pages do not have them)
+    
+    Input:  client = the shared FPLClient, defaults to http_client.default_client()
+    
+    Output: market = a dictionary {element_id : {title : value}} with the value, selected,
+            transfers_in, transfers_out and transfers_balance of the player
+    '''
+    jsonResponse = loadBootstrap(client)
+    try:
+        total_players = jsonResponse.get("total-players")
+        market = {}
+        for player in jsonResponse["elements"]:
+            transfers_in, transfers_out = player["transfers_in_event"], player["transfers_out_event"]
+            selected = player["selected_by_percent"]
+            market[player["id"]] = {"value": player["now_cost"],
+                                    "selected": round(float(selected) * total_players / 100) if selected is not None and total_players else None,
+                                    "transfers_in": transfers_in,
+                                    "transfers_out": transfers_out,
+                                    "transfers_balance": transfers_in - transfers_out if transfers_in is not None and transfers_out is not None else None}
+        return market
+    except (KeyError, TypeError, ValueError) as e:
+        raise hc.FPLResponseError(PLAYERS_INFO_URL, "unexpected response format: " + str(e)) from e
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+Fantasy Premier League 2017-2018 scraper
+
+@author: Theodoros Panagiotakos
+"""
+
+import json
+import random
+import re
+import threading
+import time
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+import metrics as mt
+import payload_archive as pa
+import response_cache as rc
+import scheduler as sc
+import params
+
+try:
+    # orjson decodes the pages several times faster, the standard json module is used without it
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    loads = json.loads
+
+
+REQUEST_TIMEOUT = params.REQUEST_TIMEOUT
+MAX_RETRIES = params.MAX_RETRIES
+BACKOFF_BASE = params.BACKOFF_BASE
+BACKOFF_MAX = params.BACKOFF_MAX
+POOL_SIZE = params.MAX_WORKERS
+CACHE_FILE = params.CACHE_FILE
+OFFLINE = params.OFFLINE
+ARCHIVE_FILE = params.ARCHIVE_FILE
+RETRANSFORM = params.RETRANSFORM
+
+# Status codes that are worth retrying
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+_ids = re.compile(r"\d+")
+
+def endpoint_label(url):
+    '''
+    Returns the path of url with its ids replaced by {id} (e.g. /drf/entry/{id}/history),
+    the endpoint label of the request metrics
+    '''
+    return _ids.sub("{id}", urlparse(url).path)
+
+
+class FPLRequestError(Exception):
+    ''' Base class for all the errors raised while downloading FPL pages '''
+    def __init__(self, url, message):
+        super().__init__("{0} / link: {1}".format(message, url))
+        self.url = url
+
+class FPLConnectionError(FPLRequestError):
+    ''' The FPL server could not be reached (dns, connection reset, timeout) '''
+
+class FPLHTTPError(FPLRequestError):
+    ''' The FPL server answered with an error status code '''
+    def __init__(self, url, status_code):
+        super().__init__(url, "HTTP error {0}".format(status_code))
+        self.status_code = status_code
+
+class FPLNotFoundError(FPLHTTPError):
+    ''' The requested page does not exist (404) '''
+
+class FPLRateLimitError(FPLHTTPError):
+    ''' The FPL server kept throttling us (429) after all the retries '''
+
+class FPLResponseError(FPLRequestError):
+    ''' The response could not be decoded or did not have the expected format '''
+
+class FPLOfflineError(FPLRequestError):
+    ''' Running offline and the page is not in the cache (or in the archive when replaying it) '''
+
+
+class FPLClient:
+    '''
+    Http client shared by all the get_data functions.
+    Keeps a pool of keep-alive connections and retries transient failures
+    with exponential backoff and jitter. When a ResponseCache is given, fresh
+    cached pages are served locally and stale ones are revalidated with the server.
+    When a RequestScheduler is given, every request waits for its turn in it.
+    When a PayloadArchive is given, every downloaded page is archived in it, with replay
+    the pages are read from the archive only and the network is never used.
+    '''
+    def __init__(self, timeout = REQUEST_TIMEOUT, max_retries = MAX_RETRIES, pool_size = POOL_SIZE,
+                 backoff_base = BACKOFF_BASE, backoff_max = BACKOFF_MAX, cache = None, offline = False,
+                 scheduler = None, archive = None, replay = False):
+        self.cache = cache
+        self.scheduler = scheduler
+        self.offline = offline
+        self.archive = archive
+        self.replay = replay
+        self.current_gameweek = None
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections = pool_size, pool_maxsize = pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _backoff(self, attempt, retry_after = None):
+        '''
+        Returns the seconds to wait before retry number attempt (full jitter).
+        A Retry-After header sent by the server is respected when it is longer.
+        '''
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if retry_after:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        return delay
+
+    def get(self, url, headers = None):
+        '''
+        Downloads url and returns the requests response, retrying transient failures
+        
+        Input: url = the FPL page to download
+               headers = extra request headers (e.g. cache validators)
+        
+        Raises FPLConnectionError, FPLNotFoundError, FPLRateLimitError or FPLHTTPError
+        when the page could not be downloaded
+        '''
+        attempt = 0
+        while True:
+            try:
+                r = self._send(url, headers)
+            except requests.RequestException as e:
+                if attempt >= self.max_retries:
+                    raise FPLConnectionError(url, str(e)) from e
+                mt.registry.inc("fpl_request_retries_total", endpoint = endpoint_label(url))
+                time.sleep(self._backoff(attempt))
+                attempt += 1
+                continue
+            if r.status_code in RETRY_STATUS and attempt < self.max_retries:
+                mt.registry.inc("fpl_request_retries_total", endpoint = endpoint_label(url))
+                time.sleep(self._backoff(attempt, r.headers.get("Retry-After")))
+                attempt += 1
+                continue
+            if r.status_code == 404:
+                raise FPLNotFoundError(url, r.status_code)
+            if r.status_code == 429:
+                raise FPLRateLimitError(url, r.status_code)
+            if r.status_code >= 400:
+                raise FPLHTTPError(url, r.status_code)
+            return r
+
+    def _send(self, url, headers):
+        '''
+        Sends one request, through the scheduler if there is one, and records its
+        status, latency and size in the metrics
+        '''
+        ticket = self.scheduler.acquire(url) if self.scheduler is not None else None
+        endpoint = endpoint_label(url)
+        status_code = None
+        started = time.perf_counter()
+        try:
+            r = self.session.get(url, headers = headers, timeout = self.timeout)
+            status_code = r.status_code
+            mt.registry.inc("fpl_downloaded_bytes_total", len(r.content), endpoint = endpoint)
+            return r
+        finally:
+            mt.registry.observe("fpl_request_seconds", time.perf_counter() - started, endpoint = endpoint)
+            mt.registry.inc("fpl_requests_total", endpoint = endpoint, status = status_code or "error")
+            if ticket is not None:
+                self.scheduler.release(ticket, status_code)
+
+    def set_current_gameweek(self, gameweek, finished_gameweek = None):
+        '''
+        Tells the scheduler which gameweek is the current one (older gameweeks are fetched
+        after it) and the cache which one is the last finished (its pages and those of the
+        gameweeks before it never change, the current gameweek may be in play)
+        '''
+        self.current_gameweek = gameweek
+        if self.cache is not None:
+            self.cache.finished_gameweek = finished_gameweek
+        if self.scheduler is not None:
+            self.scheduler.current_gameweek = gameweek
+
+    def get_content(self, url, revalidate = False):
+        '''
+        Downloads url (or reads it from the cache) and returns the raw response bytes
+        
+        Input: url = the FPL page to download
+               revalidate = ask the server even if the cached page is fresh (e.g. live pages)
+        '''
+        if self.replay:
+            body = self.archive.lookup(url)
+            if body is None:
+                raise FPLOfflineError(url, "page not available in the archive")
+            return body
+        if self.cache is None:
+            return self._archived(url, self.get(url).content)
+        cached = self.cache.lookup(url)
+        if cached is not None and (self.offline or (cached.is_fresh() and not revalidate)):
+            mt.registry.inc("fpl_cache_responses_total", endpoint = endpoint_label(url), result = "hit")
+            return self._archived(url, cached.body)
+        if self.offline:
+            raise FPLOfflineError(url, "page not available in the cache")
+        r = self.get(url, cached.validators() if cached is not None else None)
+        if r.status_code == 304 and cached is not None:
+            mt.registry.inc("fpl_cache_responses_total", endpoint = endpoint_label(url), result = "revalidated")
+            self.cache.refresh(url)
+            return self._archived(url, cached.body)
+        mt.registry.inc("fpl_cache_responses_total", endpoint = endpoint_label(url), result = "miss")
+        self.cache.store(url, r.content, r.headers.get("ETag"), r.headers.get("Last-Modified"))
+        return self._archived(url, r.content)
+
+    def _archived(self, url, body):
+        '''
+        Archives a page used by the run (if there is an archive) and returns it. The pages
+        served by the cache are archived too, a RETRANSFORM run needs every page of the run.
+        '''
+        if self.archive is not None:
+            self.archive.store(url, body, self.current_gameweek)
+        return body
+
+    def get_json(self, url, revalidate = False):
+        '''
+        Downloads url (or reads it from the cache) and returns its parsed json response
+        
+        Input: url = the FPL page to download
+               revalidate = ask the server even if the cached page is fresh
+        '''
+        return self._decode(url, self.get_content(url, revalidate))
+
+    def _decode(self, url, body):
+        try:
+            return loads(body)
+        except ValueError as e:
+            raise FPLResponseError(url, "invalid json response") from e
+
+    def close(self):
+        self.session.close()
+        if self.cache is not None:
+            self.cache.close()
+        if self.archive is not None:
+            self.archive.close()
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+def default_client():
+    '''
+    Returns the client shared by the whole process, creating it on first use.
+    Raises a ValueError when RETRANSFORM is set without an ARCHIVE_FILE to replay.
+    '''
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            if RETRANSFORM and not ARCHIVE_FILE:
+                raise ValueError("RETRANSFORM rebuilds the tables from the archived pages but ARCHIVE_FILE is not set")
+            # a replay reads the archive only, the cache is not needed
+            cache = rc.ResponseCache(CACHE_FILE) if CACHE_FILE and not RETRANSFORM else None
+            archive = pa.PayloadArchive(ARCHIVE_FILE) if ARCHIVE_FILE else None
+            _default_client = FPLClient(cache = cache, offline = OFFLINE, scheduler = sc.RequestScheduler(),
+                                        archive = archive, replay = RETRANSFORM)
+        return _default_client
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+Fantasy Premier League 2017-2018 scraper
+
+@author: Theodoros Panagiotakos
+"""
+
+# League analytics computed with NumPy over the whole league and season at once.
+# The tables are loaded once (LeagueArrays.load) into dense arrays indexed by
+# [entry index, gameweek, ...] and [gameweek, element id]; every metric is then a handful of
+# array operations instead of SQL per manager or Python loops over rows.
+# The definitions follow DB_Summaries.sql: captain points are points * multiplier, bench points
+# the points of positions 12-15 and the transfer gain of a gameweek is points in - points out - cost.
+
+import logging
+import sqlite3
+import numpy as np
+import gameweek_partitions as gp
+import params
+
+log = logging.getLogger(__name__)
+
+
+SQUAD_SIZE = 15
+STARTING_PLAYERS = 11
+
+
+class LeagueArrays:
+    '''
+    The picks, player performance, team history and transfers of a league as NumPy arrays.
+    N entries, gameweeks 0..G (index = gameweek, 0 unused) and elements 0..E (index = element id):
+      entries[N]                      entry ids, sorted
+      points[G+1, E+1]                points of every element in every gameweek (both fixtures of a double gameweek)
+      pick_element[N, G+1, 15]        element picked at every squad position, 0 when there is no pick
+      pick_multiplier[N, G+1, 15]     multiplier of the pick (2 for the captain, 0 on the bench)
+      pick_captain[N, G+1, 15]        True for the captain
+      has_picks[N, G+1]               True when the picks of the gameweek are stored
+      history_points, history_total_points, history_overall_rank,
+      history_transfers_cost[N, G+1]  team history, NaN when not stored
+      transfer_entry, transfer_gameweek, transfer_in, transfer_out[T]   one item per transfer (entry index)
+    '''
+    def __init__(self, entries, gameweeks, elements):
+        self.entries = entries
+        self.gameweeks = gameweeks
+        self.elements = elements
+        shape = (len(entries), gameweeks + 1)
+        self.points = np.zeros((gameweeks + 1, elements + 1), dtype = np.int64)
+        self.pick_element = np.zeros(shape + (SQUAD_SIZE,), dtype = np.int64)
+        self.pick_multiplier = np.zeros(shape + (SQUAD_SIZE,), dtype = np.int64)
+        self.pick_captain = np.zeros(shape + (SQUAD_SIZE,), dtype = bool)
+        self.has_picks = np.zeros(shape, dtype = bool)
+        self.history_points = np.full(shape, np.nan)
+        self.history_total_points = np.full(shape, np.nan)
+        self.history_overall_rank = np.full(shape, np.nan)
+        self.history_transfers_cost = np.full(shape, np.nan)
+        self.transfer_entry = np.zeros(0, dtype = np.int64)
+        self.transfer_gameweek = np.zeros(0, dtype = np.int64)
+        self.transfer_in = np.zeros(0, dtype = np.int64)
+        self.transfer_out = np.zeros(0, dtype = np.int64)
+
+    @classmethod
+    def load(cls, connection, picks_table = "gameweekPicks", performance_table = "gameweekPerformance",
+             history_table = "userTeamHistory", transfer_table = "userTransferHistory"):
+        '''
+        Loads the tables of a league's DB (one query per table)
+        '''
+        def rows(query):
+            try:
+                return np.array(connection.execute(query).fetchall(), dtype = np.float64).reshape(-1, query.count(",") + 1)
+            except sqlite3.OperationalError as e:
+                log.warning("Table missing from the analytics: %s", e)
+                return np.zeros((0, query.count(",") + 1))
+        picks = rows("SELECT entry_id, gameweek, element, multiplier, is_captain, position FROM {0}".format(picks_table)).astype(np.int64)
+        performance = rows("SELECT round, element, total_points FROM {0} WHERE round IS NOT NULL".format(performance_table)).astype(np.int64)
+        history = rows("SELECT entry_id, gameweek, points, total_points, overall_rank, week_transfers_cost FROM {0}".format(history_table))
+        transfers = rows("SELECT entry_id, gameweek, player_in, player_out FROM {0}".format(transfer_table)).astype(np.int64)
+
+        entries = np.unique(np.concatenate([picks[:, 0], history[:, 0].astype(np.int64), transfers[:, 0]]))
+        gameweeks = int(max([0] + [array[:, column].max() for array, column in ((picks, 1), (performance, 0), (history, 1), (transfers, 1)) if len(array)]))
+        elements = int(max([0] + [array[:, column].max() for array, column in ((picks, 2), (performance, 1), (transfers, 2), (transfers, 3)) if len(array)]))
+        data = cls(entries, gameweeks, elements)
+
+        np.add.at(data.points, (performance[:, 0], performance[:, 1]), performance[:, 2])
+        entry, gameweek, position = np.searchsorted(entries, picks[:, 0]), picks[:, 1], picks[:, 5] - 1
+        data.pick_element[entry, gameweek, position] = picks[:, 2]
+        data.pick_multiplier[entry, gameweek, position] = picks[:, 3]
+        data.pick_captain[entry, gameweek, position] = picks[:, 4] == 1
+        data.has_picks[entry, gameweek] = True
+        entry, gameweek = np.searchsorted(entries, history[:, 0].astype(np.int64)), history[:, 1].astype(np.int64)
+        data.history_points[entry, gameweek] = history[:, 2]
+        data.history_total_points[entry, gameweek] = history[:, 3]
+        data.history_overall_rank[entry, gameweek] = history[:, 4]
+        data.history_transfers_cost[entry, gameweek] = history[:, 5]
+        data.transfer_entry = np.searchsorted(entries, transfers[:, 0])
+        data.transfer_gameweek, data.transfer_in, data.transfer_out = transfers[:, 1], transfers[:, 2], transfers[:, 3]
+        return data
+
+    def pick_points(self):
+        ''' Points of every pick before the multiplier [N, G+1, 15] '''
+        return self.points[np.arange(self.gameweeks + 1)[None, :, None], self.pick_element]
+
+
+def effective_ownership(data):
+    '''
+    Effective ownership of every element in every gameweek: the sum of the multipliers of the
+    league's picks of the element (captains count twice, bench players not at all) per 100
+    managers with picks that gameweek
+
+    Output: eo[G+1, E+1] in percent
+    '''
+    gameweek = np.broadcast_to(np.arange(data.gameweeks + 1)[None, :, None], data.pick_element.shape)
+    flat = gameweek * (data.elements + 1) + data.pick_element
+    eo = np.bincount(flat.ravel(), weights = data.pick_multiplier.ravel(), minlength = (data.gameweeks + 1) * (data.elements + 1))
+    managers = data.has_picks.sum(axis = 0)
+    with np.errstate(invalid = "ignore", divide = "ignore"):
+        return np.where(managers[:, None] > 0, 100.0 * eo.reshape(data.gameweeks + 1, data.elements + 1) / managers[:, None], 0.0)
+
+def captain_points(data):
+    ''' Points of the captain times its multiplier [N, G+1] (0 without picks) '''
+    return (data.pick_points() * data.pick_multiplier * data.pick_captain).sum(axis = 2)
+
+def captaincy_hits(data):
+    '''
+    Whether the captain scored the most points of the starting eleven [N, G+1]
+    (False without picks)
+    '''
+    points = data.pick_points()
+    captain = np.where(data.pick_captain, points, np.iinfo(np.int64).min).max(axis = 2)
+    return data.has_picks & (captain >= points[:, :, :STARTING_PLAYERS].max(axis = 2))
+
+def captaincy_hit_rate(data):
+    ''' Share of the gameweeks with picks in which the captain was the best starter [N] '''
+    with np.errstate(invalid = "ignore", divide = "ignore"):
+        return captaincy_hits(data).sum(axis = 1) / data.has_picks.sum(axis = 1)
+
+def bench_points(data):
+    ''' Points left on the bench (positions 12-15) [N, G+1] '''
+    return data.pick_points()[:, :, STARTING_PLAYERS:].sum(axis = 2)
+
+def transfer_gain(data):
+    '''
+    Net points of the transfers of every gameweek: points of the players in - points of the
+    players out (in the gameweek of the transfer) - transfers cost [N, G+1]
+    '''
+    gain = data.points[data.transfer_gameweek, data.transfer_in] - data.points[data.transfer_gameweek, data.transfer_out]
+    flat = data.transfer_entry * (data.gameweeks + 1) + data.transfer_gameweek
+    net = np.bincount(flat, weights = gain, minlength = len(data.entries) * (data.gameweeks + 1)).reshape(len(data.entries), data.gameweeks + 1)
+    made = np.bincount(flat, minlength = net.size).reshape(net.shape) > 0
+    return net - np.where(made, np.nan_to_num(data.history_transfers_cost), 0)
+
+def league_ranks(data):
+    '''
+    Rank of every entry in the league by total points after every gameweek [N, G+1]
+    (equal totals share the rank, NaN when the gameweek is not stored)
+    '''
+    totals = data.history_total_points
+    ranks = np.full(totals.shape, np.nan)
+    for gameweek in range(1, data.gameweeks + 1):
+        stored = ~np.isnan(totals[:, gameweek])
+        ordered = np.sort(-totals[stored, gameweek])
+        ranks[stored, gameweek] = np.searchsorted(ordered, -totals[stored, gameweek], side = "left") + 1
+    return ranks
+
+def rank_movement(ranks):
+    ''' Places gained since the previous gameweek for a [N, G+1] array of ranks (NaN for the first) '''
+    movement = np.full(ranks.shape, np.nan)
+    movement[:, 1:] = ranks[:, :-1] - ranks[:, 1:]
+    return movement
+
+def league_summary(data):
+    '''
+    Computes all the metrics for the whole league
+
+    Output: a dictionary {metric name : array}, see the functions above for their shapes
+    '''
+    ranks = league_ranks(data)
+    return {"effective_ownership": effective_ownership(data),
+            "captain_points": captain_points(data),
+            "captaincy_hit_rate": captaincy_hit_rate(data),
+            "bench_points": bench_points(data),
+            "transfer_gain": transfer_gain(data),
+            "league_rank": ranks,
+            "league_rank_movement": rank_movement(ranks),
+            "overall_rank_movement": rank_movement(data.history_overall_rank)}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level = params.LOG_LEVEL)
+    for key in params.USER_LEAGUE:
+        for fpl_league_id in params.USER_LEAGUE[key]:
+            connection = sqlite3.connect("fpl_{0}.db".format(fpl_league_id))
+            gp.attach(connection)
+            data = LeagueArrays.load(connection)
+            connection.close()
+            summary = league_summary(data)
+            log.info("League %s: %s managers, %s gameweeks", fpl_league_id, len(data.entries), data.gameweeks)
+            log.info("%10s %6s %9s %8s %9s %5s", "entry", "rank", "captain%", "bench", "transfers", "move")
+            last = data.gameweeks
+            for i in np.argsort(summary["league_rank"][:, last]):
+                log.info("%10d %6.0f %9.1f %8d %9.0f %5.0f", data.entries[i], summary["league_rank"][i, last], 100 * summary["captaincy_hit_rate"][i],
+                         summary["bench_points"][i].sum(), summary["transfer_gain"][i].sum(), summary["league_rank_movement"][i, last])
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+Fantasy Premier League 2017-2018 scraper
+
+@author: Theodoros Panagiotakos
+"""
+
+# Live mode: follows the gameweek in play instead of running the whole fpl_info.py batch.
+# The picks of the leagues' teams are downloaded once, then every LIVE_POLL_INTERVAL seconds
+# only the live page of the gameweek is polled (revalidated with the server, a 304 costs nothing)
+# and the live points of every team are recomputed, with the captain (or vice captain) multiplier
+# and the automatic substitutions. Only the teams and players whose points changed are written,
+# to the liveTeamPoints and livePlayerPoints tables of the league databases.
+# It stops when every fixture of the gameweek is finished.
+#
+# python live_mode.py
+
+import logging
+import time
+import get_data as gd
+import manage_sqllite as sq
+import fetch_engine as fe
+import http_client as hc
+import metrics as mt
+import records as rec
+import params
+
+log = logging.getLogger(__name__)
+
+
+USER_LEAGUE = params.USER_LEAGUE
+LIVE_POLL_INTERVAL = params.LIVE_POLL_INTERVAL
+leagueStandingUrl = gd.FPL_URL + gd.LEAGUE_CLASSIC_STANDING_SUBURL
+
+live_team_table_name = "liveTeamPoints"
+live_player_table_name = "livePlayerPoints"
+
+STARTING_PLAYERS = 11
+GOALKEEPER = 1
+# Minimum players of each element type in a starting eleven after an automatic substitution
+FORMATION_MINIMUM = {1: 1, 2: 3, 3: 2, 4: 1}
+
+
+def valid_formation(lineup, element_types):
+    counts = {}
+    for pick in lineup:
+        element_type = element_types.get(pick.element)
+        counts[element_type] = counts.get(element_type, 0) + 1
+    return all(counts.get(element_type, 0) >= minimum for element_type, minimum in FORMATION_MINIMUM.items())
+
+def team_live_points(entry_id, gameweek, picks, players, done, element_types):
+    '''
+    Computes the live points of a team. A starter who did not play (no minutes and all the
+    fixtures of his team finished) is replaced by the first bench player who played and keeps
+    the formation valid, a goalkeeper only by the bench goalkeeper. The vice captain takes the
+    captain's multiplier when the captain did not play. With the bench boost chip (bench players
+    with a multiplier) all 15 players count and there are no substitutions.
+
+    Input:  entry_id, gameweek = the team and the gameweek
+            picks = the list of records.Pick of the team for the gameweek
+            players = a dictionary {element_id : (minutes, total_points)} (see gd.parseLivePoints())
+            done = set of the players who will not play any more in the gameweek
+            element_types = a dictionary {element_id : element type}
+
+    Output: a records.LiveTeamPoints
+    '''
+    picks = sorted(picks, key = lambda pick: pick.position)
+    points = {pick.element: players.get(pick.element, (0, 0))[1] for pick in picks}
+    played = {pick.element for pick in picks if players.get(pick.element, (0, 0))[0] > 0}
+    missed = {pick.element for pick in picks if pick.element in done and pick.element not in played}
+    lineup, bench = picks[:STARTING_PLAYERS], picks[STARTING_PLAYERS:]
+    subs = 0
+    if any(pick.multiplier > 0 for pick in bench):
+        lineup, bench = picks, []
+    else:
+        for i, pick in enumerate(lineup):
+            if pick.element not in missed:
+                continue
+            for substitute in bench:
+                if substitute.element not in played:
+                    continue
+                if (element_types.get(substitute.element) == GOALKEEPER) != (element_types.get(pick.element) == GOALKEEPER):
+                    continue
+                trial = lineup[:i] + [substitute] + lineup[i + 1:]
+                if valid_formation(trial, element_types):
+                    lineup = trial
+                    bench = [other for other in bench if other is not substitute] + [pick]
+                    subs += 1
+                    break
+    captain = next((pick for pick in picks if pick.is_captain), None)
+    vice_captain = next((pick for pick in picks if pick.is_vice_captain), None)
+    multiplier = max(pick.multiplier for pick in picks) if picks else 1
+    if captain is not None and captain.element in missed and vice_captain is not None and vice_captain in lineup:
+        captain = vice_captain
+    total = sum(points[pick.element] * (multiplier if captain is not None and pick.element == captain.element else 1) for pick in lineup)
+    return rec.LiveTeamPoints(entry_id, gameweek, total, sum(points[pick.element] for pick in bench),
+                              captain.element if captain is not None else None, subs)
+
+
+class LiveLeague:
+    '''
+    The live points of a league's teams in the gameweek in play. The picks are downloaded once
+    by load(), every update() recomputes the points and writes only the rows that changed.
+    '''
+    def __init__(self, fpl_league_id, gameweek, element_types, client = None):
+        self.fpl_league_id = fpl_league_id
+        self.dbase = "fpl_{0}.db".format(fpl_league_id)
+        self.gameweek = gameweek
+        self.element_types = element_types
+        self.client = client or hc.default_client()
+        self.picks = {}        # {entry_id : [records.Pick]}
+        self.team_rows = {}    # {entry_id : records.LiveTeamPoints} as stored
+        self.player_rows = {}  # {element_id : records.LivePlayerPoints} as stored
+
+    def load(self):
+        ''' Downloads the league's entries and their picks for the gameweek '''
+        entries = [entry for entry, info in gd.iterLeagueEntries(self.fpl_league_id, leagueStandingUrl, client = self.client)]
+        pages = fe.fetch_batch({entry: gd.userGameweekPicksUrl(entry, self.gameweek) for entry in entries}, client = self.client)
+        for entry, jsonResponse in pages.items():
+            if jsonResponse is None:
+                continue
+            try:
+                deadline, self.picks[entry], subs = gd.parseUserGameweekPicks(jsonResponse)
+            except (KeyError, IndexError, TypeError) as e:
+                log.warning("Picks of user %s skipped: %s", entry, e)
+        # rows stored by an earlier live run are not written again
+        connection, cursor = sq.connect(self.dbase)
+        self.team_rows = {row.entry_id: row for row in sq.stored_records(connection, live_team_table_name, rec.LiveTeamPoints, self.gameweek)}
+        self.player_rows = {row.element: row for row in sq.stored_records(connection, live_player_table_name, rec.LivePlayerPoints, self.gameweek)}
+        sq.close(connection)
+        log.info("League %s: picks of %s of %s users loaded for gameweek %s", self.fpl_league_id, len(self.picks), len(entries), self.gameweek)
+
+    def update(self, players, done):
+        '''
+        Recomputes the live points of the teams and writes the changed ones
+
+        Input:  players, done = see team_live_points()
+
+        Output: the number of team rows and player rows written
+        '''
+        teams = [team_live_points(entry, self.gameweek, picks, players, done, self.element_types) for entry, picks in self.picks.items()]
+        changed_teams = [row for row in teams if self.team_rows.get(row.entry_id) != row]
+        picked = {pick.element for picks in self.picks.values() for pick in picks}
+        changed_players = [row for row in (rec.LivePlayerPoints(self.gameweek, element, *players[element]) for element in picked if element in players)
+                           if self.player_rows.get(row.element) != row]
+        if changed_teams or changed_players:
+            connection, cursor = sq.connect(self.dbase)
+            cursor.execute("PRAGMA busy_timeout = 30000")
+            if changed_teams:
+                sq.live_team_points_table(connection, changed_teams, live_team_table_name)
+            if changed_players:
+                sq.live_player_points_table(connection, changed_players, live_player_table_name)
+            sq.close(connection)
+            self.team_rows.update((row.entry_id, row) for row in changed_teams)
+            self.player_rows.update((row.element, row) for row in changed_players)
+        return len(changed_teams), len(changed_players)
+
+
+def run_live(user_league = USER_LEAGUE, interval = LIVE_POLL_INTERVAL, cycles = None, client = None):
+    '''
+    Follows the gameweek in play for all the leagues until its fixtures are finished
+
+    Input:  user_league = the leagues to follow, as USER_LEAGUE in params.py
+            interval = seconds between two polls of the live page
+            cycles = stop after this many polls (None = until the gameweek is finished)
+
+    Output: the seconds each update cycle took
+    '''
+    client = client or hc.default_client()
+    bootstrap = gd.loadBootstrap(client, refresh = True)
+    gameweek = bootstrap["current-event"]
+    element_types = {player["id"]: player["element_type"] for player in bootstrap["elements"]}
+    player_teams = {player["id"]: player["team"] for player in bootstrap["elements"]}
+    leagues = [LiveLeague(fpl_league_id, gameweek, element_types, client) for key in user_league for fpl_league_id in user_league[key]]
+    for league in leagues:
+        league.load()
+    url = gd.liveGameweekUrl(gameweek)
+    cycle_times = []
+    while True:
+        started = time.perf_counter()
+        finished = False
+        try:
+            players, done_teams, finished = gd.parseLivePoints(client.get_json(url, revalidate = True), gameweek, player_teams)
+            done = {element for element, team in player_teams.items() if team in done_teams}
+            for league in leagues:
+                teams, players_written = league.update(players, done)
+                mt.registry.inc("live_rows_written_total", teams, table = live_team_table_name)
+                mt.registry.inc("live_rows_written_total", players_written, table = live_player_table_name)
+                log.info("League %s: %s teams and %s players changed", league.fpl_league_id, teams, players_written)
+        except hc.FPLRequestError as e:
+            log.warning("Live page of gameweek %s not loaded, retrying at the next poll: %s", gameweek, e)
+        except (KeyError, IndexError, TypeError) as e:
+            log.warning("Unexpected live page of gameweek %s: %s", gameweek, e)
+        seconds = time.perf_counter() - started
+        cycle_times.append(seconds)
+        mt.registry.observe("live_cycle_seconds", seconds)
+        if finished:
+            log.info("All the fixtures of gameweek %s are finished", gameweek)
+            break
+        if cycles is not None and len(cycle_times) >= cycles:
+            break
+        time.sleep(max(0, interval - seconds))
+    return cycle_times
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level = params.LOG_LEVEL, format = "%(asctime)s %(levelname)s %(name)s: %(message)s")
+    run_live()
+    mt.registry.write(params.METRICS_REPORT_FILE, params.METRICS_PROMETHEUS_FILE)
@@ -5,30 +5,274 @@ Fantasy Premier League 2017-2018 scraper
 @author: Theodoros Panagiotakos
 """
 
+import logging
+import re
 import sqlite3
+import metrics as mt
+import records as rec
+import params
+
+log = logging.getLogger(__name__)
+
+
+WRITE_BATCH_SIZE = params.WRITE_BATCH_SIZE
+CACHE_SIZE_KB = params.SQLITE_CACHE_SIZE_KB
+# Table recording every unit of work (one page download) of the ingestion stages and its status
+LEDGER_TABLE = "runLedger"
+# Unit holding the status of a whole stage, or of the whole run for endpoint RUN_ENDPOINT
+STAGE_UNIT = (0, 0, 0)
+RUN_ENDPOINT = "run"
+# Table recording, for every stage, the last gameweek downloaded after it was finished
+STAGE_MARKS_TABLE = "stageMarks"
+
+# Secondary indexes serving the joins and filters of DB_Views.sql {table_name : [(index_name, columns, unique)]}
+# (keys already covered by a table's UNIQUE/PRIMARY KEY constraint are not repeated here)
+# Rows of gameweekPerformance loaded from the live pages have no id, (element, fixture) identifies them
+TABLE_INDEXES = {"gameweekPerformance": [("gameweekPerformance_element_round_index", ["element", "round"], False),
+                                         ("gameweekPerformance_element_fixture_index", ["element", "fixture"], True)],
+                 "gameweekPicks": [("gameweekPicks_gameweek_element_index", ["gameweek", "element"], False)],
+                 "gameweekSubs": [("gameweekSubs_entry_gameweek_index", ["entry_id", "gameweek"], False)]}
+
+# Table written by an INSERT or UPDATE statement (label of the rows written metric)
+_statement_table = re.compile(r"(?:INTO|UPDATE)\s+(\w+)")
+
+
+def upsert_statement(table_name, columns, conflict_keys, keep_null = False, select = None):
+    '''
+    Returns an INSERT statement that updates the row already stored with the same key only
+    when one of its other columns changed, so unchanged rows are not written again (an
+    INSERT OR REPLACE deletes and inserts every row, rewriting all its indexes)
+
+    Input: table_name = the table to write
+           columns = the columns of the rows, in their order
+           conflict_keys = the unique keys of the table, a list of column lists (one ON CONFLICT clause each)
+           keep_null = a NULL value does not replace the stored value (rows of pages with missing fields)
+           select = a SELECT statement returning the rows, instead of the VALUES of one row
+    '''
+    statement = "INSERT INTO {0} ({1}) {2}".format(table_name, ", ".join(columns), select or "VALUES ({0})".format(",".join("?" * len(columns))))
+    for key in conflict_keys:
+        values = [name for name in columns if name not in key]
+        if not values:
+            statement += " ON CONFLICT ({0}) DO NOTHING".format(", ".join(key))
+            continue
+        if keep_null:
+            assignments = ["{0} = COALESCE(excluded.{0}, {0})".format(name) for name in values]
+            changes = ["(excluded.{0} IS NOT NULL AND excluded.{0} IS NOT {0})".format(name) for name in values]
+        else:
+            assignments = ["{0} = excluded.{0}".format(name) for name in values]
+            changes = ["excluded.{0} IS NOT {0}".format(name) for name in values]
+        statement += " ON CONFLICT ({0}) DO UPDATE SET {1} WHERE {2}".format(", ".join(key), ", ".join(assignments), " OR ".join(changes))
+    return statement
+
+
+
+class BulkWriter:
+    '''
+    Buffers the rows sent to the tables of a connection and writes them with
+    executemany in one large transaction every batch_size rows.
+    The schema of each table is created only the first time the table is used.
+    '''
+    def __init__(self, connection, batch_size = WRITE_BATCH_SIZE):
+        self.connection = connection
+        self.batch_size = batch_size
+        self.schemas = set()   # tables whose CREATE statements already ran
+        self.buffers = {}      # {insert statement : list of rows}
+        self.upserts = {}      # {upsert statement : table name}
+        self.rowid_keys = {}   # {table name : True when its INTEGER PRIMARY KEY is the rowid}
+        self.callbacks = []    # called once the buffered rows are committed
+        self.pending = 0
+
+    def ensure_schema(self, table_name, statements):
+        '''
+        Runs the CREATE statements of table_name the first time the table is used
+        '''
+        if table_name in self.schemas:
+            return
+        self.flush()
+        with self.connection:
+            for statement in statements + index_statements(table_name):
+                self.connection.execute(statement)
+        self.schemas.add(table_name)
+        log.debug("Table %s creation step completed", table_name)
+
+    def forget_schema(self, table_name):
+        ''' Makes the next write to table_name create it again (after a drop) '''
+        self.schemas.discard(table_name)
+
+    def add(self, statement, rows):
+        '''
+        Buffers rows for the insert statement and flushes when the batch is full
+        '''
+        self.buffers.setdefault(statement, []).extend(rows)
+        self.pending += len(rows)
+        if self.pending >= self.batch_size:
+            self.flush()
+
+    def upsert(self, table_name, columns, conflict_keys, rows, keep_null = False):
+        '''
+        Buffers rows for an upsert_statement(), the rows inserted, updated and left
+        unchanged are counted in the metrics when they are written
+        '''
+        statement = upsert_statement(table_name, columns, conflict_keys, keep_null)
+        self.upserts[statement] = table_name
+        self.add(statement, rows)
+
+    def after_flush(self, callback):
+        '''
+        Calls callback() once the rows buffered so far are committed (straight away if there are none)
+        '''
+        if self.pending:
+            self.callbacks.append(callback)
+        else:
+            callback()
+
+    def _insert_mark(self, table_name):
+        '''
+        Returns the mark _inserted_since() counts the new rows of a table from: its highest rowid
+        (new rows always get a higher one), or its row count when the rowid is the table's key
+        '''
+        if table_name not in self.rowid_keys:
+            keys = [(row[2] or "").upper() for row in self.connection.execute("PRAGMA table_info({0})".format(table_name)) if row[5]]
+            self.rowid_keys[table_name] = keys == ["INTEGER"]
+        if self.rowid_keys[table_name]:
+            return self.connection.execute("SELECT COUNT(*) FROM {0}".format(table_name)).fetchone()[0]
+        return self.connection.execute("SELECT COALESCE(MAX(rowid), 0) FROM {0}".format(table_name)).fetchone()[0]
+
+    def _inserted_since(self, table_name, mark):
+        if self.rowid_keys[table_name]:
+            return self.connection.execute("SELECT COUNT(*) FROM {0}".format(table_name)).fetchone()[0] - mark
+        return self.connection.execute("SELECT COUNT(*) FROM {0} WHERE rowid > ?".format(table_name), (mark,)).fetchone()[0]
+
+    def flush(self):
+        '''
+        Writes all the buffered rows in a single transaction. When it fails its rows are
+        rolled back and dropped with the callbacks waiting for them, which never fire.
+        '''
+        if not self.pending:
+            return
+        buffers, callbacks = self.buffers, self.callbacks
+        self.buffers, self.callbacks, self.pending = {}, [], 0
+        written = {}   # {statement : rows inserted or updated}
+        inserted = {}  # {upsert statement : rows inserted}
+        with mt.registry.timer("db_commit_seconds"), self.connection:
+            for statement, rows in buffers.items():
+                table_name = self.upserts.get(statement)
+                if table_name is not None:
+                    mark = self._insert_mark(table_name)
+                written[statement] = self.connection.executemany(statement, rows).rowcount
+                if table_name is not None:
+                    inserted[statement] = self._inserted_since(table_name, mark)
+        for statement, rows in buffers.items():
+            table_name = _statement_table.search(statement).group(1)
+            mt.registry.inc("db_rows_written_total", max(written[statement], 0), table = table_name)
+            if statement in inserted:
+                mt.registry.inc("db_upsert_rows_total", inserted[statement], table = table_name, result = "inserted")
+                mt.registry.inc("db_upsert_rows_total", written[statement] - inserted[statement], table = table_name, result = "updated")
+                mt.registry.inc("db_upsert_rows_total", len(rows) - written[statement], table = table_name, result = "unchanged")
+        for callback in callbacks:
+            callback()
+
+
+class BulkConnection(sqlite3.Connection):
+    ''' An sqlite3 connection carrying its own BulkWriter '''
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.writer = BulkWriter(self)
+
+
+def index_statements(table_name):
+    '''
+    Returns the CREATE INDEX statements declared for table_name in TABLE_INDEXES
+    '''
+    return ["CREATE {3}INDEX IF NOT EXISTS {0} ON {1} ({2})".format(index_name, table_name, ", ".join(columns), "UNIQUE " if unique else "")
+            for index_name, columns, unique in TABLE_INDEXES.get(table_name, [])]
+
+def create_indexes(connection, table_names = None):
+    '''
+    Creates the missing indexes of TABLE_INDEXES for the tables that exist in our DB
+    
+    Input: connection = the connection with the DB
+           table_names = the tables to index, all the tables of TABLE_INDEXES if None
+    '''
+    try:
+        flush(connection)
+        with connection:
+            existing = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            for table_name in (table_names or TABLE_INDEXES):
+                if table_name in existing:
+                    for statement in index_statements(table_name):
+                        connection.execute(statement)
+        log.info("Indexes created")
+    except sqlite3.Error as e:
+        log.error("Error info: %s", e.args[0])
+
+def explain_views(connection):
+    '''
+    Prints the EXPLAIN QUERY PLAN of every view in our DB, to check that the
+    view joins use indexes instead of full scans or automatic indexes
+    
+    Output: plans = a dictionary {view_name : list of plan lines}
+    '''
+    plans = {}
+    try:
+        flush(connection)
+        views = [row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'view' ORDER BY name")]
+        for view in views:
+            plans[view] = [row[3] for row in connection.execute('EXPLAIN QUERY PLAN SELECT * FROM "{0}"'.format(view))]
+            log.info("Query plan of %s:", view)
+            for line in plans[view]:
+                log.info("    %s", line)
+    except sqlite3.Error as e:
+        log.error("Error info: %s", e.args[0])
+    return plans
+
+def get_writer(connection):
+    '''
+    Returns the BulkWriter of a connection made by connect(). Other connections get
+    a writer that writes every call straight away, as before.
+    '''
+    writer = getattr(connection, "writer", None)
+    if writer is None:
+        writer = BulkWriter(connection, batch_size = 1)
+    return writer
 
 def connect(sqlite_file):
     ''' 
     Make connection to an SQLite database file 
     '''
-    connection = sqlite3.connect(sqlite_file)
+    connection = sqlite3.connect(sqlite_file, factory = BulkConnection)
     c = connection.cursor()
+    # WAL journal and relaxed syncing: commits no longer wait for an fsync of the whole DB
+    c.execute("PRAGMA journal_mode = WAL")
+    c.execute("PRAGMA synchronous = NORMAL")
+    c.execute("PRAGMA cache_size = -{0}".format(CACHE_SIZE_KB))
     return connection, c
 
+def flush(connection):
+    '''
+    Writes the rows buffered for a connection
+    '''
+    try:
+        get_writer(connection).flush()
+    except sqlite3.Error as e:
+        log.error("Error info: %s", e.args[0])
+
 def close(connection):
     ''' 
     Commit changes and close connection to the database 
     '''
-    # conn.commit()
+    flush(connection)
     connection.close()
 
 def drop_table(connection, table_name):
     try:
+        flush(connection)
+        get_writer(connection).forget_schema(table_name)
         with connection:
             connection.execute("DROP TABLE IF EXISTS {0}".format(table_name))
-        print ("Table {0} dropped successfully".format(table_name))
+        log.debug("Table %s dropped successfully", table_name)
     except sqlite3.Error as e:
-        print ("Error info:", e.args[0]) 
+        log.error("Error info: %s", e.args[0])
 
 def delete_table(connection, table_name):
     '''
@@ -39,12 +283,217 @@ def delete_table(connection, table_name):
     '''
     
     try:
+        flush(connection)
         with connection:
             connection.execute("DELETE FROM {0}".format(table_name))
-        print ("Table {0} deleted successfully".format(table_name))
+        log.debug("Table %s deleted successfully", table_name)
+    except sqlite3.Error as e:
+        log.error("Error info: %s", e.args[0])
+
+
+def stored_values(connection, table_name, column, where = None):
+    '''
+    Returns the set of distinct values of a column (in the rows matching the condition where),
+    empty if the table does not exist yet
+    '''
+    try:
+        flush(connection)
+        with connection:
+            rows = connection.execute("SELECT DISTINCT {1} FROM {0} WHERE {2}".format(table_name, column, where or "1")).fetchall()
+        return {row[0] for row in rows}
+    except sqlite3.OperationalError:
+        return set()
+
+def stored_records(connection, table_name, record, gameweek):
+    '''
+    Returns the rows of a gameweek as records (a records.py NamedTuple with the table's columns),
+    empty if the table does not exist yet
+    '''
+    try:
+        flush(connection)
+        with connection:
+            rows = connection.execute("SELECT {1} FROM {0} WHERE gameweek = ?".format(table_name, ", ".join(record._fields)), (gameweek,)).fetchall()
+        return [record._make(row) for row in rows]
+    except sqlite3.OperationalError:
+        return []
+
+def high_water_marks(connection, table_name, key_column, value_column):
+    '''
+    Returns the highest value_column stored for every key_column of a table
+    
+    Input: connection = the connection with the DB
+           table_name = the table to inspect
+           key_column = the column to group by (e.g. entry_id)
+           value_column = the column to take the maximum of (e.g. gameweek)
+    
+    Output: marks = a dictionary {key : max value}, empty if the table does not exist yet
+    '''
+    try:
+        flush(connection)
+        with connection:
+            rows = connection.execute("SELECT {1}, MAX({2}) FROM {0} GROUP BY {1}".format(table_name, key_column, value_column)).fetchall()
+        return dict(rows)
+    except sqlite3.OperationalError:
+        return {}
+
+def stage_mark(connection, stage, table_name = STAGE_MARKS_TABLE):
+    '''
+    Returns the last gameweek a stage downloaded once the gameweek was finished (its rows
+    never change again), None if the stage has no mark yet
+    '''
+    try:
+        flush(connection)
+        with connection:
+            row = connection.execute("SELECT gameweek FROM {0} WHERE stage = ?".format(table_name), (stage,)).fetchone()
+        return row[0] if row else None
+    except sqlite3.OperationalError:
+        return None
+
+def set_stage_mark(connection, stage, gameweek, table_name = STAGE_MARKS_TABLE):
+    '''
+    Records that a stage downloaded every gameweek up to gameweek after it was finished
+    '''
+    try:
+        get_writer(connection).ensure_schema(table_name, ["CREATE TABLE IF NOT EXISTS {0} (stage TEXT PRIMARY KEY, gameweek INTEGER, updated TEXT)".format(table_name)])
+        flush(connection)
+        with connection:
+            connection.execute("INSERT OR REPLACE INTO {0} VALUES (?, ?, datetime('now'))".format(table_name), (stage, gameweek))
+    except sqlite3.Error as e:
+        log.error("Error info: %s", e.args[0])
+
+def ledger_table(connection, table_name = LEDGER_TABLE):
+    '''
+    Creates the run ledger table. A unit of work is the download of one page, identified by
+    its endpoint and by the entry_id, gameweek and element it is about (0 when not relevant).
+    Its status is pending (planned), done (stored) or failed (download or processing failed).
+    '''
+    get_writer(connection).ensure_schema(table_name, ["CREATE TABLE IF NOT EXISTS {0} (endpoint TEXT, entry_id INTEGER, gameweek INTEGER, element INTEGER, status TEXT, attempts INTEGER, updated TEXT, PRIMARY KEY (endpoint, entry_id, gameweek, element))".format(table_name)])
+
+def ledger_start_run(connection, table_name = LEDGER_TABLE):
+    '''
+    Starts a run on our DB. When the last run did not finish, its ledger is kept so that its
+    stages resume where they stopped, otherwise the ledger is emptied for the new run.
+    
+    Output: True when the last run is resumed
+    '''
+    try:
+        ledger_table(connection, table_name)
+        flush(connection)
+        with connection:
+            row = connection.execute("SELECT status FROM {0} WHERE endpoint = ? AND entry_id = ? AND gameweek = ? AND element = ?".format(table_name), (RUN_ENDPOINT,) + STAGE_UNIT).fetchone()
+            resumed = row is not None and row[0] != "done"
+            if not resumed:
+                connection.execute("DELETE FROM {0}".format(table_name))
+            connection.execute("INSERT OR REPLACE INTO {0} VALUES (?, ?, ?, ?, 'running', 0, datetime('now'))".format(table_name), (RUN_ENDPOINT,) + STAGE_UNIT)
+        return resumed
+    except sqlite3.Error as e:
+        log.error("Error info: %s", e.args[0])
+        return False
+
+def ledger_finish_run(connection, table_name = LEDGER_TABLE):
+    '''
+    Marks the run as finished when all its stages finished without failed units,
+    otherwise as failed (the next run resumes it)
+    
+    Output: unfinished = the list of (endpoint, status) of the stages that did not finish
+    '''
+    try:
+        ledger_table(connection, table_name)
+        flush(connection)
+        with connection:
+            unfinished = connection.execute("SELECT endpoint, status FROM {0} WHERE entry_id = ? AND gameweek = ? AND element = ? AND endpoint != ? AND status != 'done'".format(table_name), STAGE_UNIT + (RUN_ENDPOINT,)).fetchall()
+            connection.execute("UPDATE {0} SET status = ?, updated = datetime('now') WHERE endpoint = ? AND entry_id = ? AND gameweek = ? AND element = ?".format(table_name),
+                               ("failed" if unfinished else "done", RUN_ENDPOINT) + STAGE_UNIT)
+        return unfinished
+    except sqlite3.Error as e:
+        log.error("Error info: %s", e.args[0])
+        return []
+
+def ledger_resume(connection, endpoint, table_name = LEDGER_TABLE):
+    '''
+    Returns the units recorded for endpoint by the current run
+    
+    Output: None when the stage has not started yet in this run, else a dictionary
+            {(entry_id, gameweek, element) : status} (the stage is resumed)
+    '''
+    try:
+        ledger_table(connection, table_name)
+        flush(connection)
+        with connection:
+            rows = connection.execute("SELECT entry_id, gameweek, element, status FROM {0} WHERE endpoint = ?".format(table_name), (endpoint,)).fetchall()
+        units = {tuple(row[:3]): row[3] for row in rows}
+        if STAGE_UNIT not in units:
+            return None
+        del units[STAGE_UNIT]
+        return units
+    except sqlite3.Error as e:
+        log.error("Error info: %s", e.args[0])
+        return None
+
+def ledger_stage(connection, endpoint, status = "running", table_name = LEDGER_TABLE):
+    '''
+    Sets the status of a whole stage: running when it starts, before any of its work (a run
+    stopped by a stage that fails early is not finished), failed when the stage raised
+    '''
+    try:
+        ledger_table(connection, table_name)
+        flush(connection)
+        with connection:
+            connection.execute("INSERT OR REPLACE INTO {0} VALUES (?, ?, ?, ?, ?, 0, datetime('now'))".format(table_name), (endpoint,) + STAGE_UNIT + (status,))
+    except sqlite3.Error as e:
+        log.error("Error info: %s", e.args[0])
+
+def ledger_plan(connection, endpoint, units, table_name = LEDGER_TABLE):
+    '''
+    Records the units a stage is about to download as pending (their attempts are counted)
+    and the stage as running
+    
+    Input: endpoint = the name of the stage's endpoint (e.g. picks)
+           units = a list of (entry_id, gameweek, element)
+    '''
+    try:
+        ledger_table(connection, table_name)
+        flush(connection)
+        with connection:
+            data = [(endpoint,) + tuple(unit) for unit in units]
+            connection.executemany("INSERT OR IGNORE INTO {0} VALUES (?, ?, ?, ?, 'pending', 0, NULL)".format(table_name), data)
+            connection.executemany("UPDATE {0} SET status = 'pending', attempts = attempts + 1, updated = datetime('now') WHERE endpoint = ? AND entry_id = ? AND gameweek = ? AND element = ?".format(table_name), data)
+            connection.execute("INSERT OR REPLACE INTO {0} VALUES (?, ?, ?, ?, 'running', 0, datetime('now'))".format(table_name), (endpoint,) + STAGE_UNIT)
+    except sqlite3.Error as e:
+        log.error("Error info: %s", e.args[0])
+
+def ledger_mark(connection, endpoint, units, status = "done", table_name = LEDGER_TABLE):
+    '''
+    Sets the status of units of endpoint. Buffered like the table rows, so a unit sent
+    to a DBWriter after its rows is only marked done together with them.
+    '''
+    try:
+        writer = get_writer(connection)
+        ledger_table(connection, table_name)
+        writer.add("UPDATE {0} SET status = ?, updated = datetime('now') WHERE endpoint = ? AND entry_id = ? AND gameweek = ? AND element = ?".format(table_name),
+                   [(status, endpoint) + tuple(unit) for unit in units])
     except sqlite3.Error as e:
-        print ("Error info:", e.args[0]) 
+        log.error("Error info: %s", e.args[0])
 
+def ledger_finish(connection, endpoint, table_name = LEDGER_TABLE):
+    '''
+    Closes a stage: its units still pending failed. The stage is done when no unit failed,
+    otherwise the next run retries its failed units.
+    
+    Output: failed = the list of (entry_id, gameweek, element) left unfetched
+    '''
+    try:
+        ledger_table(connection, table_name)
+        flush(connection)
+        with connection:
+            connection.execute("UPDATE {0} SET status = 'failed', updated = datetime('now') WHERE endpoint = ? AND status = 'pending'".format(table_name), (endpoint,))
+            failed = connection.execute("SELECT entry_id, gameweek, element FROM {0} WHERE endpoint = ? AND status = 'failed' ORDER BY entry_id, gameweek, element".format(table_name), (endpoint,)).fetchall()
+            connection.execute("UPDATE {0} SET status = ?, updated = datetime('now') WHERE endpoint = ? AND entry_id = ? AND gameweek = ? AND element = ?".format(table_name),
+                               ("failed" if failed else "done", endpoint) + STAGE_UNIT)
+        return failed
+    except sqlite3.Error as e:
+        log.error("Error info: %s", e.args[0])
+        return []
 
 def users_table(connection, entries, table_name):
     '''
@@ -55,15 +504,13 @@ def users_table(connection, entries, table_name):
            table_name = the name of the corresponding DB table
     '''    
     try:
-        with connection:
-            connection.execute("CREATE TABLE IF NOT EXISTS {0} (entry INTEGER PRIMARY KEY, player_name TEXT, total INTEGER)".format(table_name))
-        print ("Users' table creation step completed")    
+        writer = get_writer(connection)
+        writer.ensure_schema(table_name, ["CREATE TABLE IF NOT EXISTS {0} (entry INTEGER PRIMARY KEY, player_name TEXT, total INTEGER)".format(table_name)])
         data = [(entry,entry_info[0],entry_info[1]) for entry, entry_info in entries.items()]
-        with connection:
-            connection.executemany("INSERT OR REPLACE INTO {0} (entry, player_name, total) VALUES (?, ?, ?)".format(table_name), data)
-        print ("Users' table population step completed")
+        writer.upsert(table_name, ["entry", "player_name", "total"], [["entry"]], data)
+        log.debug("Users' table population step completed")
     except sqlite3.Error as e:
-        print ("Error info:", e.args[0])    
+        log.error("Error info: %s", e.args[0])
 
 def team_tokens_table(connection, entry_id, tokens, table_name):
     '''
@@ -75,17 +522,14 @@ def team_tokens_table(connection, entry_id, tokens, table_name):
            table_name = the name of the corresponding DB table
     '''
     try:
-        with connection:
-            connection.execute("CREATE TABLE IF NOT EXISTS {0} (entry_id INTEGER, gameweek INTEGER, token TEXT)".format(table_name))
-        with connection:
-            connection.execute("CREATE UNIQUE INDEX IF NOT EXISTS token_index ON {0} (entry_id , gameweek)".format(table_name))
-        print("Tokens table creation step completed")
+        writer = get_writer(connection)
+        writer.ensure_schema(table_name, ["CREATE TABLE IF NOT EXISTS {0} (entry_id INTEGER, gameweek INTEGER, token TEXT)".format(table_name),
+                                          "CREATE UNIQUE INDEX IF NOT EXISTS token_index ON {0} (entry_id , gameweek)".format(table_name)])
         data = [(entry_id, week, token) for chip_id, (token, week) in tokens.items()]
-        with connection:
-            connection.executemany("INSERT OR REPLACE INTO {0} (entry_id, gameweek, token) VALUES (?, ?, ?)".format(table_name), data)
-        print("Insertion for user:{0} finished".format(entry_id))
+        writer.upsert(table_name, ["entry_id", "gameweek", "token"], [["entry_id", "gameweek"]], data)
+        log.debug("Insertion for user:%s finished", entry_id)
     except sqlite3.Error as e:
-        print ("Error info:", e.args[0]) 
+        log.error("Error info: %s", e.args[0])
         
 def team_history_table(connection, entry_id, hist, table_name):
     '''
@@ -93,23 +537,21 @@ def team_history_table(connection, entry_id, hist, table_name):
     
     Input: connection = the connection object with the DB
            entry_id = the id of the user whose information were retrieve
-           hist = dictionary with the info about user's history (key=gameweek, value=dictionary with keys [points, points_on_bench, total_points
-                                                      gameweek_rank, overall_rank, week_transfers, week_transfers_cost, team_value, money_in_bank])
+           hist = list of records.TeamHistory with the user's history (gameweek, points, points_on_bench, total_points,
+                  gameweek_rank, overall_rank, week_transfers, week_transfers_cost, team_value, money_in_bank)
            table_name = the name of the table to store the data
     '''
-    column_names = ["points", "points_on_bench", "total_points", "gameweek_rank", "overall_rank", "week_transfers", "week_transfers_cost", "team_value", "money_in_bank"]
+    column_names = list(rec.TeamHistory._fields[1:])
     try:
         # create the table
-        with connection:
-            connection.execute("CREATE TABLE IF NOT EXISTS {0} (entry_id INTEGER, gameweek INTEGER, {1}, UNIQUE (entry_id, gameweek))".format(table_name, ", ".join(name+" INTEGER" for name in column_names)))
-        print("Team history table creation step completed")
+        writer = get_writer(connection)
+        writer.ensure_schema(table_name, ["CREATE TABLE IF NOT EXISTS {0} (entry_id INTEGER, gameweek INTEGER, {1}, UNIQUE (entry_id, gameweek))".format(table_name, ", ".join(name+" INTEGER" for name in column_names))])
         # data preparation
-        data = [(entry_id, gameweek, *[hist[gameweek][col] for col in column_names]) for gameweek in hist]
-        with connection:
-            connection.executemany("INSERT OR REPLACE INTO {0} (entry_id, gameweek, {1}) VALUES ({2})".format(table_name, ", ".join(name for name in column_names), ",".join(list("?"*(len(column_names)+2)))), data)
-        print("Insertion of team history for user:{0} finished".format(entry_id))    
+        data = [(entry_id, *record) for record in hist]
+        writer.upsert(table_name, ["entry_id", "gameweek"] + column_names, [["entry_id", "gameweek"]], data)
+        log.debug("Insertion of team history for user:%s finished", entry_id)
     except sqlite3.Error as e:
-        print ("Error info:", e.args[0])
+        log.error("Error info: %s", e.args[0])
         
 def transfer_history_table(connection, entry_id, transfers, table_name):
     '''
@@ -117,22 +559,21 @@ def transfer_history_table(connection, entry_id, transfers, table_name):
     
     Input: connection = the connection object with the DB
            entry_id = the id of the user whose information were retrieve
-           transfer = dictionary with the info about user's transfer history (key=gameweek, value=list of dictionaries with keys [player_in, player_out, cost_in, cost_out, date])
+           transfers = list of records.Transfer with the user's transfer history (gameweek, player_in, player_out, cost_in, cost_out, date)
            table_name = the name of the table to store the data
     '''
     column_names = [("player_in","INTEGER"), ("player_out","INTEGER"), ("cost_in","INTEGER"), ("cost_out","INTEGER"), ("date","TEXT")]
     try:
         # create the table
-        with connection:
-            connection.execute("CREATE TABLE IF NOT EXISTS {0} (entry_id INTEGER, gameweek INTEGER, {1}, UNIQUE (entry_id, gameweek, {2}))".format(table_name, ", ".join(name[0]+" "+ name[1] for name in column_names), ", ".join(name[0]+" " for name in column_names)))
-        print("Transfer history table creation step completed")
+        writer = get_writer(connection)
+        writer.ensure_schema(table_name, ["CREATE TABLE IF NOT EXISTS {0} (entry_id INTEGER, gameweek INTEGER, {1}, UNIQUE (entry_id, gameweek, {2}))".format(table_name, ", ".join(name[0]+" "+ name[1] for name in column_names), ", ".join(name[0]+" " for name in column_names))])
         # data preparation
-        data = [(entry_id, gameweek, *[transfer_line[col[0]] for col in column_names]) for gameweek, week_transf in transfers.items() for transfer_line in week_transf]
-        with connection:
-            connection.executemany("INSERT OR REPLACE INTO {0} (entry_id, gameweek, {1}) VALUES ({2})".format(table_name, ", ".join(name[0] for name in column_names), ",".join(list("?"*(len(column_names)+2)))), data)
-        print("Insertion of team transfer history for user:{0} finished".format(entry_id))    
+        data = [(entry_id, *record) for record in transfers]
+        # every column is in the key, a transfer already stored never changes
+        writer.upsert(table_name, ["entry_id", "gameweek"] + [name[0] for name in column_names], [["entry_id", "gameweek"] + [name[0] for name in column_names]], data)
+        log.debug("Insertion of team transfer history for user:%s finished", entry_id)
     except sqlite3.Error as e:
-        print ("Error info:", e.args[0])
+        log.error("Error info: %s", e.args[0])
         
 def gameweek_deadlines_table(connection, gameweek, deadline, table_name):
     '''
@@ -144,44 +585,34 @@ def gameweek_deadlines_table(connection, gameweek, deadline, table_name):
            table_name = the name of the corresponding DB table
     '''    
     try:
-        with connection:
-            connection.execute("CREATE TABLE IF NOT EXISTS {0} (gameweek INTEGER PRIMARY KEY, deadline TEXT)".format(table_name))
-        print("Deadline table creation step completed")
+        writer = get_writer(connection)
+        writer.ensure_schema(table_name, ["CREATE TABLE IF NOT EXISTS {0} (gameweek INTEGER PRIMARY KEY, deadline TEXT)".format(table_name)])
         data = [(gameweek, deadline)]
-        with connection:
-            connection.executemany("INSERT OR IGNORE INTO {0} (gameweek, deadline) VALUES (?, ?)".format(table_name), data)
-        print("Deadline record step completed")
+        writer.upsert(table_name, ["gameweek", "deadline"], [["gameweek"]], data)
+        log.debug("Deadline record step completed")
     except sqlite3.Error as e:
-        print ("Error info:", e.args[0])          
+        log.error("Error info: %s", e.args[0])
 
 def player_performance_table(connection, stats_dict, table_name):
     '''
     Creates and populates an sql3 table with the performance of each gameweek in FPL league
     
     Input: connection = the connection object with the DB
-           stats_dict = the dictionary with the player performance
+           stats_dict = the list of records.PlayerFixture with the player performance (titles missing
+                        from a page, e.g. in rows of the live pages, are None and stored as NULL)
            table_name = the name of the corresponding DB table
     '''
-    column_names = [("id","INTEGER"),("team_h_score","INTEGER"),("team_a_score","INTEGER"),("was_home","INTEGER"),("round","INTEGER"),("total_points","INTEGER"),
-                   ("value","INTEGER"),("transfers_balance","INTEGER"),("selected","INTEGER"),("transfers_in","INTEGER"),("transfers_out","INTEGER"),("loaned_in","INTEGER"),
-                   ("loaned_out","INTEGER"),("minutes","INTEGER"),("goals_scored","INTEGER"),("assists","INTEGER"),("clean_sheets","INTEGER"),("goals_conceded","INTEGER"),
-                   ("own_goals","INTEGER"),("penalties_saved","INTEGER"),("penalties_missed","INTEGER"),("yellow_cards","INTEGER"),("red_cards","INTEGER"),("saves","INTEGER"),
-                   ("bonus","INTEGER"),("bps","INTEGER"),("influence","REAL"),("creativity","REAL"),("threat","REAL"),("ict_index","REAL"),("ea_index","INTEGER"),("open_play_crosses","INTEGER"),
-                   ("big_chances_created","INTEGER"),("clearances_blocks_interceptions","INTEGER"),("recoveries","INTEGER"),("key_passes","INTEGER"),("tackles","INTEGER"),
-                   ("winning_goals","INTEGER"),("attempted_passes","INTEGER"),("completed_passes","INTEGER"),("penalties_conceded","INTEGER"),("big_chances_missed","INTEGER"),
-                   ("errors_leading_to_goal","INTEGER"),("errors_leading_to_goal_attempt","INTEGER"),("tackled","INTEGER"),("offside","INTEGER"),("target_missed","INTEGER"),
-                   ("fouls","INTEGER"),("dribbles","INTEGER"),("element","INTEGER"),("fixture","INTEGER"),("opponent_team","INTEGER")]        
+    column_names = rec.PLAYER_FIXTURE_COLUMNS
     try:
-        with connection:
-            # we add in the primary key the ict_index to overcome potential double gameweek issues with the table. needs to be revised in case of issues
-            connection.execute("CREATE TABLE IF NOT EXISTS {0} ({1}, UNIQUE(id) )".format(table_name, ", ".join(name[0]+" "+ name[1] for name in column_names)))
-        print("Performance table creation step completed")
-        data = [tuple(info[name[0]] for name in column_names) for info in stats_dict]
-        with connection:
-            connection.executemany("INSERT OR IGNORE INTO {0} ({1}) VALUES ({2})".format(table_name, ", ".join(name[0] for name in column_names), ",".join(list("?"*(len(column_names))))), data)
-        print("Performance for player {0} added successfully".format(stats_dict[0]["element"]))
+        writer = get_writer(connection)
+        # we add in the primary key the ict_index to overcome potential double gameweek issues with the table. needs to be revised in case of issues
+        writer.ensure_schema(table_name, ["CREATE TABLE IF NOT EXISTS {0} ({1}, UNIQUE(id) )".format(table_name, ", ".join(name[0]+" "+ name[1] for name in column_names))])
+        data = stats_dict
+        # corrected stats update the stored fixture, the titles missing from a live page keep their stored value
+        writer.upsert(table_name, [name[0] for name in column_names], [["id"], ["element", "fixture"]], data, keep_null = True)
+        log.debug("Performance of %s player fixtures added successfully", len(stats_dict))
     except sqlite3.Error as e:
-        print ("Error info:", e.args[0])      
+        log.error("Error info: %s", e.args[0])
 
 def player_position_lookup_table(connection, player_positions, table_name):
     '''
@@ -196,16 +627,14 @@ def player_position_lookup_table(connection, player_positions, table_name):
     column_names = list(zip(json_titles, column_types))
     try:
         # create the table
-        with connection:
-            connection.execute("CREATE TABLE IF NOT EXISTS {0} ({1}, UNIQUE (id))".format(table_name, ", ".join(name[0]+" "+ name[1] for name in column_names)))
-        print("Player position lookup table creation step completed")
+        writer = get_writer(connection)
+        writer.ensure_schema(table_name, ["CREATE TABLE IF NOT EXISTS {0} ({1}, UNIQUE (id))".format(table_name, ", ".join(name[0]+" "+ name[1] for name in column_names))])
         # data preparation
         data = [tuple(info[title] for title in json_titles) for info in player_positions]
-        with connection:
-            connection.executemany("INSERT OR REPLACE INTO {0} ({1}) VALUES ({2})".format(table_name, ", ".join(name[0] for name in column_names), ",".join(list("?"*(len(column_names))))), data)
-        print("Insertion of player positions finished")    
+        writer.upsert(table_name, [name[0] for name in column_names], [["id"]], data)
+        log.debug("Insertion of player positions finished")
     except sqlite3.Error as e:
-        print ("Error info:", e.args[0])
+        log.error("Error info: %s", e.args[0])
 
 def teams_lookup_table(connection, teams, table_name):
     '''
@@ -220,16 +649,14 @@ def teams_lookup_table(connection, teams, table_name):
     column_names = list(zip(json_titles, column_types))
     try:
         # create the table
-        with connection:
-            connection.execute("CREATE TABLE IF NOT EXISTS {0} ({1}, UNIQUE (id))".format(table_name, ", ".join(name[0]+" "+ name[1] for name in column_names)))
-        print("Team lookup table creation step completed")
+        writer = get_writer(connection)
+        writer.ensure_schema(table_name, ["CREATE TABLE IF NOT EXISTS {0} ({1}, UNIQUE (id))".format(table_name, ", ".join(name[0]+" "+ name[1] for name in column_names))])
         # data preparation
         data = [tuple(info[title] for title in json_titles) for info in teams]
-        with connection:
-            connection.executemany("INSERT OR REPLACE INTO {0} ({1}) VALUES ({2})".format(table_name, ", ".join(name[0] for name in column_names), ",".join(list("?"*(len(column_names))))), data)
-        print("Insertion of teams finished")    
+        writer.upsert(table_name, [name[0] for name in column_names], [["id"]], data)
+        log.debug("Insertion of teams finished")
     except sqlite3.Error as e:
-        print ("Error info:", e.args[0])
+        log.error("Error info: %s", e.args[0])
 
 def stats_lookup_table(connection, stats_lookup, table_name):
     '''
@@ -244,16 +671,14 @@ def stats_lookup_table(connection, stats_lookup, table_name):
     column_names = list(zip(json_titles, column_types))
     try:
         # create the table
-        with connection:
-            connection.execute("CREATE TABLE IF NOT EXISTS {0} ({1}, UNIQUE (stat_name))".format(table_name, ", ".join(name[0]+" "+ name[1] for name in column_names)))
-        print("Stats lookup table creation step completed")
+        writer = get_writer(connection)
+        writer.ensure_schema(table_name, ["CREATE TABLE IF NOT EXISTS {0} ({1}, UNIQUE (stat_name))".format(table_name, ", ".join(name[0]+" "+ name[1] for name in column_names))])
         # data preparation
         data = [(info["key"],info["name"]) for info in stats_lookup]
-        with connection:
-            connection.executemany("INSERT OR REPLACE INTO {0} ({1}) VALUES ({2})".format(table_name, ", ".join(name[0] for name in column_names), ",".join(list("?"*(len(column_names))))), data)
-        print("Insertion of stats finished")    
+        writer.upsert(table_name, [name[0] for name in column_names], [["stat_name"]], data)
+        log.debug("Insertion of stats finished")
     except sqlite3.Error as e:
-        print ("Error info:", e.args[0])
+        log.error("Error info: %s", e.args[0])
 
 def player_lookup_table(connection, player_lookup, table_name):
     '''
@@ -268,16 +693,14 @@ def player_lookup_table(connection, player_lookup, table_name):
     column_names = list(zip(json_titles, column_types))
     try:
         # create the table
-        with connection:
-            connection.execute("CREATE TABLE IF NOT EXISTS {0} ({1}, UNIQUE (id))".format(table_name, ", ".join(name[0]+" "+ name[1] for name in column_names)))
-        print("Player lookup table creation step completed")
+        writer = get_writer(connection)
+        writer.ensure_schema(table_name, ["CREATE TABLE IF NOT EXISTS {0} ({1}, UNIQUE (id))".format(table_name, ", ".join(name[0]+" "+ name[1] for name in column_names))])
         # data preparation
         data = [tuple(info[title] for title in json_titles) for info in player_lookup]
-        with connection:
-            connection.executemany("INSERT OR REPLACE INTO {0} ({1}) VALUES ({2})".format(table_name, ", ".join(name[0] for name in column_names), ",".join(list("?"*(len(column_names))))), data)
-        print("Insertion of players info finished")    
+        writer.upsert(table_name, [name[0] for name in column_names], [["id"]], data)
+        log.debug("Insertion of players info finished")
     except sqlite3.Error as e:
-        print ("Error info:", e.args[0])
+        log.error("Error info: %s", e.args[0])
 
 def user_gameweek_picks_table(connection, gameweek, entry_id, picks, table_name):
     '''
@@ -286,24 +709,22 @@ def user_gameweek_picks_table(connection, gameweek, entry_id, picks, table_name)
     Input: connection = the connection object with the DB
            gameweek = the current game week
            entry_id = the user's fpl entry id
-           picks = a list of dictionaries with the picks for gameweek
+           picks = a list of records.Pick with the picks for gameweek
            table_name = the name of the table to store the data
     '''
-    json_titles = sorted(picks[0].keys())
+    json_titles = rec.Pick._fields
     column_types = ["INTEGER" for i in range(len(json_titles))]
     column_names = list(zip(json_titles, column_types))
     try:
         # create the table
-        with connection:
-            connection.execute("CREATE TABLE IF NOT EXISTS {0} (entry_id INTEGER, gameweek INTEGER, {1}, PRIMARY KEY(entry_id, gameweek, position))".format(table_name, ", ".join(name[0]+" "+ name[1] for name in column_names)))
-        print("User picks table creation step completed")
+        writer = get_writer(connection)
+        writer.ensure_schema(table_name, ["CREATE TABLE IF NOT EXISTS {0} (entry_id INTEGER, gameweek INTEGER, {1}, PRIMARY KEY(entry_id, gameweek, position))".format(table_name, ", ".join(name[0]+" "+ name[1] for name in column_names))])
         # data preparation
-        data = [(entry_id, gameweek, *[info[title] for title in json_titles]) for info in picks]
-        with connection:
-            connection.executemany("INSERT OR REPLACE INTO {0} (entry_id, gameweek, {1}) VALUES ({2})".format(table_name, ", ".join(name[0] for name in column_names), ",".join(list("?"*(len(column_names) + 2)))), data)
-        print("Insertion of picks for gameweek {0} for player {1} finished successfully".format(gameweek, entry_id))
+        data = [(entry_id, gameweek, *record) for record in picks]
+        writer.upsert(table_name, ["entry_id", "gameweek"] + [name[0] for name in column_names], [["entry_id", "gameweek", "position"]], data)
+        log.debug("Insertion of picks for gameweek %s for player %s finished successfully", gameweek, entry_id)
     except sqlite3.Error as e:
-        print ("Error info:", e.args[0])
+        log.error("Error info: %s", e.args[0])
 
 def user_gameweek_auto_subs_table(connection, gameweek, entry_id, subs, table_name):
     '''
@@ -312,38 +733,178 @@ def user_gameweek_auto_subs_table(connection, gameweek, entry_id, subs, table_na
     Input: connection = the connection object with the DB
            gameweek = the current game week
            entry_id = the user's fpl entry id
-           picks = a list of dictionaries with the auto subs that occured
+           subs = a list of records.AutoSub with the auto subs that occured
            table_name = the name of the table to store the data
     '''
-    json_titles = sorted(subs[0].keys())
+    json_titles = rec.AutoSub._fields
     column_types = ["INTEGER" for i in range(len(json_titles))]
     column_names = list(zip(json_titles, column_types))
     try:
         # create the table
-        with connection:
-            connection.execute("CREATE TABLE IF NOT EXISTS {0} (entry_id INTEGER, gameweek INTEGER, {1}, UNIQUE(id))".format(table_name, ", ".join(name[0]+" "+ name[1] for name in column_names)))
-        print("User auto subs table creation step completed")
+        writer = get_writer(connection)
+        writer.ensure_schema(table_name, ["CREATE TABLE IF NOT EXISTS {0} (entry_id INTEGER, gameweek INTEGER, {1}, UNIQUE(id))".format(table_name, ", ".join(name[0]+" "+ name[1] for name in column_names))])
         # data preparation
-        data = [(entry_id, gameweek,*[info[title] for title in json_titles]) for info in subs]
-        with connection:
-            connection.executemany("INSERT OR IGNORE INTO {0} (entry_id, gameweek, {1}) VALUES ({2})".format(table_name, ", ".join(name[0] for name in column_names), ",".join(list("?"*(len(column_names) + 2)))), data)
-        print("Insertion of auto subs for gameweek {0} for player {1} finished successfully".format(gameweek, entry_id))
+        data = [(entry_id, gameweek, *record) for record in subs]
+        writer.upsert(table_name, ["entry_id", "gameweek"] + [name[0] for name in column_names], [["id"]], data)
+        log.debug("Insertion of auto subs for gameweek %s for player %s finished successfully", gameweek, entry_id)
+    except sqlite3.Error as e:
+        log.error("Error info: %s", e.args[0])
+
+
+def live_team_points_table(connection, rows, table_name):
+    '''
+    Creates and populates an sql3 table with the live points of the teams in the gameweek in play
+    
+    Input: connection = the connection object with the DB
+           rows = a list of records.LiveTeamPoints (only the teams whose points changed)
+           table_name = the name of the table to store the data
+    '''
+    column_names = rec.LiveTeamPoints._fields
+    try:
+        writer = get_writer(connection)
+        writer.ensure_schema(table_name, ["CREATE TABLE IF NOT EXISTS {0} ({1}, updated_at TEXT, PRIMARY KEY(entry_id, gameweek))".format(table_name, ", ".join(name+" INTEGER" for name in column_names))])
+        writer.add("INSERT OR REPLACE INTO {0} ({1}, updated_at) VALUES ({2}, datetime('now'))".format(table_name, ", ".join(column_names), ",".join(list("?"*len(column_names)))), rows)
+        log.debug("Live points of %s teams updated", len(rows))
+    except sqlite3.Error as e:
+        log.error("Error info: %s", e.args[0])
+
+def live_player_points_table(connection, rows, table_name):
+    '''
+    Creates and populates an sql3 table with the live minutes and points of the players in the gameweek in play
+    
+    Input: connection = the connection object with the DB
+           rows = a list of records.LivePlayerPoints (only the players whose points changed)
+           table_name = the name of the table to store the data
+    '''
+    column_names = rec.LivePlayerPoints._fields
+    try:
+        writer = get_writer(connection)
+        writer.ensure_schema(table_name, ["CREATE TABLE IF NOT EXISTS {0} ({1}, PRIMARY KEY(gameweek, element))".format(table_name, ", ".join(name+" INTEGER" for name in column_names))])
+        writer.add("INSERT OR REPLACE INTO {0} ({1}) VALUES ({2})".format(table_name, ", ".join(column_names), ",".join(list("?"*len(column_names)))), rows)
+        log.debug("Live points of %s players updated", len(rows))
+    except sqlite3.Error as e:
+        log.error("Error info: %s", e.args[0])
+
+def unique_keys(connection, table_name, schema = "main"):
+    '''
+    Returns the unique keys of a table (its primary key and UNIQUE constraints and indexes),
+    a list of column lists
+    '''
+    keys = []
+    primary_key = sorted((row[5], row[1]) for row in connection.execute("PRAGMA {0}.table_info({1})".format(schema, table_name)) if row[5])
+    if primary_key:
+        keys.append([name for position, name in primary_key])
+    for row in connection.execute("PRAGMA {0}.index_list({1})".format(schema, table_name)).fetchall():
+        if row[2] and not row[4]:
+            key = [column[2] for column in connection.execute("PRAGMA {0}.index_info({1})".format(schema, row[1]))]
+            if key not in keys:
+                keys.append(key)
+    return keys
+
+def copy_shared_tables(connection, shared_dbase, table_names, gameweek_columns = None):
+    '''
+    Updates tables of our DB to a copy of the same tables in another DB file.
+    SQLite views can not reference attached databases, so the league independent tables
+    are copied locally instead. The rows are upserted on the tables' unique keys and only
+    the changed ones are written. A table is copied whole when it is new, its schema changed
+    or rows were deleted from the other DB.
+    
+    Input: connection = the connection with the DB
+           shared_dbase = the file of the DB holding the shared tables
+           table_names = the tables to copy
+           gameweek_columns = a dictionary {table name : its gameweek column} of the tables
+                              whose changed gameweeks are returned
+    
+    Output: changed = a dictionary {table name : set of the gameweeks of its rows written}
+            for the tables of gameweek_columns, None for a table copied whole.
+            None when the tables could not be copied
+    '''
+    gameweek_columns = gameweek_columns or {}
+    changed = {}
+    try:
+        flush(connection)
+        connection.execute("ATTACH DATABASE ? AS shared", (shared_dbase,))
+        try:
+            with connection:
+                for table_name in table_names:
+                    schema = connection.execute("SELECT sql FROM shared.sqlite_master WHERE type = 'table' AND name = ?", (table_name,)).fetchone()
+                    if schema is None:
+                        log.warning("Table %s not found in %s", table_name, shared_dbase)
+                        continue
+                    local = connection.execute("SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?", (table_name,)).fetchone()
+                    keys = unique_keys(connection, table_name) if local is not None else []
+                    if local == schema and keys:
+                        columns = [row[1] for row in connection.execute("PRAGMA shared.table_info({0})".format(table_name))]
+                        # WHERE true: an upsert's SELECT needs a WHERE clause to parse its ON CONFLICT
+                        select = "SELECT {1} FROM shared.{0} WHERE true".format(table_name, ", ".join(columns))
+                        # the rows inserted or updated are returned, the unchanged ones are not
+                        written = connection.execute(upsert_statement("main." + table_name, columns, keys, select = select) +
+                                                     " RETURNING {0}".format(gameweek_columns.get(table_name, "1"))).fetchall()
+                        # every row of the other DB is now here, the counts differ when some were deleted there
+                        counts = connection.execute("SELECT (SELECT COUNT(*) FROM main.{0}), (SELECT COUNT(*) FROM shared.{0})".format(table_name)).fetchone()
+                        if counts[0] == counts[1]:
+                            mt.registry.inc("db_rows_written_total", len(written), table = table_name)
+                            if table_name in gameweek_columns:
+                                changed[table_name] = {row[0] for row in written}
+                            log.debug("Table %s updated, %s rows changed", table_name, len(written))
+                            continue
+                    connection.execute("DROP TABLE IF EXISTS main.{0}".format(table_name))
+                    get_writer(connection).forget_schema(table_name)
+                    connection.execute(schema[0])
+                    connection.execute("INSERT INTO main.{0} SELECT * FROM shared.{0}".format(table_name))
+                    for statement in index_statements(table_name):
+                        connection.execute(statement)
+                    if table_name in gameweek_columns:
+                        changed[table_name] = None
+                    log.debug("Table %s copied successfully", table_name)
+        finally:
+            connection.execute("DETACH DATABASE shared")
+        return changed
     except sqlite3.Error as e:
-        print ("Error info:", e.args[0])
+        log.error("Error info: %s", e.args[0])
+
 
+def refresh_summaries(connection, file, refresh_keys = None):
+    '''
+    Creates the materialized summary tables of the script file and refreshes their rows
+    
+    Input: connection = the connection with the DB
+           file = the summaries script (DB_Summaries.sql)
+           refresh_keys = list of (entry_id, gameweek) pairs touched by the last sync,
+                          entry_id None refreshes every entry of that gameweek.
+                          None refreshes every gameweek in the DB
+    '''
+    try:
+        flush(connection)
+        with open(file, 'r') as f:
+            qry = f.read().strip()
+        with connection:
+            connection.execute("DROP TABLE IF EXISTS temp.summary_refresh")
+            connection.execute("CREATE TEMP TABLE summary_refresh (entry_id INTEGER, gameweek INTEGER)")
+            if refresh_keys is None:
+                connection.execute("INSERT INTO summary_refresh SELECT DISTINCT NULL, gameweek FROM userTeamHistory")
+            else:
+                connection.executemany("INSERT INTO summary_refresh (entry_id, gameweek) VALUES (?, ?)", refresh_keys)
+        connection.executescript(qry)
+        log.info("Summary tables refreshed")
+    except sqlite3.Error as e:
+        log.error("Error info: %s", e.args[0])
+        if connection.in_transaction:
+            connection.rollback()
 
 def create_views(connection, file):
     '''
     Reads the file at Desktop-Games-FPL-fpl crawler and creates the corresponding Views
     '''
     try:
+        flush(connection)
         with open(file, 'r') as f:
             qry = f.read().strip()
         with connection:
             connection.executescript(qry)
-        print("Views created")
+        log.info("Views created")
     except sqlite3.Error as e:
-        print ("Error info:", e.args[0])    
+        log.error("Error info: %s", e.args[0])
 
 #c.close()
 #conn.close()
\ No newline at end of file
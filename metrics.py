@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+Fantasy Premier League 2017-2018 scraper
+
+@author: Theodoros Panagiotakos
+"""
+
+import bisect
+import json
+import threading
+import time
+from contextlib import contextmanager
+import params
+
+
+LATENCY_BUCKETS = params.METRICS_LATENCY_BUCKETS
+
+
+class Histogram:
+    '''
+    Counts of the observed values per bucket (upper bounds), with their sum and count
+    '''
+    def __init__(self, buckets = LATENCY_BUCKETS):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        ''' Returns [(upper bound, observations up to it)], the last bound is "+Inf" '''
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + ["+Inf"], self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class Metrics:
+    '''
+    Thread safe registry of the counters and histograms of a run. A metric is identified by
+    its name and its labels, e.g. inc("fpl_requests_total", endpoint = "/drf/entry/{id}/history", status = 200)
+    '''
+    def __init__(self, buckets = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started = time.time()
+            self.counters = {}     # {(name, labels) : value}
+            self.histograms = {}   # {(name, labels) : Histogram}
+
+    def inc(self, name, value = 1, **labels):
+        ''' Adds value to a counter '''
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        ''' Records value (e.g. a latency in seconds) in a histogram '''
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram(self.buckets)
+            self.histograms[key].observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        ''' Records the seconds spent in the with block in a histogram '''
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def total(self, name):
+        ''' Returns the sum of a counter over all its labels '''
+        with self.lock:
+            return sum(value for (counter, labels), value in self.counters.items() if counter == name)
+
+    def pivot(self, name, row_label, column_label):
+        '''
+        Returns a counter summed by two of its labels, e.g. pivot("db_upsert_rows_total", "table", "result")
+
+        Output: a dictionary {row label value : {column label value : value}}
+        '''
+        result = {}
+        with self.lock:
+            for (counter, labels), value in self.counters.items():
+                if counter == name:
+                    labels = dict(labels)
+                    row = result.setdefault(labels.get(row_label), {})
+                    row[labels.get(column_label)] = row.get(labels.get(column_label), 0) + value
+        return result
+
+    def merge(self, report):
+        '''
+        Adds the metrics of a report() of another process (e.g. a league worker) to this registry
+        '''
+        with self.lock:
+            for counter in report["counters"]:
+                key = (counter["name"], tuple(sorted(counter["labels"].items())))
+                self.counters[key] = self.counters.get(key, 0) + counter["value"]
+            for merged in report["histograms"]:
+                key = (merged["name"], tuple(sorted(merged["labels"].items())))
+                if key not in self.histograms:
+                    self.histograms[key] = Histogram(self.buckets)
+                histogram = self.histograms[key]
+                previous = 0
+                for i, (bound, count) in enumerate(merged["buckets"]):
+                    histogram.counts[i] += count - previous
+                    previous = count
+                histogram.sum += merged["sum"]
+                histogram.count += merged["count"]
+
+    def report(self):
+        '''
+        Output: the metrics as a dictionary (the json run report)
+        '''
+        with self.lock:
+            return {"started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+                    "seconds": time.time() - self.started,
+                    "counters": [{"name": name, "labels": dict(labels), "value": value}
+                                 for (name, labels), value in sorted(self.counters.items(), key = str)],
+                    "histograms": [{"name": name, "labels": dict(labels), "count": histogram.count, "sum": histogram.sum,
+                                    "buckets": [[bound, count] for bound, count in histogram.cumulative()]}
+                                   for (name, labels), histogram in sorted(self.histograms.items(), key = lambda item: str(item[0]))]}
+
+    def prometheus(self):
+        '''
+        Output: the metrics in the Prometheus text exposition format
+        '''
+        lines = []
+        with self.lock:
+            typed = set()
+            for (name, labels), value in sorted(self.counters.items(), key = str):
+                if name not in typed:
+                    lines.append("# TYPE {0} counter".format(name))
+                    typed.add(name)
+                lines.append("{0}{1} {2}".format(name, _labels(labels), value))
+            for (name, labels), histogram in sorted(self.histograms.items(), key = lambda item: str(item[0])):
+                if name not in typed:
+                    lines.append("# TYPE {0} histogram".format(name))
+                    typed.add(name)
+                for bound, count in histogram.cumulative():
+                    lines.append("{0}_bucket{1} {2}".format(name, _labels(labels + (("le", bound),)), count))
+                lines.append("{0}_sum{1} {2}".format(name, _labels(labels), histogram.sum))
+                lines.append("{0}_count{1} {2}".format(name, _labels(labels), histogram.count))
+        return "\n".join(lines) + "\n"
+
+    def write(self, report_file = None, prometheus_file = None, extra = None):
+        '''
+        Writes the json run report (with the entries of the extra dictionary) and/or the Prometheus text file
+        '''
+        if report_file:
+            report = self.report()
+            report.update(extra or {})
+            with open(report_file, "w") as f:
+                json.dump(report, f, indent = 1)
+        if prometheus_file:
+            with open(prometheus_file, "w") as f:
+                f.write(self.prometheus())
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = [(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for name, value in labels]
+    return "{" + ",".join('{0}="{1}"'.format(name, value) for name, value in escaped) + "}"
+
+
+# The metrics of the current run, shared by all the modules
+registry = Metrics()
@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+"""
+Fantasy Premier League 2017-2018 scraper
+
+@author: Theodoros Panagiotakos
+"""
+
+# Local stand-in for the FPL api, serving a synthetic season so that fpl_info.py can be
+# benchmarked and tested without touching the live site (see benchmark.py).
+# Run it with "python mock_server.py --managers 1000" and set FPL_URL in params.py to the url it prints.
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+
+MOCK_LEAGUE_ID = 80757
+TEAMS = 20
+POSITIONS = [(1, "Goalkeeper"), (2, "Defender"), (3, "Midfielder"), (4, "Forward")]
+# Titles of the element-summary "history" rows
+PERFORMANCE_TITLES = ["total_points","value","transfers_balance","selected","transfers_in","transfers_out","loaned_in","loaned_out",
+                      "minutes","goals_scored","assists","clean_sheets","goals_conceded","own_goals","penalties_saved","penalties_missed",
+                      "yellow_cards","red_cards","saves","bonus","bps","ea_index","open_play_crosses","big_chances_created",
+                      "clearances_blocks_interceptions","recoveries","key_passes","tackles","winning_goals","attempted_passes",
+                      "completed_passes","penalties_conceded","big_chances_missed","errors_leading_to_goal",
+                      "errors_leading_to_goal_attempt","tackled","offside","target_missed","fouls","dribbles"]
+# Titles of the live page "stats" of a player
+LIVE_TITLES = ["minutes","goals_scored","assists","clean_sheets","goals_conceded","own_goals","penalties_saved","penalties_missed",
+               "yellow_cards","red_cards","saves","bonus","bps","influence","creativity","threat","ict_index","total_points"]
+# Titles of the live page "explain" of a player
+EXPLAIN_TITLES = ["minutes","goals_scored","assists","bonus"]
+# Match minutes (of the live clock) at which the two halves of the fixtures of a live gameweek kick off
+KICKOFFS = [0, 105]
+# Managers in the game, bootstrap-static gives the share of them who selected each player
+TOTAL_PLAYERS = 5000000
+
+
+class MockSeason:
+    '''
+    Synthetic FPL season: classic leagues of managers (ids MOCK_LEAGUE_ID, MOCK_LEAGUE_ID + 1, ...),
+    the players of 20 teams and 10 fixtures per gameweek. Every page is generated on request from a random generator seeded with the
+    page's key, so the same page always has the same content and nothing is held in memory.
+    '''
+    def __init__(self, managers = 50, players = 300, gameweeks = 10, page_size = 50, league_id = MOCK_LEAGUE_ID, seed = 1, leagues = 1):
+        self.managers = managers
+        self.players = players
+        self.gameweeks = gameweeks
+        self.page_size = page_size
+        self.league_id = league_id
+        self.league_ids = [league_id + k for k in range(leagues)]
+        self.seed = seed
+        # the last gameweek is finished until play_live() is called
+        self.live_started = None
+        self.live_speed = 0.0
+        self.live_minute = 0.0
+
+    def play_live(self, speed = 1.0, minute = 0.0):
+        '''
+        Plays the last gameweek live: its fixtures kick off at the KICKOFFS minutes of a clock
+        starting at minute and advancing speed match minutes per second (0 stops it), and the
+        live page shows the stats of the minutes played so far
+        '''
+        self.live_started = time.time()
+        self.live_speed = speed
+        self.live_minute = minute
+
+    def live_clock(self, gameweek):
+        ''' The minute of the live clock, None when gameweek is finished '''
+        if self.live_started is None or gameweek != self.gameweeks:
+            return None
+        return self.live_minute + (time.time() - self.live_started) * self.live_speed
+
+    def entries(self, league_id):
+        ''' The managers of a league '''
+        first = 1000 + (league_id - self.league_id) * self.managers
+        return list(range(first, first + self.managers))
+
+    def is_entry(self, entry):
+        return 1000 <= entry < 1000 + len(self.league_ids) * self.managers
+
+    def _random(self, *key):
+        return random.Random("{0}/{1}".format(self.seed, "/".join(str(part) for part in key)))
+
+    def team(self, element_id):
+        return 1 + element_id % TEAMS
+
+    def fixtures(self, gameweek):
+        ''' The 10 fixtures of a gameweek, every team plays once '''
+        r = self._random("fixtures", gameweek)
+        teams = list(range(1, TEAMS + 1))
+        r.shuffle(teams)
+        clock = self.live_clock(gameweek)
+        fixtures = []
+        for k in range(TEAMS // 2):
+            fixture = {"id": (gameweek - 1) * TEAMS // 2 + k + 1, "event": gameweek,
+                       "team_h": teams[2 * k], "team_a": teams[2 * k + 1],
+                       "team_h_score": r.randint(0, 4), "team_a_score": r.randint(0, 4),
+                       "started": True, "finished": True, "minutes": 90}
+            if clock is not None:
+                kickoff = KICKOFFS[k % len(KICKOFFS)]
+                fixture.update({"started": clock >= kickoff, "finished": clock >= kickoff + 90,
+                                "minutes": int(max(0, min(90, clock - kickoff)))})
+            fixtures.append(fixture)
+        return fixtures
+
+    def performance(self, element_id, gameweek):
+        ''' The element-summary "history" rows of a player for a gameweek '''
+        team = self.team(element_id)
+        rows = []
+        for fixture in self.fixtures(gameweek):
+            if team not in (fixture["team_h"], fixture["team_a"]):
+                continue
+            r = self._random("performance", element_id, fixture["id"])
+            was_home = fixture["team_h"] == team
+            row = {title: r.randint(0, 3) for title in PERFORMANCE_TITLES}
+            row.update({"id": fixture["id"] * (self.players + 1) + element_id, "element": element_id, "fixture": fixture["id"],
+                        "round": gameweek, "was_home": was_home, "opponent_team": fixture["team_a"] if was_home else fixture["team_h"],
+                        "team_h_score": fixture["team_h_score"], "team_a_score": fixture["team_a_score"],
+                        "influence": "{0:.1f}".format(r.uniform(0, 50)), "creativity": "{0:.1f}".format(r.uniform(0, 50)),
+                        "threat": "{0:.1f}".format(r.uniform(0, 50)), "ict_index": "{0:.1f}".format(r.uniform(0, 15))})
+            rows.append(row)
+        return rows
+
+    def bootstrap(self):
+        return {"current-event": self.gameweeks,
+                "events": [{"id": gameweek, "is_current": gameweek == self.gameweeks,
+                            "finished": all(fixture["finished"] for fixture in self.fixtures(gameweek))} for gameweek in range(1, self.gameweeks + 1)],
+                "element_types": [{"id": i, "singular_name": name, "singular_name_short": name[:3].upper(),
+                                   "plural_name": name + "s", "plural_name_short": name[:3].upper()} for i, name in POSITIONS],
+                "teams": [{"id": i, "name": "Team {0}".format(i), "short_name": "T{0:02d}".format(i)} for i in range(1, TEAMS + 1)],
+                "stats_options": [{"key": title, "name": title.replace("_", " ").capitalize()} for title in EXPLAIN_TITLES],
+                "elements": self.elements(),
+                "total-players": TOTAL_PLAYERS}
+
+    def elements(self):
+        ''' The players with their market data in the current gameweek '''
+        elements = []
+        for i in range(1, self.players + 1):
+            r = self._random("market", i, self.gameweeks)
+            elements.append({"id": i, "element_type": 1 + i % len(POSITIONS), "web_name": "Player {0}".format(i), "team": self.team(i),
+                             "now_cost": 45 + i % 80, "selected_by_percent": "{0:.1f}".format(r.uniform(0, 40)),
+                             "transfers_in_event": r.randint(0, 50000), "transfers_out_event": r.randint(0, 50000)})
+        return elements
+
+    def standings(self, league_id, page):
+        if league_id not in self.league_ids:
+            return None
+        entries = self.entries(league_id)
+        chunk = entries[(page - 1) * self.page_size: page * self.page_size]
+        return {"league": {"id": league_id, "name": "Mock league"},
+                "standings": {"has_next": page * self.page_size < len(entries), "number": page,
+                              "results": [{"entry": entry, "entry_name": "Manager {0}".format(entry), "total": self._random("total", entry).randint(500, 2500)}
+                                          for entry in chunk]}}
+
+    def history(self, entry):
+        if not self.is_entry(entry):
+            return None
+        r = self._random("history", entry)
+        history = []
+        total = 0
+        for gameweek in range(1, self.gameweeks + 1):
+            points = r.randint(20, 100)
+            total += points
+            history.append({"event": gameweek, "points": points, "points_on_bench": r.randint(0, 20), "total_points": total,
+                            "rank": r.randint(1, 5000000), "overall_rank": r.randint(1, 5000000), "event_transfers": r.randint(0, 2),
+                            "event_transfers_cost": r.choice([0, 0, 0, 4]), "value": r.randint(980, 1050), "bank": r.randint(0, 30)})
+        chips = [{"chip": 1, "name": "wildcard", "event": min(2, self.gameweeks)}]
+        return {"chips": chips, "history": history}
+
+    def transfers(self, entry):
+        if not self.is_entry(entry):
+            return None
+        r = self._random("transfers", entry)
+        return {"history": [{"element_in": r.randint(1, self.players), "element_in_cost": r.randint(45, 125),
+                             "element_out": r.randint(1, self.players), "element_out_cost": r.randint(45, 125),
+                             "time_formatted": "{0:02d} Sep 11:00".format(gameweek % 28 + 1), "event": gameweek}
+                            for gameweek in range(2, self.gameweeks + 1)]}
+
+    def picks(self, entry, gameweek):
+        if not self.is_entry(entry) or not 1 <= gameweek <= self.gameweeks:
+            return None
+        r = self._random("picks", entry, gameweek)
+        elements = r.sample(range(1, self.players + 1), 15)
+        picks = [{"element": element, "position": i + 1, "is_captain": i == 0, "is_vice_captain": i == 1,
+                  "multiplier": 2 if i == 0 else (1 if i < 11 else 0)} for i, element in enumerate(elements)]
+        subs = []
+        if r.random() < 0.3:
+            subs = [{"id": entry * 100 + gameweek, "element_in": elements[11], "element_out": elements[10], "entry": entry, "event": gameweek}]
+        return {"event": {"id": gameweek, "deadline_time_formatted": "{0:02d} Aug 11:00".format(gameweek % 28 + 1)},
+                "picks": picks, "automatic_subs": subs}
+
+    def played(self, element_id, gameweek):
+        ''' The performance rows of a player so far: during a live gameweek the stats grow with the minutes played '''
+        played = {fixture["id"]: fixture["minutes"] / 90 for fixture in self.fixtures(gameweek)}
+        return [{title: int(value * played[row["fixture"]]) if title in LIVE_TITLES and isinstance(value, int) else value
+                 for title, value in row.items()} for row in self.performance(element_id, gameweek)]
+
+    def live(self, gameweek):
+        if not 1 <= gameweek <= self.gameweeks:
+            return None
+        elements = {}
+        for element_id in range(1, self.players + 1):
+            rows = self.played(element_id, gameweek)
+            if not rows:
+                continue
+            explain = [[{title: {"points": row["total_points"] if title == "minutes" else 0, "name": title, "value": row[title]}
+                         for title in EXPLAIN_TITLES}, row["fixture"]] for row in rows]
+            stats = {title: sum(float(row[title]) if isinstance(row[title], str) else row[title] for row in rows) for title in LIVE_TITLES}
+            elements[str(element_id)] = {"explain": explain, "stats": stats}
+        return {"fixtures": self.fixtures(gameweek), "elements": elements}
+
+    def element_summary(self, element_id):
+        if not 1 <= element_id <= self.players:
+            return None
+        return {"history": [row for gameweek in range(1, self.gameweeks + 1) for row in self.played(element_id, gameweek)]}
+
+    def route(self, path, query):
+        '''
+        Returns the json page of an api path, None for an unknown page
+        '''
+        for pattern, page in ROUTES:
+            match = re.search(pattern, path)
+            if match:
+                return page(self, query, *[int(group) for group in match.groups()])
+        return None
+
+
+# Api pages served, checked in order against the path of the request
+ROUTES = [(r"/bootstrap-static$", lambda season, query: season.bootstrap()),
+          (r"/elements$", lambda season, query: season.elements()),
+          (r"/leagues-classic-standings/(\d+)$", lambda season, query, league_id: season.standings(league_id, int(query.get("ls-page", ["1"])[0]))),
+          (r"/entry/(\d+)/history$", lambda season, query, entry: season.history(entry)),
+          (r"/entry/(\d+)/transfers$", lambda season, query, entry: season.transfers(entry)),
+          (r"/entry/(\d+)/event/(\d+)/picks$", lambda season, query, entry, gameweek: season.picks(entry, gameweek)),
+          (r"/event/(\d+)/live$", lambda season, query, gameweek: season.live(gameweek)),
+          (r"/element-summary/(\d+)$", lambda season, query, element_id: season.element_summary(element_id))]
+
+
+class MockRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        status_code = server.next_response()
+        if server.latency:
+            time.sleep(server.latency)
+        if status_code is None:
+            page = server.season.route(url.path.rstrip("/"), parse_qs(url.query))
+            status_code = 404 if page is None else 200
+        body = json.dumps(page).encode() if status_code == 200 else b""
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockFPLServer(ThreadingHTTPServer):
+    '''
+    Http server of a MockSeason. Every response is delayed by latency seconds and a share
+    error_rate of the requests fail with a 503 or 429 response.
+    Counts the requests served and the errors injected.
+    '''
+    daemon_threads = True
+
+    def __init__(self, season, host = "127.0.0.1", port = 0, latency = 0.0, error_rate = 0.0, seed = 1):
+        super().__init__((host, port), MockRequestHandler)
+        self.season = season
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+    @property
+    def url(self):
+        ''' The value of FPL_URL pointing at this server '''
+        return "http://{0}:{1}/drf/".format(*self.server_address[:2])
+
+    def next_response(self):
+        ''' Counts a request and returns the error status injected into it, None for a normal response '''
+        with self.lock:
+            self.requests += 1
+            if self.error_rate and self.random.random() < self.error_rate:
+                self.errors += 1
+                return self.random.choice([429, 503])
+        return None
+
+    def start(self):
+        ''' Serves in a background thread '''
+        thread = threading.Thread(target = self.serve_forever, daemon = True)
+        thread.start()
+        return thread
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Local mock of the FPL api")
+    parser.add_argument("--port", type = int, default = 8765)
+    parser.add_argument("--managers", type = int, default = 50, help = "managers in every mock league")
+    parser.add_argument("--leagues", type = int, default = 1, help = "number of mock leagues")
+    parser.add_argument("--players", type = int, default = 300)
+    parser.add_argument("--gameweeks", type = int, default = 10, help = "gameweeks played so far")
+    parser.add_argument("--page-size", type = int, default = 50, help = "managers per standings page")
+    parser.add_argument("--latency", type = float, default = 0.0, help = "seconds added to every response")
+    parser.add_argument("--error-rate", type = float, default = 0.0, help = "share of the requests answered with 429/503")
+    parser.add_argument("--seed", type = int, default = 1)
+    parser.add_argument("--live-speed", type = float, help = "play the last gameweek live, this many match minutes per second")
+    args = parser.parse_args()
+
+    season = MockSeason(args.managers, args.players, args.gameweeks, args.page_size, seed = args.seed, leagues = args.leagues)
+    if args.live_speed is not None:
+        season.play_live(args.live_speed)
+    server = MockFPLServer(season, port = args.port, latency = args.latency, error_rate = args.error_rate, seed = args.seed)
+    print("Mock FPL api of leagues {0} at {1}".format(season.league_ids, server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
@@ -27,4 +27,134 @@ USER_SUMMARY_URL = FPL_URL + USER_SUMMARY_SUBURL
 PLAYERS_INFO_URL = FPL_URL + PLAYERS_INFO_SUBURL
 
 # Dictionary with the position values. Used in getUserGameweekData()
-ELEMENT_TYPE = {1:"Goalkeeper", 2:"Defender", 3:"Midfielder", 4:"Attaker"}
\ No newline at end of file
+ELEMENT_TYPE = {1:"Goalkeeper", 2:"Defender", 3:"Midfielder", 4:"Attaker"}
+
+# Number of concurrent downloads used by the fetch engine
+MAX_WORKERS = 8
+# Seconds to wait for an FPL response before giving up
+REQUEST_TIMEOUT = 30
+
+# Retry policy of the shared http client. Failed requests (connection errors, 429 and 5xx responses)
+# are retried MAX_RETRIES times waiting a random time up to BACKOFF_BASE * 2^attempt seconds (capped at BACKOFF_MAX)
+MAX_RETRIES = 5
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30
+
+# Local cache of the downloaded FPL pages (set CACHE_FILE = None to disable it)
+CACHE_FILE = "fpl_http_cache.db"
+# Maximum size of the cached responses in bytes. The least recently used ones are evicted above it
+CACHE_MAX_BYTES = 500 * 1024 * 1024
+# Serve every page from the cache only, without touching the network
+OFFLINE = False
+# Seconds each kind of page is considered fresh, checked in order against the url.
+# Pages matching a rule with a "gameweek" group never expire once that gameweek is finished.
+CACHE_TTL_RULES = [(r"bootstrap-static$", 300),
+                   (r"elements$", 300),
+                   (r"leagues-(classic|h2h)-standings/", 3600),
+                   (r"entry/\d+/event/(?P<gameweek>\d+)/picks$", 3600),
+                   (r"entry/\d+/(history|transfers)$", 3600),
+                   (r"element-summary/\d+$", 3600)]
+# Seconds a page not matching any rule is considered fresh
+CACHE_DEFAULT_TTL = 300
+
+# True drops all the tables and downloads the whole season again on every run.
+# False (incremental mode) only downloads the gameweeks, managers and player rounds missing from the DB
+REBUILD = False
+
+# Database holding the league independent data (lookup tables and player performance), downloaded once per run
+GLOBAL_DATABASE = "fpl_global.db"
+
+# Number of league entries written to the users table in one transaction
+USERS_CHUNK_SIZE = 1000
+
+# Number of rows buffered by the database writer before they are written in one transaction
+WRITE_BATCH_SIZE = 5000
+# Size of the SQLite page cache in KB
+SQLITE_CACHE_SIZE_KB = 65536
+
+# Maximum number of parsed records waiting for the database writer thread.
+# Download workers wait when the queue is full, so memory stays bounded if the disk is slower than the network
+WRITE_QUEUE_SIZE = 1000
+
+# Print the EXPLAIN QUERY PLAN of every view after the views are created
+EXPLAIN_VIEWS = False
+
+# Request scheduler: at most REQUEST_RATE requests per second to each host (bursts of REQUEST_BURST).
+# The rate and the number of parallel requests are halved on 429/5xx responses and grow back slowly
+# on successes. Requests slower than LATENCY_TARGET seconds also reduce the parallel requests
+REQUEST_RATE = 10.0
+REQUEST_BURST = 10
+MIN_CONCURRENCY = 1
+LATENCY_TARGET = 2.0
+# Order in which waiting requests are sent (lower first), checked in order against the url.
+# A rule with a "gameweek" group applies to the current gameweek only, older gameweeks are backfill
+REQUEST_PRIORITY_RULES = [(r"bootstrap-static$", 0),
+                          (r"leagues-(classic|h2h)-standings/", 1),
+                          (r"entry/\d+/event/(?P<gameweek>\d+)/picks$", 1),
+                          (r"event/(?P<gameweek>\d+)/live$", 1),
+                          (r"entry/\d+/(history|transfers)$", 2)]
+# Priority of the backfill requests (and of urls not matching any rule)
+BACKFILL_PRIORITY = 3
+
+# Logging level of the run (DEBUG also logs every table insertion)
+LOG_LEVEL = "INFO"
+# Files the run's metrics are written to at the end of fpl_info.py: a json report
+# and the Prometheus text format (set to None to skip them)
+METRICS_REPORT_FILE = "fpl_run_report.json"
+METRICS_PROMETHEUS_FILE = "fpl_metrics.prom"
+# Upper bounds in seconds of the buckets of the request and commit latency histograms
+METRICS_LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+
+# Number of leagues of USER_LEAGUE processed in parallel, each in its own process.
+# All the processes share the REQUEST_RATE limit
+LEAGUE_WORKERS = 1
+
+# Folder of the columnar (NumPy .npy) export of the league tables, one sub folder per league
+# database (set to None to skip the export, it also needs numpy installed)
+EXPORT_DIR = "export"
+
+# Archive of the raw downloaded pages, compressed, kept so that the tables can be rebuilt
+# without the network (set ARCHIVE_FILE = None to disable it)
+ARCHIVE_FILE = "fpl_archive.db"
+# True rebuilds all the tables from the pages in ARCHIVE_FILE instead of downloading them,
+# e.g. after adding a column (refused when ARCHIVE_FILE is None). The pages are decoded and parsed in PARSE_WORKERS processes
+# (None = one per cpu)
+RETRANSFORM = False
+PARSE_WORKERS = None
+
+# Seconds between two polls of the live page of the gameweek in play (live_mode.py)
+LIVE_POLL_INTERVAL = 30
+
+# Read only connections per league database and cached results per league of query_service.py
+QUERY_POOL_SIZE = 4
+QUERY_CACHE_SIZE = 256
+
+# Per-gameweek league tables stored in one database file per block of PARTITION_GAMEWEEKS
+# gameweeks (fpl_{league}_gw01-05.db, ...) instead of fpl_{league}.db, for very large leagues.
+# 0 disables it. A connection attaches at most 10 files, blocks of about a month (5 gameweeks)
+# keep a whole season readable at once, blocks of fewer than 4 gameweeks are refused
+PARTITION_GAMEWEEKS = 0
+PARTITIONED_TABLES = ["gameweekPicks", "gameweekSubs"]
+
+def configure(settings, setup = None, args = ()):
+    '''
+    Overrides parameters of this file in the running process. The other modules copy the
+    parameters when they are imported, so it must run before they are imported: benchmark.py
+    calls it first in its pipeline process, fpl_info.run() makes it the initializer of its
+    league worker processes.
+
+    Input: settings = a dictionary {parameter name : value}
+           setup = the name of a function, e.g. "fpl_info._league_worker_init", called with args
+                   once the parameters are set (the modules it imports see them)
+    '''
+    unknown = sorted(name for name in settings if name not in globals())
+    if unknown:
+        raise KeyError("Unknown parameters: {0}".format(", ".join(unknown)))
+    derived = {"USER_SUMMARY_URL": settings.get("FPL_URL", FPL_URL) + settings.get("USER_SUMMARY_SUBURL", USER_SUMMARY_SUBURL),
+               "PLAYERS_INFO_URL": settings.get("FPL_URL", FPL_URL) + settings.get("PLAYERS_INFO_SUBURL", PLAYERS_INFO_SUBURL)}
+    derived.update(settings)
+    globals().update(derived)
+    if setup:
+        import importlib
+        module, function = setup.rsplit(".", 1)
+        getattr(importlib.import_module(module), function)(*args)
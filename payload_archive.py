@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Fantasy Premier League 2017-2018 scraper
+
+@author: Theodoros Panagiotakos
+"""
+
+# Archive of the raw pages downloaded from the FPL api. Unlike the response cache, which
+# evicts pages and only serves them while they are fresh, the archive keeps the last version
+# of every page (zlib compressed) with the time it was fetched and its gameweek, so that the
+# tables can be rebuilt from it without the network after a schema or mapping change
+# (RETRANSFORM in params.py).
+
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from urllib.parse import urlsplit
+import params
+
+
+ARCHIVE_FILE = params.ARCHIVE_FILE
+COMPRESSION_LEVEL = 6
+# Urls read from the archive in one query
+LOOKUP_CHUNK_SIZE = 500
+
+_event = re.compile(r"/event/(\d+)")
+
+
+def compress(body):
+    return zlib.compress(body, COMPRESSION_LEVEL)
+
+def decompress(payload):
+    return zlib.decompress(payload)
+
+def archive_key(url):
+    '''
+    Returns the key of url in the archive: its path and query without the scheme and host,
+    so that the archived pages stay valid when FPL_URL changes host
+    '''
+    parts = urlsplit(url)
+    return parts.path + ("?" + parts.query if parts.query else "")
+
+def _chunks(keys):
+    return [keys[start:start + LOOKUP_CHUNK_SIZE] for start in range(0, len(keys), LOOKUP_CHUNK_SIZE)]
+
+
+class PayloadArchive:
+    '''
+    On-disk archive of FPL responses keyed by url (see archive_key()), stored in an sqlite file
+    '''
+    def __init__(self, archive_file = ARCHIVE_FILE):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(archive_file, timeout = 30, check_same_thread = False)
+        with self.connection:
+            self.connection.execute("PRAGMA journal_mode = WAL")
+            self.connection.execute("PRAGMA synchronous = NORMAL")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS payloads (url TEXT PRIMARY KEY, gameweek INTEGER, fetched_at REAL, "
+                                    "size INTEGER, body BLOB)")
+            # rows archived under their full url by earlier versions
+            for url, in self.connection.execute("SELECT url FROM payloads WHERE url LIKE '%://%'").fetchall():
+                self.connection.execute("UPDATE OR REPLACE payloads SET url = ? WHERE url = ?", (archive_key(url), url))
+
+    def store(self, url, body, current_gameweek = None):
+        '''
+        Archives a downloaded response, replacing the version stored before
+
+        Input: url = the downloaded url
+               body = the raw response bytes
+               current_gameweek = the current gameweek, recorded for pages without a gameweek in their url
+        '''
+        match = _event.search(url)
+        gameweek = int(match.group(1)) if match else current_gameweek
+        payload = compress(body)
+        with self.lock:
+            with self.connection:
+                self.connection.execute("INSERT OR REPLACE INTO payloads (url, gameweek, fetched_at, size, body) VALUES (?, ?, ?, ?, ?)",
+                                        (archive_key(url), gameweek, time.time(), len(body), payload))
+
+    def lookup(self, url):
+        '''
+        Returns the raw bytes archived for url or None
+        '''
+        with self.lock:
+            row = self.connection.execute("SELECT body FROM payloads WHERE url = ?", (archive_key(url),)).fetchone()
+        return decompress(row[0]) if row is not None else None
+
+    def compressed(self, urls):
+        '''
+        Returns the compressed payloads archived for urls (decompress() them)
+
+        Output: a dictionary {url : compressed bytes}, urls missing from the archive are left out
+        '''
+        payloads = {}
+        keys = {archive_key(url): url for url in urls}
+        with self.lock:
+            for chunk in _chunks(list(keys)):
+                payloads.update((keys[key], body) for key, body in
+                                self.connection.execute("SELECT url, body FROM payloads WHERE url IN ({0})".format(",".join("?" * len(chunk))), chunk))
+        return payloads
+
+    def missing(self, urls):
+        '''
+        Returns the list of urls not in the archive
+        '''
+        keys = {archive_key(url): url for url in urls}
+        archived = set()
+        with self.lock:
+            for chunk in _chunks(list(keys)):
+                archived.update(key for key, in self.connection.execute("SELECT url FROM payloads WHERE url IN ({0})".format(",".join("?" * len(chunk))), chunk))
+        return [url for key, url in keys.items() if key not in archived]
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
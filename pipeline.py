@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+Fantasy Premier League 2017-2018 scraper
+
+@author: Theodoros Panagiotakos
+"""
+
+import logging
+import queue
+import threading
+import manage_sqllite as sq
+import params
+
+log = logging.getLogger(__name__)
+
+
+WRITE_QUEUE_SIZE = params.WRITE_QUEUE_SIZE
+
+# Queued to tell the writer thread to flush and stop
+_STOP = object()
+
+
+def _forward(connection, writer, table_function, args):
+    sq.get_writer(connection).after_flush(lambda: writer.submit(table_function, *args))
+
+
+class DBWriter(threading.Thread):
+    '''
+    Dedicated thread owning the sqlite3 connection of a database.
+    Download workers submit manage_sqllite table functions with their arguments and the
+    thread runs them in order on its own connection, so network and disk work overlap
+    and only one connection ever writes to the database.
+    
+    Use it as a context manager: the thread starts on enter and on exit it drains the
+    queue, flushes the buffered rows and closes the connection.
+    '''
+    def __init__(self, dbase, queue_size = WRITE_QUEUE_SIZE):
+        super().__init__(name = "DBWriter-{0}".format(dbase), daemon = True)
+        self.dbase = dbase
+        self.queue = queue.Queue(maxsize = queue_size)
+        self.errors = 0
+
+    def submit(self, table_function, *args):
+        '''
+        Queues table_function(connection, *args) for the writer thread.
+        Blocks while the queue is full (backpressure on the download workers).
+        '''
+        self.queue.put((table_function, args))
+
+    def submit_after(self, writer, table_function, *args):
+        '''
+        Submits table_function(*args) to another DBWriter once the rows submitted to this one
+        before it are committed (e.g. the ledger mark of rows written to a partition file)
+        '''
+        self.submit(_forward, writer, table_function, args)
+
+    def run(self):
+        try:
+            connection, cursor = sq.connect(self.dbase)
+            cursor.execute("PRAGMA busy_timeout = 30000")
+        except BaseException as e:
+            log.error("Writer for %s could not connect: %s", self.dbase, e)
+            connection = None
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                break
+            if connection is None:
+                # keep draining so that the producers never block on a dead writer
+                self.errors += 1
+                continue
+            table_function, args = item
+            try:
+                table_function(connection, *args)
+            except BaseException as e:
+                self.errors += 1
+                log.error("Issue with writing to %s with %s: %s", self.dbase, table_function.__name__, e)
+        if connection is not None:
+            sq.close(connection)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.queue.put(_STOP)
+        self.join()
+        return False
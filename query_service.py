@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+"""
+Fantasy Premier League 2017-2018 scraper
+
+@author: Theodoros Panagiotakos
+"""
+
+# Read only query service over the league databases, for the charting tools. Each league
+# database gets a small pool of read only connections (the databases are in WAL mode, so the
+# readers never wait for the scraper's write transactions) and an LRU cache of query results.
+# The cache of a league is emptied as soon as a run commits to its database, which is noticed
+# with PRAGMA data_version on a watcher connection. The partitions of a partitioned league
+# database are attached to every connection (see gameweek_partitions.py).
+#
+# Python:  QueryService().query(80757, "team-history", player_name = "Manager 1000", from_gameweek = 3)
+# Http:    python query_service.py --port 8766
+#          GET /leagues
+#          GET /leagues/80757/team-history?player_name=Manager%201000&from_gameweek=3&to_gameweek=10
+
+import argparse
+import json
+import logging
+import os
+import queue
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import gameweek_partitions as gp
+import metrics as mt
+import params
+
+log = logging.getLogger(__name__)
+
+
+QUERY_POOL_SIZE = params.QUERY_POOL_SIZE
+QUERY_CACHE_SIZE = params.QUERY_CACHE_SIZE
+
+# Endpoints {name : view of DB_Views.sql}, every view has the player_name and gameweek columns
+VIEWS = {"tokens": "UserTokens_V",
+         "team-history": "UserTeamHistory_V",
+         "transfers": "UserTransferHistory_V",
+         "gameweek-performance": "UserGameweekPerformance_V",
+         "gameweek-summary": "ManagerGameweekSummary_V",
+         "transfer-gains": "TransferGain_V"}
+# Query parameters {name : (condition, type)}
+FILTERS = {"player_name": ('"player_name" = ?', str),
+           "gameweek": ('"gameweek" = ?', int),
+           "from_gameweek": ('"gameweek" >= ?', int),
+           "to_gameweek": ('"gameweek" <= ?', int)}
+
+
+class QueryError(Exception):
+    ''' An unknown league, endpoint or parameter '''
+
+
+class ConnectionPool:
+    '''
+    Read only connections to a database shared by the threads of the service
+    '''
+    def __init__(self, dbase, size = QUERY_POOL_SIZE):
+        self.connections = queue.Queue()
+        self.layouts = {}   # {connection : partition files attached to it}
+        for i in range(size):
+            connection = sqlite3.connect("file:{0}?mode=ro".format(dbase), uri = True, timeout = 30, check_same_thread = False)
+            connection.execute("PRAGMA query_only = 1")
+            self.connections.put(connection)
+
+    @contextmanager
+    def connection(self):
+        connection = self.connections.get()
+        try:
+            yield connection
+        finally:
+            self.connections.put(connection)
+
+    def refresh(self, connection, layout):
+        ''' Attaches the partition files of layout to a connection taken from the pool '''
+        if self.layouts.get(connection) != layout:
+            # the TEMP views of the partitions can not be created by a query only connection
+            connection.execute("PRAGMA query_only = 0")
+            gp.attach(connection, read_only = True)
+            connection.execute("PRAGMA query_only = 1")
+            self.layouts[connection] = layout
+
+    def close(self):
+        while not self.connections.empty():
+            self.connections.get().close()
+
+
+class LeagueQueries:
+    '''
+    The connection pool and the result cache of one league database
+    '''
+    def __init__(self, dbase, pool_size = QUERY_POOL_SIZE, cache_size = QUERY_CACHE_SIZE):
+        if not os.path.exists(dbase):
+            raise QueryError("database {0} not found".format(dbase))
+        self.pool = ConnectionPool(dbase, pool_size)
+        # data_version of this connection changes whenever another connection commits to the database
+        self.watcher = sqlite3.connect("file:{0}?mode=ro".format(dbase), uri = True, check_same_thread = False)
+        self.data_version = None
+        self.layout = None   # the partition files of the database
+        self.cache_size = cache_size
+        self.cache = OrderedDict()   # {(endpoint, filters) : [result, json body or None]}, least recently used first
+        self.lock = threading.Lock()
+
+    def _check_version(self):
+        ''' Empties the cache if the database changed since the last query (called with the lock) '''
+        layout = tuple(row[0] for row in gp.partitions(self.watcher))
+        if layout != self.layout:
+            gp.attach(self.watcher, read_only = True, views = False)
+            self.layout = layout
+        data_version = gp.data_version(self.watcher)
+        if data_version != self.data_version:
+            if self.cache:
+                log.debug("Database changed, %s cached results dropped", len(self.cache))
+            self.cache.clear()
+            self.data_version = data_version
+
+    def query(self, endpoint, **filters):
+        '''
+        Returns the rows of an endpoint's view matching filters, from the cache when the
+        database did not change since they were read
+
+        Output: a dictionary {"columns" : list of column names, "rows" : list of rows}
+        '''
+        return self._entry(endpoint, filters)[0]
+
+    def query_json(self, endpoint, **filters):
+        '''
+        Returns query() encoded as json bytes, encoded once per cached result
+        '''
+        entry = self._entry(endpoint, filters)
+        if entry[1] is None:
+            entry[1] = json.dumps(entry[0]).encode()
+        return entry[1]
+
+    def _entry(self, endpoint, filters):
+        if endpoint not in VIEWS:
+            raise QueryError("unknown endpoint {0}".format(endpoint))
+        try:
+            filters = {name: FILTERS[name][1](value) for name, value in filters.items() if value is not None}
+        except KeyError as e:
+            raise QueryError("unknown parameter {0}".format(e.args[0]))
+        except ValueError as e:
+            raise QueryError(str(e))
+        key = (endpoint, tuple(sorted(filters.items())))
+        with self.lock:
+            self._check_version()
+            data_version, layout = self.data_version, self.layout
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                mt.registry.inc("query_cache_total", endpoint = endpoint, result = "hit")
+                return self.cache[key]
+        mt.registry.inc("query_cache_total", endpoint = endpoint, result = "miss")
+        where = " AND ".join(FILTERS[name][0] for name in sorted(filters))
+        statement = 'SELECT * FROM "{0}"{1} ORDER BY "gameweek"'.format(VIEWS[endpoint], " WHERE " + where if where else "")
+        with mt.registry.timer("query_seconds", endpoint = endpoint):
+            with self.pool.connection() as connection:
+                self.pool.refresh(connection, layout)
+                cursor = connection.execute(statement, [value for name, value in sorted(filters.items())])
+                entry = [{"columns": [description[0] for description in cursor.description], "rows": cursor.fetchall()}, None]
+        with self.lock:
+            # a result read while a run committed may be stale, it is returned but not cached
+            self._check_version()
+            if self.data_version == data_version:
+                self.cache[key] = entry
+                if len(self.cache) > self.cache_size:
+                    self.cache.popitem(last = False)
+        return entry
+
+    def close(self):
+        self.pool.close()
+        self.watcher.close()
+
+
+class QueryService:
+    '''
+    Queries of the standard views of the league databases (fpl_{league id}.db in folder)
+    '''
+    def __init__(self, folder = ".", pool_size = QUERY_POOL_SIZE, cache_size = QUERY_CACHE_SIZE):
+        self.folder = folder
+        self.pool_size = pool_size
+        self.cache_size = cache_size
+        self.leagues = {}
+        self.lock = threading.Lock()
+
+    def league_ids(self):
+        ''' The leagues with a database in the folder '''
+        return sorted(int(match.group(1)) for match in (re.match(r"fpl_(\d+)\.db$", name) for name in os.listdir(self.folder)) if match)
+
+    def league(self, fpl_league_id):
+        with self.lock:
+            if fpl_league_id not in self.leagues:
+                dbase = os.path.join(self.folder, "fpl_{0}.db".format(fpl_league_id))
+                self.leagues[fpl_league_id] = LeagueQueries(dbase, self.pool_size, self.cache_size)
+            return self.leagues[fpl_league_id]
+
+    def query(self, fpl_league_id, endpoint, **filters):
+        ''' See LeagueQueries.query() '''
+        return self.league(fpl_league_id).query(endpoint, **filters)
+
+    def query_json(self, fpl_league_id, endpoint, **filters):
+        ''' See LeagueQueries.query_json() '''
+        return self.league(fpl_league_id).query_json(endpoint, **filters)
+
+    def close(self):
+        with self.lock:
+            for league in self.leagues.values():
+                league.close()
+            self.leagues = {}
+
+
+class QueryRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        path = url.path.rstrip("/")
+        try:
+            if path == "/leagues":
+                body = json.dumps({"leagues": self.server.service.league_ids(), "endpoints": sorted(VIEWS)}).encode()
+            else:
+                match = re.match(r"/leagues/(\d+)/([\w-]+)$", path)
+                if not match:
+                    return self.reply(404, {"error": "unknown path"})
+                filters = {name: values[-1] for name, values in parse_qs(url.query).items()}
+                # the json body is encoded once and cached with the result
+                body = self.server.service.query_json(int(match.group(1)), match.group(2), **filters)
+        except QueryError as e:
+            return self.reply(400, {"error": str(e)})
+        except sqlite3.Error as e:
+            log.error("Error info: %s", e.args[0])
+            return self.reply(500, {"error": "database error"})
+        self.send(200, body)
+
+    def reply(self, status_code, page):
+        self.send(status_code, json.dumps(page).encode())
+
+    def send(self, status_code, body):
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        log.debug(format, *args)
+
+
+class QueryServer(ThreadingHTTPServer):
+    '''
+    Http/json front end of a QueryService
+    '''
+    daemon_threads = True
+
+    def __init__(self, service, host = "127.0.0.1", port = 0):
+        super().__init__((host, port), QueryRequestHandler)
+        self.service = service
+
+    @property
+    def url(self):
+        return "http://{0}:{1}/".format(*self.server_address[:2])
+
+    def start(self):
+        ''' Serves in a background thread '''
+        thread = threading.Thread(target = self.serve_forever, daemon = True)
+        thread.start()
+        return thread
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Read only http/json api over the league databases")
+    parser.add_argument("--host", default = "127.0.0.1")
+    parser.add_argument("--port", type = int, default = 8766)
+    parser.add_argument("--folder", default = ".", help = "folder of the fpl_{league}.db files")
+    args = parser.parse_args()
+
+    logging.basicConfig(level = params.LOG_LEVEL, format = "%(asctime)s %(levelname)s %(name)s: %(message)s")
+    server = QueryServer(QueryService(args.folder), args.host, args.port)
+    log.info("Query service of leagues %s at %s", server.service.league_ids(), server.url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    server.service.close()
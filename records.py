@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Fantasy Premier League 2017-2018 scraper
+
+@author: Theodoros Panagiotakos
+"""
+
+# Typed records decoded from the FPL pages by get_data.py. Every record is a NamedTuple
+# (a tuple without a per-instance dictionary) whose fields are the columns of its table in the
+# order the manage_sqllite.py writers insert them, so the writers pass them to executemany as they are.
+# The from_json functions read all the fields of a json object at once with an itemgetter.
+
+from operator import itemgetter
+from typing import NamedTuple, Optional
+
+
+class TeamHistory(NamedTuple):
+    ''' A gameweek of a team's season history (userTeamHistory) '''
+    gameweek: int
+    points: int
+    points_on_bench: int
+    total_points: int
+    gameweek_rank: Optional[int]
+    overall_rank: int
+    week_transfers: int
+    week_transfers_cost: int
+    team_value: int
+    money_in_bank: int
+
+_team_history_fields = itemgetter("event", "points", "points_on_bench", "total_points", "rank", "overall_rank",
+                                  "event_transfers", "event_transfers_cost", "value", "bank")
+
+def team_history_from_json(item):
+    return TeamHistory._make(_team_history_fields(item))
+
+
+class Transfer(NamedTuple):
+    ''' A transfer of a team (userTransferHistory) '''
+    gameweek: int
+    player_in: int
+    player_out: int
+    cost_in: int
+    cost_out: int
+    date: str
+
+_transfer_fields = itemgetter("event", "element_in", "element_out", "element_in_cost", "element_out_cost", "time_formatted")
+
+def transfer_from_json(item):
+    return Transfer._make(_transfer_fields(item))
+
+
+class Pick(NamedTuple):
+    ''' A player picked by a team for a gameweek (gameweekPicks) '''
+    element: int
+    is_captain: bool
+    is_vice_captain: bool
+    multiplier: int
+    position: int
+
+_pick_fields = itemgetter(*Pick._fields)
+
+def pick_from_json(item):
+    return Pick._make(_pick_fields(item))
+
+
+class AutoSub(NamedTuple):
+    ''' An automatic substitution of a team (gameweekSubs) '''
+    element_in: int
+    element_out: int
+    entry: int
+    event: int
+    id: int
+
+_auto_sub_fields = itemgetter(*AutoSub._fields)
+
+def auto_sub_from_json(item):
+    return AutoSub._make(_auto_sub_fields(item))
+
+
+class LiveTeamPoints(NamedTuple):
+    ''' The live points of a team in the gameweek in play (liveTeamPoints, see live_mode.py) '''
+    entry_id: int
+    gameweek: int
+    points: int
+    bench_points: int
+    captain: int
+    auto_subs: int
+
+
+class LivePlayerPoints(NamedTuple):
+    ''' The live points of a player in the gameweek in play (livePlayerPoints) '''
+    gameweek: int
+    element: int
+    minutes: int
+    total_points: int
+
+
+# Columns of gameweekPerformance, the stats of a player in a fixture
+PLAYER_FIXTURE_COLUMNS = [("id","INTEGER"),("team_h_score","INTEGER"),("team_a_score","INTEGER"),("was_home","INTEGER"),("round","INTEGER"),("total_points","INTEGER"),
+                          ("value","INTEGER"),("transfers_balance","INTEGER"),("selected","INTEGER"),("transfers_in","INTEGER"),("transfers_out","INTEGER"),("loaned_in","INTEGER"),
+                          ("loaned_out","INTEGER"),("minutes","INTEGER"),("goals_scored","INTEGER"),("assists","INTEGER"),("clean_sheets","INTEGER"),("goals_conceded","INTEGER"),
+                          ("own_goals","INTEGER"),("penalties_saved","INTEGER"),("penalties_missed","INTEGER"),("yellow_cards","INTEGER"),("red_cards","INTEGER"),("saves","INTEGER"),
+                          ("bonus","INTEGER"),("bps","INTEGER"),("influence","REAL"),("creativity","REAL"),("threat","REAL"),("ict_index","REAL"),("ea_index","INTEGER"),("open_play_crosses","INTEGER"),
+                          ("big_chances_created","INTEGER"),("clearances_blocks_interceptions","INTEGER"),("recoveries","INTEGER"),("key_passes","INTEGER"),("tackles","INTEGER"),
+                          ("winning_goals","INTEGER"),("attempted_passes","INTEGER"),("completed_passes","INTEGER"),("penalties_conceded","INTEGER"),("big_chances_missed","INTEGER"),
+                          ("errors_leading_to_goal","INTEGER"),("errors_leading_to_goal_attempt","INTEGER"),("tackled","INTEGER"),("offside","INTEGER"),("target_missed","INTEGER"),
+                          ("fouls","INTEGER"),("dribbles","INTEGER"),("element","INTEGER"),("fixture","INTEGER"),("opponent_team","INTEGER")]
+
+# A player's fixture (gameweekPerformance), fields missing from the page are None (NULL)
+PlayerFixture = NamedTuple("PlayerFixture", [(name, Optional[float] if sql_type == "REAL" else Optional[int]) for name, sql_type in PLAYER_FIXTURE_COLUMNS])
+
+def player_fixture_from_json(item):
+    get = item.get
+    return PlayerFixture._make(map(get, PlayerFixture._fields))
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+Fantasy Premier League 2017-2018 scraper
+
+@author: Theodoros Panagiotakos
+"""
+
+import re
+import sqlite3
+import threading
+import time
+import params
+
+
+CACHE_MAX_BYTES = params.CACHE_MAX_BYTES
+CACHE_TTL_RULES = params.CACHE_TTL_RULES
+CACHE_DEFAULT_TTL = params.CACHE_DEFAULT_TTL
+
+
+class CachedResponse:
+    ''' A response stored in the cache '''
+    __slots__ = ("url", "body", "etag", "last_modified", "expires_at")
+
+    def __init__(self, url, body, etag, last_modified, expires_at):
+        self.url = url
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires_at = expires_at
+
+    def is_fresh(self, now = None):
+        ''' True when the response can be served without asking the server (expires_at None = never expires) '''
+        return self.expires_at is None or self.expires_at > (now or time.time())
+
+    def validators(self):
+        ''' Returns the headers used to revalidate the response with the server '''
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    '''
+    On-disk cache of FPL responses keyed by url, stored in an sqlite file.
+    Freshness is decided by the CACHE_TTL_RULES in params.py and the total size is
+    kept under max_bytes by evicting the least recently used responses.
+    '''
+    def __init__(self, cache_file, max_bytes = CACHE_MAX_BYTES, ttl_rules = CACHE_TTL_RULES,
+                 default_ttl = CACHE_DEFAULT_TTL):
+        self.max_bytes = max_bytes
+        self.ttl_rules = [(re.compile(pattern), ttl) for pattern, ttl in ttl_rules]
+        self.default_ttl = default_ttl
+        # the last finished gameweek, its pages and those of earlier gameweeks never change
+        self.finished_gameweek = None
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(cache_file, timeout = 30, check_same_thread = False)
+        with self.connection:
+            self.connection.execute("PRAGMA journal_mode = WAL")
+            self.connection.execute("PRAGMA synchronous = NORMAL")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS responses (url TEXT PRIMARY KEY, body BLOB, etag TEXT, last_modified TEXT, "
+                                    "fetched_at REAL, expires_at REAL, last_access REAL, size INTEGER)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS responses_access_index ON responses (last_access)")
+        self.total_bytes = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def expiry(self, url, now = None):
+        '''
+        Returns the time url stops being fresh, or None if it never expires
+        '''
+        now = now or time.time()
+        for pattern, ttl in self.ttl_rules:
+            match = pattern.search(url)
+            if match:
+                gameweek = match.groupdict().get("gameweek")
+                if gameweek and self.finished_gameweek is not None and int(gameweek) <= self.finished_gameweek:
+                    return None
+                return now + ttl
+        return now + self.default_ttl
+
+    def lookup(self, url):
+        '''
+        Returns the CachedResponse stored for url (fresh or not) or None
+        '''
+        with self.lock:
+            row = self.connection.execute("SELECT body, etag, last_modified, expires_at FROM responses WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                return None
+            with self.connection:
+                self.connection.execute("UPDATE responses SET last_access = ? WHERE url = ?", (time.time(), url))
+        return CachedResponse(url, *row)
+
+    def store(self, url, body, etag = None, last_modified = None):
+        '''
+        Stores a freshly downloaded response and evicts old responses if the cache is full
+        
+        Input: url = the downloaded url
+               body = the raw response bytes
+               etag, last_modified = the validators sent by the server, if any
+        '''
+        now = time.time()
+        with self.lock:
+            old = self.connection.execute("SELECT size FROM responses WHERE url = ?", (url,)).fetchone()
+            with self.connection:
+                self.connection.execute("INSERT OR REPLACE INTO responses (url, body, etag, last_modified, fetched_at, expires_at, last_access, size) "
+                                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (url, body, etag, last_modified, now, self.expiry(url, now), now, len(body)))
+            self.total_bytes += len(body) - (old[0] if old else 0)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def refresh(self, url):
+        '''
+        Marks a cached response as fresh again after the server answered 304 Not Modified
+        '''
+        now = time.time()
+        with self.lock:
+            with self.connection:
+                self.connection.execute("UPDATE responses SET expires_at = ?, last_access = ? WHERE url = ?", (self.expiry(url, now), now, url))
+
+    def _evict(self):
+        ''' Deletes the least recently used responses until the cache fits in max_bytes '''
+        rows = self.connection.execute("SELECT url, size FROM responses ORDER BY last_access").fetchall()
+        evicted = []
+        for url, size in rows:
+            if self.total_bytes <= self.max_bytes:
+                break
+            evicted.append((url,))
+            self.total_bytes -= size
+        with self.connection:
+            self.connection.executemany("DELETE FROM responses WHERE url = ?", evicted)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
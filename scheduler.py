@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+Fantasy Premier League 2017-2018 scraper
+
+@author: Theodoros Panagiotakos
+"""
+
+import heapq
+import itertools
+import multiprocessing
+import re
+import threading
+import time
+from urllib.parse import urlparse
+import params
+
+
+REQUEST_RATE = params.REQUEST_RATE
+REQUEST_BURST = params.REQUEST_BURST
+MIN_CONCURRENCY = params.MIN_CONCURRENCY
+MAX_CONCURRENCY = params.MAX_WORKERS
+LATENCY_TARGET = params.LATENCY_TARGET
+REQUEST_PRIORITY_RULES = params.REQUEST_PRIORITY_RULES
+BACKFILL_PRIORITY = params.BACKFILL_PRIORITY
+
+
+class TokenBucket:
+    '''
+    Token bucket rate limiter: rate tokens per second, at most burst tokens saved up.
+    The rate adapts to the server: halved when it throttles us and raised slowly back to max_rate.
+    '''
+    def __init__(self, rate = REQUEST_RATE, burst = REQUEST_BURST):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        ''' Blocks until a token is available and takes it '''
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def slow_down(self):
+        with self.lock:
+            self.rate = max(self.max_rate / 32, self.rate / 2)
+
+    def speed_up(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+class SharedTokenBucket(TokenBucket):
+    '''
+    TokenBucket whose state lives in shared memory, so that processes given the same
+    bucket (e.g. the league workers of fpl_info.run) share one rate limit and its adaptation.
+    A process given the state of another process's bucket takes its tokens from it.
+    '''
+    def __init__(self, rate = REQUEST_RATE, burst = REQUEST_BURST, context = None, state = None):
+        context = context or multiprocessing.get_context()
+        self.max_rate = rate
+        self.burst = burst
+        # [rate, tokens, updated], guarded by the lock of the array
+        self.state = state if state is not None else context.Array("d", [rate, burst, time.monotonic()])
+
+    @property
+    def lock(self):
+        return self.state.get_lock()
+
+    @property
+    def rate(self):
+        return self.state[0]
+
+    @rate.setter
+    def rate(self, value):
+        self.state[0] = value
+
+    @property
+    def tokens(self):
+        return self.state[1]
+
+    @tokens.setter
+    def tokens(self, value):
+        self.state[1] = value
+
+    @property
+    def updated(self):
+        return self.state[2]
+
+    @updated.setter
+    def updated(self, value):
+        self.state[2] = value
+
+
+# Bucket used for every host instead of the per host buckets, see use_shared_bucket()
+_shared_bucket = None
+
+def use_shared_bucket(bucket):
+    '''
+    Makes every RequestScheduler of this process take its tokens from bucket
+    (a SharedTokenBucket created by the parent process)
+    '''
+    global _shared_bucket
+    _shared_bucket = bucket
+
+
+class RequestScheduler:
+    '''
+    Sits in front of every FPL request (see FPLClient.get):
+    - limits the requests per second to each host with a TokenBucket
+    - adapts the number of requests in flight with AIMD: +1/limit on every fast success,
+      halved on 429/5xx responses and connection errors, -1 on responses slower than latency_target
+    - lets the waiting request with the lowest priority value go first (REQUEST_PRIORITY_RULES)
+    '''
+    def __init__(self, rate = REQUEST_RATE, burst = REQUEST_BURST, min_concurrency = MIN_CONCURRENCY,
+                 max_concurrency = MAX_CONCURRENCY, latency_target = LATENCY_TARGET,
+                 priority_rules = REQUEST_PRIORITY_RULES, backfill_priority = BACKFILL_PRIORITY):
+        self.rate = rate
+        self.burst = burst
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.limit = float(max_concurrency)
+        self.latency_target = latency_target
+        self.priority_rules = [(re.compile(pattern), priority) for pattern, priority in priority_rules]
+        self.backfill_priority = backfill_priority
+        # the current gameweek, its pages go ahead of the older gameweeks
+        self.current_gameweek = None
+        self.active = 0
+        self.waiting = []
+        self.counter = itertools.count()
+        self.buckets = {}
+        self.condition = threading.Condition()
+
+    def priority(self, url):
+        '''
+        Returns the priority of url (lower goes first)
+        '''
+        for pattern, priority in self.priority_rules:
+            match = pattern.search(url)
+            if match:
+                gameweek = match.groupdict().get("gameweek")
+                if gameweek and self.current_gameweek and int(gameweek) != self.current_gameweek:
+                    return self.backfill_priority
+                return priority
+        return self.backfill_priority
+
+    def bucket(self, host):
+        if _shared_bucket is not None:
+            return _shared_bucket
+        with self.condition:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(self.rate, self.burst)
+            return self.buckets[host]
+
+    def acquire(self, url, priority = None):
+        '''
+        Blocks until url may be requested: its turn in the priority order has come, there is
+        room in the concurrency limit and its host has a token.
+        
+        Output: ticket = the value to give back to release()
+        '''
+        priority = self.priority(url) if priority is None else priority
+        ticket = (priority, next(self.counter))
+        with self.condition:
+            heapq.heappush(self.waiting, ticket)
+            while self.waiting[0] != ticket or self.active >= int(self.limit):
+                self.condition.wait()
+            heapq.heappop(self.waiting)
+            self.active += 1
+            self.condition.notify_all()
+        host = urlparse(url).netloc
+        self.bucket(host).acquire()
+        return host, time.monotonic()
+
+    def release(self, ticket, status_code = None):
+        '''
+        Frees the slot of a finished request and adapts the limits to its outcome
+        
+        Input: ticket = the value returned by acquire()
+               status_code = the http status of the response, None for connection errors
+        '''
+        host, started = ticket
+        latency = time.monotonic() - started
+        throttled = status_code is None or status_code == 429 or status_code >= 500
+        if throttled:
+            self.bucket(host).slow_down()
+        elif latency <= self.latency_target:
+            self.bucket(host).speed_up()
+        with self.condition:
+            self.active -= 1
+            if throttled:
+                self.limit = max(self.min_concurrency, self.limit / 2)
+            elif latency > self.latency_target:
+                self.limit = max(self.min_concurrency, self.limit - 1)
+            else:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            self.condition.notify_all()
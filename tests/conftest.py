@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Fantasy Premier League 2017-2018 scraper
+
+@author: Theodoros Panagiotakos
+"""
+
+# Fixtures running the pipeline in-process against a mock_server.py season. The module
+# settings pointing at the FPL site are patched to the mock's url, the http cache and the
+# payload archive are not used.
+
+import os
+import sys
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import fpl_info
+import get_data as gd
+import http_client as hc
+import mock_server as ms
+import params
+import scheduler as sc
+
+
+@pytest.fixture
+def season():
+    ''' A small mock season: one league of 20 managers, 60 players, 3 gameweeks '''
+    return ms.MockSeason(managers = 20, players = 60, gameweeks = 3)
+
+@pytest.fixture
+def server(season):
+    server = ms.MockFPLServer(season)
+    server.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def pipeline(server, tmp_path, monkeypatch):
+    '''
+    Returns run(rebuild = False), one run of fpl_info.run() on the mock leagues with its
+    databases in tmp_path. Every run downloads bootstrap-static again with a new client.
+    '''
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(gd, "FPL_URL", server.url)
+    monkeypatch.setattr(gd, "PLAYERS_INFO_URL", server.url + gd.PLAYERS_INFO_SUBURL)
+    monkeypatch.setattr(fpl_info, "leagueStandingUrl", server.url + gd.LEAGUE_CLASSIC_STANDING_SUBURL)
+    monkeypatch.setattr(fpl_info, "views_file", os.path.join(REPO_DIR, fpl_info.views_file))
+    monkeypatch.setattr(fpl_info, "summaries_file", os.path.join(REPO_DIR, fpl_info.summaries_file))
+    monkeypatch.setattr(params, "EXPORT_DIR", None)
+    clients = []
+
+    def run(rebuild = False):
+        client = hc.FPLClient(scheduler = sc.RequestScheduler(rate = 2000, burst = 2000))
+        clients.append(client)
+        monkeypatch.setattr(hc, "_default_client", client)
+        monkeypatch.setattr(gd, "_bootstrap", None)
+        return fpl_info.run({"mock": server.season.league_ids}, rebuild, workers = 1)
+
+    yield run
+    for client in clients:
+        client.close()
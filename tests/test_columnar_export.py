@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+Fantasy Premier League 2017-2018 scraper
+
+@author: Theodoros Panagiotakos
+"""
+
+# Columnar export: only the changed gameweek partitions are written, with one dtype per column
+
+import os
+import sqlite3
+import pytest
+
+np = pytest.importorskip("numpy")
+import columnar_export as ce
+
+TABLES = {"points": ("gameweek", "points")}
+
+
+@pytest.fixture
+def connection():
+    connection = sqlite3.connect(":memory:")
+    connection.execute("CREATE TABLE points (gameweek INTEGER, element INTEGER, total_points INTEGER)")
+    connection.executemany("INSERT INTO points VALUES (?, ?, ?)", [(1, 1, 5), (1, 2, 3), (2, 1, 7), (2, 2, 0)])
+    yield connection
+    connection.close()
+
+def modified(export_dir, gameweek):
+    return os.stat(os.path.join(export_dir, "points", "gameweek={0}".format(gameweek), "total_points.npy")).st_mtime_ns
+
+
+def test_unchanged_partitions_are_not_written_again(connection, tmp_path):
+    export_dir = str(tmp_path)
+    assert ce.export_tables(connection, export_dir, None, TABLES) == {"points": [1, 2]}
+    before = [modified(export_dir, gameweek) for gameweek in (1, 2)]
+    assert ce.export_tables(connection, export_dir, set(), TABLES) == {"points": []}
+    assert [modified(export_dir, gameweek) for gameweek in (1, 2)] == before
+
+def test_touched_gameweek_is_exported_again(connection, tmp_path):
+    export_dir = str(tmp_path)
+    ce.export_tables(connection, export_dir, None, TABLES)
+    # same row count, only the run knows the gameweek changed
+    connection.execute("UPDATE points SET total_points = 9 WHERE gameweek = 2 AND element = 2")
+    assert ce.export_tables(connection, export_dir, {2}, TABLES) == {"points": [2]}
+    assert ce.load_partition(export_dir, "points", 2)["total_points"].tolist() == [7, 9]
+    # a new row changes the row count
+    connection.execute("INSERT INTO points VALUES (1, 3, 1)")
+    assert ce.export_tables(connection, export_dir, set(), TABLES) == {"points": [1]}
+    assert ce.load_table(export_dir, "points")["element"].tolist() == [1, 2, 3, 1, 2]
+
+def test_every_partition_of_a_column_has_the_same_dtype(connection, tmp_path):
+    export_dir = str(tmp_path)
+    ce.export_tables(connection, export_dir, None, TABLES)
+    assert ce.load_partition(export_dir, "points", 1)["total_points"].dtype == np.int64
+    # the first NULL of the column, in gameweek 2, also turns gameweek 1 into float64
+    connection.execute("INSERT INTO points VALUES (2, 3, NULL)")
+    assert ce.export_tables(connection, export_dir, {2}, TABLES) == {"points": [1, 2]}
+    assert {ce.load_partition(export_dir, "points", gameweek)["total_points"].dtype for gameweek in (1, 2)} == {np.dtype(np.float64)}
+    assert ce.load_partition(export_dir, "points", 1)["element"].dtype == np.int64
+    total_points = ce.load_table(export_dir, "points")["total_points"]
+    assert total_points[:4].tolist() == [5, 3, 7, 0] and np.isnan(total_points[4])
+    # the column stays float64 once the NULL is gone
+    connection.execute("DELETE FROM points WHERE total_points IS NULL")
+    assert ce.export_tables(connection, export_dir, {2}, TABLES) == {"points": [2]}
+    assert ce.load_partition(export_dir, "points", 2)["total_points"].dtype == np.float64
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+Fantasy Premier League 2017-2018 scraper
+
+@author: Theodoros Panagiotakos
+"""
+
+# Gameweek partitions: rows written before the partitioning are moved to the partition files,
+# the finished blocks are sealed and the league database alone points readers to attach()
+
+import os
+import sqlite3
+import pytest
+import gameweek_partitions as gp
+import manage_sqllite as sq
+
+
+def league_database(tmp_path, gameweeks):
+    ''' A league database with 2 picks of 3 teams in every gameweek, not partitioned yet '''
+    dbase = str(tmp_path / "fpl_1.db")
+    connection, cursor = sq.connect(dbase)
+    with connection:
+        connection.execute("CREATE TABLE gameweekPicks (entry_id INTEGER, gameweek INTEGER, element INTEGER, position INTEGER, PRIMARY KEY(entry_id, gameweek, position))")
+        connection.executemany("INSERT INTO gameweekPicks VALUES (?, ?, ?, ?)",
+                               [(entry_id, week, entry_id * 10 + position, position) for entry_id in range(3) for week in gameweeks for position in (1, 2)])
+    return dbase, connection
+
+
+def test_migrate_moves_the_rows_to_their_partitions(tmp_path):
+    dbase, connection = league_database(tmp_path, range(1, 8))
+    gp.PartitionCatalog(dbase, block = 5, tables = ["gameweekPicks"]).migrate(connection)
+    assert [row[:3] for row in gp.partitions(connection)] == [("fpl_1_gw01-05.db", 1, 5), ("fpl_1_gw06-10.db", 6, 10)]
+    assert os.path.exists(str(tmp_path / "fpl_1_gw01-05.db"))
+    # the league database alone tells the reader to attach the partitions
+    with pytest.raises(sqlite3.OperationalError, match = "attach"):
+        connection.execute("SELECT COUNT(*) FROM gameweekPicks").fetchone()
+    assert gp.attach(connection) == ["gw01_05", "gw06_10"]
+    assert connection.execute("SELECT COUNT(*), MAX(gameweek) FROM gameweekPicks").fetchone() == (3 * 7 * 2, 7)
+    assert connection.execute("SELECT COUNT(*) FROM gw01_05.gameweekPicks").fetchone() == (3 * 5 * 2,)
+    sq.close(connection)
+
+def test_attach_reads_only_the_partitions_of_the_range(tmp_path):
+    dbase, connection = league_database(tmp_path, range(1, 13))
+    gp.PartitionCatalog(dbase, block = 5, tables = ["gameweekPicks"]).migrate(connection)
+    assert gp.attach(connection, 7, 8) == ["gw06_10"]
+    assert connection.execute("SELECT MIN(gameweek), MAX(gameweek) FROM gameweekPicks").fetchone() == (6, 10)
+    sq.close(connection)
+
+def test_seal_compacts_the_finished_partitions(tmp_path):
+    dbase, connection = league_database(tmp_path, range(1, 8))
+    catalog = gp.PartitionCatalog(dbase, block = 5, tables = ["gameweekPicks"])
+    catalog.migrate(connection)
+    assert catalog.seal(connection, 7) == ["fpl_1_gw01-05.db"]
+    assert [(row[0], row[3]) for row in gp.partitions(connection)] == [("fpl_1_gw01-05.db", 1), ("fpl_1_gw06-10.db", 0)]
+    assert not os.path.exists(str(tmp_path / "fpl_1_gw01-05.db-wal"))
+    assert catalog.seal(connection, 7) == []
+    # written again, it is unsealed until the next seal
+    catalog.register(connection, [3])
+    assert gp.partitions(connection, 3, 3)[0][3] == 0
+    sq.close(connection)
+
+def test_blocks_must_fit_in_a_connection(tmp_path):
+    with pytest.raises(ValueError):
+        gp.PartitionCatalog(str(tmp_path / "fpl_1.db"), block = 3)
+    gp.PartitionCatalog(str(tmp_path / "fpl_1.db"), block = 4)
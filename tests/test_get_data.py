@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Fantasy Premier League 2017-2018 scraper
+
+@author: Theodoros Panagiotakos
+"""
+
+# Page parsers: bootstrap-static loaded once per run and parsed again only when it changed,
+# the standings pages of a league walked until the last one
+
+import pytest
+import get_data as gd
+import http_client as hc
+import mock_server as ms
+
+
+@pytest.fixture
+def client(server, monkeypatch):
+    ''' A client of the mock server with no bootstrap-static page loaded yet '''
+    monkeypatch.setattr(gd, "FPL_URL", server.url)
+    monkeypatch.setattr(gd, "PLAYERS_INFO_URL", server.url + gd.PLAYERS_INFO_SUBURL)
+    monkeypatch.setattr(gd, "_bootstrap", None)
+    monkeypatch.setattr(gd, "_bootstrap_content", None)
+    client = hc.FPLClient()
+    yield client
+    client.close()
+
+
+def test_bootstrap_keeps_the_sections_used(client):
+    bootstrap = gd.loadBootstrap(client)
+    assert set(bootstrap) == set(gd.BOOTSTRAP_SECTIONS)
+    assert all(set(element) == set(gd.ELEMENT_FIELDS) for element in bootstrap["elements"])
+
+def test_unchanged_bootstrap_is_not_parsed_again(client, server, monkeypatch):
+    bootstrap = gd.loadBootstrap(client)
+    requests = server.requests
+    # memoized for the run
+    assert gd.loadBootstrap(client) is bootstrap
+    assert server.requests == requests
+    # downloaded again, the same page keeps the parsed result
+    monkeypatch.setattr(gd, "parseBootstrap", lambda text: pytest.fail("unchanged page parsed again"))
+    assert gd.loadBootstrap(client, refresh = True) is bootstrap
+    assert server.requests == requests + 1
+
+def test_changed_element_is_parsed_again(client, server, monkeypatch):
+    bootstrap = gd.loadBootstrap(client)
+    elements = server.season.elements()
+    elements[0]["web_name"] = "Transferred"
+    monkeypatch.setattr(server.season, "elements", lambda: elements)
+    refreshed = gd.loadBootstrap(client, refresh = True)
+    assert refreshed is not bootstrap
+    assert refreshed["elements"][0]["web_name"] == "Transferred"
+    assert refreshed["elements"][1:] == bootstrap["elements"][1:]
+
+def standings_pages(server, monkeypatch, has_next = None):
+    '''
+    Output: the list of the standings pages requested from the mock server, which
+            answers has_next when it is given instead of the real value
+    '''
+    requested = []
+    standings = server.season.standings
+
+    def page(league_id, ls_page):
+        requested.append(ls_page)
+        jsonResponse = standings(league_id, ls_page)
+        if has_next is not None:
+            jsonResponse["standings"]["has_next"] = has_next
+        return jsonResponse
+
+    monkeypatch.setattr(server.season, "standings", page)
+    return requested
+
+def test_league_entries_stop_at_the_last_page(client, server, monkeypatch):
+    # 20 managers, pages of 6: page 4 is the last one
+    server.season.page_size = 6
+    requested = standings_pages(server, monkeypatch)
+    pages_loaded = {}
+    entries = list(gd.iterLeagueEntries(ms.MOCK_LEAGUE_ID, server.url + gd.LEAGUE_CLASSIC_STANDING_SUBURL, window = 3,
+                                        client = client, pages_loaded = pages_loaded))
+    assert [entry_id for entry_id, info in entries] == server.season.entries(ms.MOCK_LEAGUE_ID)
+    # pages 5 and 6 were downloaded with the window of page 4 but are never read
+    assert sorted(requested) == [1, 2, 3, 4, 5, 6]
+    assert pages_loaded == {1: True, 2: True, 3: True, 4: True}
+
+def test_league_entries_stop_at_an_empty_page(client, server, monkeypatch):
+    server.season.page_size = 6
+    requested = standings_pages(server, monkeypatch, has_next = True)
+    entries = list(gd.iterLeagueEntries(ms.MOCK_LEAGUE_ID, server.url + gd.LEAGUE_CLASSIC_STANDING_SUBURL, window = 3, client = client))
+    assert len(entries) == server.season.managers
+    # page 5 has no standings, the walk ends with the window holding it
+    assert sorted(requested) == [1, 2, 3, 4, 5, 6]
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Fantasy Premier League 2017-2018 scraper
+
+@author: Theodoros Panagiotakos
+"""
+
+# Http client: transient failures are retried with backoff, the others raise typed errors
+
+import pytest
+import requests
+import http_client as hc
+import payload_archive as pa
+import response_cache as rc
+
+
+class Response:
+    def __init__(self, status_code, headers = None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = b"{}"
+
+
+def client_answering(monkeypatch, answers, max_retries = 2, **options):
+    '''
+    Output: a client whose requests get the answers in turn (a status code, a Response or an
+            exception), the list of the backoff sleeps
+    '''
+    client = hc.FPLClient(max_retries = max_retries, backoff_base = 0.5, backoff_max = 4, **options)
+    answers = iter(answers)
+    sleeps = []
+
+    def send(url, headers):
+        answer = next(answers)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer if isinstance(answer, Response) else Response(answer)
+
+    monkeypatch.setattr(client, "_send", send)
+    monkeypatch.setattr(hc.time, "sleep", sleeps.append)
+    return client, sleeps
+
+
+def test_transient_errors_are_retried(monkeypatch):
+    client, sleeps = client_answering(monkeypatch, [503, requests.ConnectionError("reset"), 200])
+    assert client.get("http://fpl/drf/entry/1/history").status_code == 200
+    assert len(sleeps) == 2
+
+def test_retry_after_is_respected(monkeypatch):
+    client, sleeps = client_answering(monkeypatch, [Response(429, {"Retry-After": "7"}), 200])
+    client.get("http://fpl/drf/entry/1/history")
+    assert sleeps == [7.0]
+
+def test_backoff_grows_up_to_its_maximum():
+    client = hc.FPLClient(backoff_base = 0.5, backoff_max = 4)
+    assert all(0 <= client._backoff(attempt) <= min(4, 0.5 * 2 ** attempt) for attempt in range(10) for repeat in range(20))
+
+@pytest.mark.parametrize("answers, error", [([404], hc.FPLNotFoundError),
+                                            ([429, 429, 429], hc.FPLRateLimitError),
+                                            ([500, 502, 503], hc.FPLHTTPError),
+                                            ([403], hc.FPLHTTPError),
+                                            ([requests.Timeout("slow")] * 3, hc.FPLConnectionError)])
+def test_failures_raise_typed_errors(monkeypatch, answers, error):
+    client, sleeps = client_answering(monkeypatch, answers)
+    with pytest.raises(error) as raised:
+        client.get("http://fpl/drf/entry/1/history")
+    assert raised.value.url == "http://fpl/drf/entry/1/history"
+    # every answer was used, the permanent errors are not retried
+    assert len(sleeps) == len(answers) - 1
+
+def test_invalid_json_raises_a_response_error(monkeypatch):
+    client = hc.FPLClient()
+    monkeypatch.setattr(client, "get_content", lambda url, revalidate = False: b"<html>")
+    with pytest.raises(hc.FPLResponseError):
+        client.get_json("http://fpl/drf/entry/1/history")
+
+def test_cached_pages_are_archived(monkeypatch, tmp_path):
+    url = "http://fpl/drf/entry/1/history"
+    cache = rc.ResponseCache(str(tmp_path / "cache.db"), ttl_rules = [(r"history$", 0)])
+    cache.store(url, b'{"v": 1}', etag = '"v1"')
+    # a page revalidated with the server (304) and a fresh page served by the cache
+    client, sleeps = client_answering(monkeypatch, [304], cache = cache, archive = pa.PayloadArchive(str(tmp_path / "archive.db")))
+    assert client.get_json(url) == {"v": 1}
+    assert client.archive.lookup(url) == b'{"v": 1}'
+    cache.store("http://fpl/drf/bootstrap-static", b'{"v": 2}')
+    assert client.get_json("http://fpl/drf/bootstrap-static") == {"v": 2}
+    assert client.archive.lookup("http://fpl/drf/bootstrap-static") == b'{"v": 2}'
+    client.close()
+
+def test_retransform_needs_an_archive(monkeypatch):
+    monkeypatch.setattr(hc, "_default_client", None)
+    monkeypatch.setattr(hc, "RETRANSFORM", True)
+    monkeypatch.setattr(hc, "ARCHIVE_FILE", None)
+    with pytest.raises(ValueError):
+        hc.default_client()
+    assert hc._default_client is None
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Fantasy Premier League 2017-2018 scraper
+
+@author: Theodoros Panagiotakos
+"""
+
+# Incremental runs: the gameweek in play is downloaded again on every run until the
+# bootstrap-static page marks it finished
+
+import sqlite3
+import mock_server as ms
+
+
+LEAGUE_DATABASE = "fpl_{0}.db".format(ms.MOCK_LEAGUE_ID)
+
+def planned(dbase, endpoint):
+    ''' The (entry_id, gameweek, element) units the last run planned for endpoint '''
+    with sqlite3.connect(dbase) as connection:
+        return {tuple(row) for row in connection.execute("SELECT entry_id, gameweek, element FROM runLedger WHERE endpoint = ? AND NOT (entry_id = 0 AND gameweek = 0 AND element = 0)", (endpoint,))}
+
+def stage_marks(dbase):
+    with sqlite3.connect(dbase) as connection:
+        return dict(connection.execute("SELECT stage, gameweek FROM stageMarks"))
+
+def live_minutes(gameweek):
+    with sqlite3.connect("fpl_global.db") as connection:
+        return connection.execute("SELECT SUM(minutes) FROM gameweekPerformance WHERE round = ?", (gameweek,)).fetchone()[0]
+
+
+def test_current_gameweek_is_refetched_until_finished(season, pipeline):
+    season.play_live(speed = 0, minute = 30)
+    leagues = pipeline(rebuild = True)
+    assert [league["status"] for league in leagues] == ["finished"]
+    marks = stage_marks(LEAGUE_DATABASE)
+    assert (marks["history"], marks["picks"]) == (2, 2)
+    in_play_minutes = live_minutes(3)
+
+    # still in play: every manager's history and gameweek 3 picks, and its live page, again
+    pipeline()
+    assert {unit[1] for unit in planned(LEAGUE_DATABASE, "picks")} == {3}
+    assert len(planned(LEAGUE_DATABASE, "history")) == season.managers
+    assert planned("fpl_global.db", "live") == {(0, 3, 0)}
+
+    # finished: downloaded one last time and the marks move past it
+    season.live_started = None
+    pipeline()
+    assert {unit[1] for unit in planned(LEAGUE_DATABASE, "picks")} == {3}
+    assert len(planned(LEAGUE_DATABASE, "history")) == season.managers
+    assert planned("fpl_global.db", "live") == {(0, 3, 0)}
+    assert live_minutes(3) > in_play_minutes
+    assert stage_marks(LEAGUE_DATABASE)["picks"] == 3
+    assert stage_marks("fpl_global.db")["live"] == 3
+
+    pipeline()
+    assert planned(LEAGUE_DATABASE, "picks") == set()
+    assert planned(LEAGUE_DATABASE, "history") == set()
+    assert planned("fpl_global.db", "live") == set()
+
+def test_new_finished_gameweek_costs_one_live_page(season, pipeline, monkeypatch):
+    summaries = []
+    element_summary = season.element_summary
+    monkeypatch.setattr(season, "element_summary", lambda element_id: summaries.append(element_id) or element_summary(element_id))
+    season.gameweeks = 2
+    pipeline(rebuild = True)
+    assert planned("fpl_global.db", "live") == {(0, 1, 0), (0, 2, 0)}
+    season.gameweeks = 3
+    pipeline()
+    # every player of the mock season is on the live pages, no element summary is needed
+    assert planned("fpl_global.db", "live") == {(0, 3, 0)}
+    assert summaries == []
+
+def test_market_data_of_the_current_gameweek_is_kept(season, pipeline):
+    season.gameweeks = 2
+    pipeline(rebuild = True)
+    season.gameweeks = 3
+    season.play_live(speed = 0, minute = 30)
+    pipeline()
+    season.live_started = None
+    pipeline()
+    market = {element["id"]: element for element in season.elements()}
+    with sqlite3.connect("fpl_global.db") as connection:
+        # gameweek 1 was loaded by the rebuild after it was over, its live page has no market data
+        assert connection.execute("SELECT COUNT(*) FROM gameweekPerformance WHERE round = 1 AND value IS NOT NULL").fetchone()[0] == 0
+        assert connection.execute("SELECT COUNT(*) FROM gameweekPerformance WHERE round > 1 AND (value IS NULL OR selected IS NULL "
+                                  "OR transfers_balance IS NULL)").fetchone()[0] == 0
+        rows = connection.execute("SELECT element, value, transfers_in, transfers_out, transfers_balance FROM gameweekPerformance WHERE round = 3").fetchall()
+    assert rows and all((value, transfers_in, transfers_out, balance) == (market[element]["now_cost"], market[element]["transfers_in_event"],
+                                                                       market[element]["transfers_out_event"], transfers_in - transfers_out)
+                        for element, value, transfers_in, transfers_out, balance in rows)
+    with sqlite3.connect(LEAGUE_DATABASE) as connection:
+        assert connection.execute("SELECT COUNT(*) FROM gameweekPerformance WHERE round = 3 AND value IS NULL").fetchone()[0] == 0
+
+def test_finished_gameweeks_are_not_refetched(pipeline):
+    pipeline(rebuild = True)
+    assert stage_marks(LEAGUE_DATABASE)["picks"] == 3
+    pipeline()
+    assert planned(LEAGUE_DATABASE, "picks") == set()
+    assert planned(LEAGUE_DATABASE, "history") == set()
+
+def test_summaries_follow_the_changed_performance_rows(pipeline):
+    pipeline(rebuild = True)
+    # a correction of an old gameweek's points in the global database
+    with sqlite3.connect("fpl_global.db") as connection:
+        connection.execute("UPDATE gameweekPerformance SET total_points = total_points + 10 WHERE round = 1")
+    with sqlite3.connect(LEAGUE_DATABASE) as connection:
+        before = dict(connection.execute("SELECT entry_id, bench_points FROM ManagerGameweekSummary_MT WHERE gameweek = 1"))
+    # the live page of gameweek 1 is not downloaded again, only the league copy changes
+    pipeline()
+    with sqlite3.connect(LEAGUE_DATABASE) as connection:
+        after = dict(connection.execute("SELECT entry_id, bench_points FROM ManagerGameweekSummary_MT WHERE gameweek = 1"))
+        expected = dict(connection.execute("SELECT p.entry_id, SUM(b.total_points) FROM gameweekPicks AS p INNER JOIN gameweekPerformance AS b "
+                                           "ON p.element = b.element AND p.gameweek = b.round WHERE p.gameweek = 1 AND p.position > 11 GROUP BY p.entry_id"))
+    assert after != before
+    assert all(after[entry_id] == expected.get(entry_id, 0) for entry_id in after)
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Fantasy Premier League 2017-2018 scraper
+
+@author: Theodoros Panagiotakos
+"""
+
+# League analytics: every metric on a small hand-built league
+
+import pytest
+
+np = pytest.importorskip("numpy")
+import league_analytics as la
+
+
+def two_managers():
+    '''
+    Two managers, 2 gameweeks and 4 elements, picks in gameweek 1 only:
+    entry 10 captains element 1 (10 points) with element 2 and element 3 on the bench,
+    entry 20 triple captains element 2 (2 points) with element 1
+    '''
+    data = la.LeagueArrays(np.array([10, 20]), 2, 4)
+    data.points[1] = [0, 10, 2, 5, 1]
+    for entry, picks in enumerate([[(1, 1, 2, True), (2, 2, 1, False), (12, 3, 0, False)],
+                                   [(1, 2, 3, True), (2, 1, 1, False)]]):
+        for position, element, multiplier, captain in picks:
+            data.pick_element[entry, 1, position - 1] = element
+            data.pick_multiplier[entry, 1, position - 1] = multiplier
+            data.pick_captain[entry, 1, position - 1] = captain
+        data.has_picks[entry, 1] = True
+    data.history_transfers_cost[:, 1] = [4, 0]
+    # entry 10: element 4 -> element 1, entry 20: element 4 -> element 3 and element 1 -> element 2
+    data.transfer_entry = np.array([0, 1, 1])
+    data.transfer_gameweek = np.array([1, 1, 1])
+    data.transfer_in = np.array([1, 3, 2])
+    data.transfer_out = np.array([4, 4, 1])
+    return data
+
+
+def test_effective_ownership():
+    eo = la.effective_ownership(two_managers())
+    assert eo[1].tolist() == [0.0, 150.0, 200.0, 0.0, 0.0]
+    # no picks stored
+    assert eo[2].tolist() == [0.0] * 5
+
+def test_captain_and_bench_points():
+    data = two_managers()
+    assert la.captain_points(data)[:, 1].tolist() == [20, 6]
+    assert la.bench_points(data)[:, 1].tolist() == [5, 0]
+
+def test_captaincy_hits():
+    data = two_managers()
+    assert la.captaincy_hits(data).tolist() == [[False, True, False], [False, False, False]]
+    assert la.captaincy_hit_rate(data).tolist() == [1.0, 0.0]
+
+def test_transfer_gain():
+    gain = la.transfer_gain(two_managers())
+    assert gain.tolist() == [[0, 10 - 1 - 4, 0], [0, (5 - 1) + (2 - 10), 0]]
+
+def test_league_ranks_share_equal_totals():
+    data = la.LeagueArrays(np.array([1, 2, 3]), 2, 0)
+    data.history_total_points[:, 1] = [50, 60, 50]
+    data.history_total_points[:, 2] = [100, np.nan, 120]
+    ranks = la.league_ranks(data)
+    assert ranks[:, 1].tolist() == [2, 1, 2]
+    assert ranks[[0, 2], 2].tolist() == [2, 1] and np.isnan(ranks[1, 2])
+    assert la.rank_movement(ranks)[[0, 2], 2].tolist() == [0, 1]
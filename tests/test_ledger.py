@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Fantasy Premier League 2017-2018 scraper
+
+@author: Theodoros Panagiotakos
+"""
+
+# Run ledger: a run with failed pages or a failed stage is not finished and the next run
+# resumes it, downloading only what the failed run did not complete
+
+import sqlite3
+import get_data as gd
+import mock_server as ms
+
+
+LEAGUE_DATABASE = "fpl_{0}.db".format(ms.MOCK_LEAGUE_ID)
+
+def ledger(dbase, endpoint):
+    ''' {(entry_id, gameweek, element) : status} of the units of endpoint, the stage itself is (0, 0, 0) '''
+    with sqlite3.connect(dbase) as connection:
+        return {tuple(row[:3]): row[3] for row in connection.execute("SELECT entry_id, gameweek, element, status FROM runLedger WHERE endpoint = ?", (endpoint,))}
+
+def run_status(dbase):
+    return ledger(dbase, "run")[(0, 0, 0)]
+
+
+def test_failed_pages_are_resumed(season, pipeline, monkeypatch):
+    history = season.history
+    failing = {1003, 1007}
+    monkeypatch.setattr(season, "history", lambda entry: None if entry in failing else history(entry))
+    leagues = pipeline(rebuild = True)
+    assert [league["status"] for league in leagues] == ["unfinished"]
+    assert run_status(LEAGUE_DATABASE) == "failed"
+    units = ledger(LEAGUE_DATABASE, "history")
+    assert units[(0, 0, 0)] == "failed"
+    assert {unit[0] for unit, status in units.items() if status == "failed" and unit != (0, 0, 0)} == failing
+
+    failing.clear()
+    leagues = pipeline()
+    assert [league["status"] for league in leagues] == ["finished"]
+    assert run_status(LEAGUE_DATABASE) == "done"
+    # the resumed stage kept the users done by the failed run, only the failed ones were attempted again
+    units = ledger(LEAGUE_DATABASE, "history")
+    assert set(units.values()) == {"done"}
+    with sqlite3.connect(LEAGUE_DATABASE) as connection:
+        attempts = dict(connection.execute("SELECT entry_id, attempts FROM runLedger WHERE endpoint = 'history' AND entry_id != 0"))
+        assert connection.execute("SELECT COUNT(DISTINCT entry_id) FROM userTeamHistory").fetchone()[0] == season.managers
+    assert {entry for entry, count in attempts.items() if count == 2} == {1003, 1007}
+
+def test_failed_standings_page(season, pipeline, monkeypatch):
+    season.page_size = 5
+    standings = season.standings
+    monkeypatch.setattr(season, "standings", lambda league_id, page: None if page == 2 else standings(league_id, page))
+    pipeline(rebuild = True)
+    assert run_status(LEAGUE_DATABASE) == "failed"
+    units = ledger(LEAGUE_DATABASE, "standings")
+    assert units[(0, 0, 2)] == "failed" and units[(0, 0, 1)] == "done"
+
+    monkeypatch.setattr(season, "standings", standings)
+    pipeline()
+    assert run_status(LEAGUE_DATABASE) == "done"
+    with sqlite3.connect(LEAGUE_DATABASE) as connection:
+        assert connection.execute("SELECT COUNT(*) FROM users").fetchone()[0] == season.managers
+
+def test_stage_raising_fails_the_run(pipeline, monkeypatch):
+    def league_lookup(*args, **kwargs):
+        raise KeyError("league")
+    monkeypatch.setattr(gd, "iterLeagueEntries", league_lookup)
+    leagues = pipeline(rebuild = True)
+    assert [league["status"] for league in leagues] == ["unfinished"]
+    assert run_status(LEAGUE_DATABASE) == "failed"
+    assert ledger(LEAGUE_DATABASE, "standings")[(0, 0, 0)] == "failed"
+
+def test_missing_gameweek_fails_the_global_run(pipeline, monkeypatch):
+    def game_data(client = None):
+        raise KeyError("current-event")
+    monkeypatch.setattr(gd, "getGameData", game_data)
+    pipeline(rebuild = True)
+    assert run_status("fpl_global.db") == "failed"
+    assert ledger("fpl_global.db", "lookups")[(0, 0, 0)] == "failed"
+    assert ledger("fpl_global.db", "live")[(0, 0, 0)] == "failed"
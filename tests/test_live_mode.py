@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Fantasy Premier League 2017-2018 scraper
+
+@author: Theodoros Panagiotakos
+"""
+
+# Live points of a team: captain multiplier, automatic substitutions and bench boost
+
+import live_mode as lm
+import records as rec
+
+GOALKEEPER, DEFENDER, MIDFIELDER, FORWARD = 1, 2, 3, 4
+# 4-4-2 and a bench of a goalkeeper, a defender, a midfielder and a forward
+FORMATION = [GOALKEEPER] + [DEFENDER] * 4 + [MIDFIELDER] * 4 + [FORWARD] * 2 + [GOALKEEPER, DEFENDER, MIDFIELDER, FORWARD]
+
+
+def squad(types = FORMATION, captain = 6, vice_captain = 7, bench_boost = False):
+    '''
+    Output: the picks of a team whose element ids are their positions (1 to 15),
+            the element types of the players
+    '''
+    picks = [rec.Pick(position, position == captain, position == vice_captain,
+                      2 if position == captain else 1 if position <= lm.STARTING_PLAYERS or bench_boost else 0, position)
+             for position in range(1, 16)]
+    return picks, {position: element_type for position, element_type in enumerate(types, 1)}
+
+def played(points = 2, missed = ()):
+    ''' Every player played 90 minutes for points, except the missed ones '''
+    return {element: (0, 0) if element in missed else (90, points) for element in range(1, 16)}
+
+
+def test_captain_points_count_twice():
+    picks, element_types = squad()
+    row = lm.team_live_points(1, 3, picks, played(), set(range(1, 16)), element_types)
+    assert row == rec.LiveTeamPoints(1, 3, 12 * 2, 4 * 2, 6, 0)
+
+def test_starter_who_did_not_play_is_replaced_by_the_first_bench_player_who_did():
+    picks, element_types = squad()
+    players = played(missed = {10})
+    players[13] = (90, 5)
+    row = lm.team_live_points(1, 3, picks, players, set(range(1, 16)), element_types)
+    # the bench goalkeeper only replaces the goalkeeper, the defender comes in
+    assert (row.points, row.bench_points, row.auto_subs) == (10 * 2 + 2 + 5, 2 + 0 + 2 + 2, 1)
+
+def test_starter_whose_fixture_is_not_finished_is_not_replaced():
+    picks, element_types = squad()
+    row = lm.team_live_points(1, 3, picks, played(missed = {10}), set(range(1, 16)) - {10}, element_types)
+    assert (row.points, row.auto_subs) == (10 * 2 + 2, 0)
+
+def test_substitution_keeps_the_formation_valid():
+    # 3-5-2 with a midfielder before the defender on the bench
+    types = [GOALKEEPER] + [DEFENDER] * 3 + [MIDFIELDER] * 5 + [FORWARD] * 2 + [GOALKEEPER, MIDFIELDER, DEFENDER, FORWARD]
+    picks, element_types = squad(types)
+    players = played(missed = {2})
+    players[14] = (90, 7)
+    row = lm.team_live_points(1, 3, picks, players, set(range(1, 16)), element_types)
+    assert (row.points, row.auto_subs) == (10 * 2 + 2 + 7, 1)
+
+def test_goalkeeper_is_only_replaced_by_the_bench_goalkeeper():
+    picks, element_types = squad()
+    row = lm.team_live_points(1, 3, picks, played(missed = {1, 12}), set(range(1, 16)), element_types)
+    assert (row.points, row.auto_subs) == (10 * 2 + 2, 0)
+    row = lm.team_live_points(1, 3, picks, played(missed = {1}), set(range(1, 16)), element_types)
+    assert (row.points, row.auto_subs) == (11 * 2 + 2, 1)
+
+def test_vice_captain_takes_the_multiplier_when_the_captain_did_not_play():
+    picks, element_types = squad()
+    players = played(missed = {6, 13, 14, 15})
+    players[7] = (90, 5)
+    row = lm.team_live_points(1, 3, picks, players, set(range(1, 16)), element_types)
+    assert (row.points, row.captain, row.auto_subs) == (9 * 2 + 5 * 2, 7, 0)
+
+def test_bench_boost_counts_every_player_without_substitutions():
+    picks, element_types = squad(bench_boost = True)
+    row = lm.team_live_points(1, 3, picks, played(missed = {10}), set(range(1, 16)), element_types)
+    assert row == rec.LiveTeamPoints(1, 3, 14 * 2 + 2, 0, 6, 0)
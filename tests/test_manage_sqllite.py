@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Fantasy Premier League 2017-2018 scraper
+
+@author: Theodoros Panagiotakos
+"""
+
+import sqlite3
+import pytest
+import manage_sqllite as sq
+import metrics as mt
+
+
+def test_upsert_only_writes_changed_rows(tmp_path):
+    connection, cursor = sq.connect(str(tmp_path / "fpl.db"))
+    connection.execute("CREATE TABLE players (id INTEGER, name TEXT, points INTEGER, UNIQUE (id))")
+    statement = sq.upsert_statement("players", ["id", "name", "points"], [["id"]])
+    connection.executemany(statement, [(1, "A", 5), (2, "B", 3)])
+    assert connection.executemany(statement, [(1, "A", 5), (2, "B", 4), (3, "C", 0)]).rowcount == 2
+    assert connection.execute("SELECT id, points FROM players ORDER BY id").fetchall() == [(1, 5), (2, 4), (3, 0)]
+
+    keep_null = sq.upsert_statement("players", ["id", "name", "points"], [["id"]], keep_null = True)
+    assert connection.executemany(keep_null, [(1, None, 5), (2, "B", None)]).rowcount == 0
+    assert connection.execute("SELECT name, points FROM players WHERE id = 1").fetchone() == ("A", 5)
+    sq.close(connection)
+
+def test_failed_flush_drops_its_callbacks(tmp_path):
+    connection, cursor = sq.connect(str(tmp_path / "fpl.db"))
+    connection.execute("CREATE TABLE players (id INTEGER, UNIQUE (id))")
+    called = []
+    connection.writer.add("INSERT INTO players VALUES (?)", [(1,), (1,)])
+    connection.writer.after_flush(lambda: called.append("failed"))
+    with pytest.raises(sqlite3.IntegrityError):
+        connection.writer.flush()
+    connection.writer.add("INSERT INTO players VALUES (?)", [(2,)])
+    connection.writer.after_flush(lambda: called.append("written"))
+    connection.writer.flush()
+    assert called == ["written"]
+    assert connection.execute("SELECT id FROM players").fetchall() == [(2,)]
+    sq.close(connection)
+
+def test_copy_shared_tables_writes_the_changes_only(tmp_path):
+    shared_dbase = str(tmp_path / "fpl_global.db")
+    shared = sqlite3.connect(shared_dbase)
+    with shared:
+        shared.execute("CREATE TABLE playerInfo_LK (id INTEGER, element_type INTEGER, web_name TEXT, UNIQUE (id))")
+        shared.executemany("INSERT INTO playerInfo_LK VALUES (?, ?, ?)", [(i, 1 + i % 4, "Player {0}".format(i)) for i in range(1, 101)])
+    connection, cursor = sq.connect(str(tmp_path / "fpl_1.db"))
+    sq.copy_shared_tables(connection, shared_dbase, ["playerInfo_LK"])
+    assert connection.execute("SELECT COUNT(*) FROM playerInfo_LK").fetchone()[0] == 100
+
+    with shared:
+        shared.execute("UPDATE playerInfo_LK SET web_name = 'Changed' WHERE id = 7")
+        shared.execute("INSERT INTO playerInfo_LK VALUES (101, 2, 'New')")
+    mt.registry.reset()
+    sq.copy_shared_tables(connection, shared_dbase, ["playerInfo_LK"])
+    assert mt.registry.total("db_rows_written_total") == 2
+    assert connection.execute("SELECT web_name FROM playerInfo_LK WHERE id IN (7, 101) ORDER BY id").fetchall() == [("Changed",), ("New",)]
+
+    # rows deleted from the shared table: copied whole again
+    with shared:
+        shared.execute("DELETE FROM playerInfo_LK WHERE id > 50")
+    sq.copy_shared_tables(connection, shared_dbase, ["playerInfo_LK"])
+    assert connection.execute("SELECT COUNT(*) FROM playerInfo_LK").fetchone()[0] == 50
+    shared.close()
+    sq.close(connection)
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+Fantasy Premier League 2017-2018 scraper
+
+@author: Theodoros Panagiotakos
+"""
+
+# Run metrics: the Prometheus text format and the json report merged across processes
+
+import json
+import metrics as mt
+
+
+def registry():
+    metrics = mt.Metrics(buckets = [0.1, 1.0])
+    metrics.inc("fpl_requests_total", endpoint = "/drf/entry/{id}/history", status = 200)
+    metrics.inc("fpl_requests_total", 2, endpoint = "/drf/entry/{id}/history", status = 200)
+    metrics.inc("fpl_requests_total", endpoint = 'a "quoted"\\path', status = "error")
+    for seconds in (0.05, 0.5, 3.0):
+        metrics.observe("fpl_request_seconds", seconds, endpoint = "/drf/bootstrap-static")
+    return metrics
+
+
+def test_prometheus_exposition_format():
+    lines = registry().prometheus().splitlines()
+    assert lines == ['# TYPE fpl_requests_total counter',
+                     'fpl_requests_total{endpoint="/drf/entry/{id}/history",status="200"} 3',
+                     'fpl_requests_total{endpoint="a \\"quoted\\"\\\\path",status="error"} 1',
+                     '# TYPE fpl_request_seconds histogram',
+                     'fpl_request_seconds_bucket{endpoint="/drf/bootstrap-static",le="0.1"} 1',
+                     'fpl_request_seconds_bucket{endpoint="/drf/bootstrap-static",le="1.0"} 2',
+                     'fpl_request_seconds_bucket{endpoint="/drf/bootstrap-static",le="+Inf"} 3',
+                     'fpl_request_seconds_sum{endpoint="/drf/bootstrap-static"} 3.55',
+                     'fpl_request_seconds_count{endpoint="/drf/bootstrap-static"} 3']
+
+def test_json_report_is_merged(tmp_path):
+    worker = registry()
+    worker.write(report_file = str(tmp_path / "report.json"), extra = {"league_id": 1})
+    with open(str(tmp_path / "report.json")) as f:
+        report = json.load(f)
+    assert report["league_id"] == 1
+    parent = registry()
+    parent.merge(report)
+    assert parent.total("fpl_requests_total") == 2 * 4
+    assert parent.pivot("fpl_requests_total", "endpoint", "status")["/drf/entry/{id}/history"] == {200: 6}
+    histogram = parent.report()["histograms"][0]
+    assert (histogram["count"], histogram["buckets"]) == (6, [[0.1, 2], [1.0, 4], ["+Inf", 6]])
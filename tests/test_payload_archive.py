@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+"""
+Fantasy Premier League 2017-2018 scraper
+
+@author: Theodoros Panagiotakos
+"""
+
+# Payload archive: pages are found whatever the host of FPL_URL
+
+import sqlite3
+import payload_archive as pa
+
+
+def test_pages_are_keyed_without_the_host(tmp_path):
+    archive = pa.PayloadArchive(str(tmp_path / "archive.db"))
+    archive.store("https://fantasy.premierleague.com/drf/entry/1/history", b'{"a": 1}')
+    assert archive.lookup("http://127.0.0.1:8765/drf/entry/1/history") == b'{"a": 1}'
+    assert archive.missing(["http://localhost/drf/entry/1/history", "http://localhost/drf/entry/2/history"]) == ["http://localhost/drf/entry/2/history"]
+    assert list(archive.compressed(["http://localhost/drf/entry/1/history"])) == ["http://localhost/drf/entry/1/history"]
+    archive.close()
+
+def test_full_url_keys_are_migrated(tmp_path):
+    archive_file = str(tmp_path / "archive.db")
+    pa.PayloadArchive(archive_file).close()
+    connection = sqlite3.connect(archive_file)
+    with connection:
+        connection.execute("INSERT INTO payloads (url, gameweek, fetched_at, size, body) VALUES (?, 1, 0, 2, ?)",
+                           ("https://fantasy.premierleague.com/drf/event/1/live", pa.compress(b"{}")))
+    connection.close()
+    archive = pa.PayloadArchive(archive_file)
+    assert archive.lookup("http://127.0.0.1/drf/event/1/live") == b"{}"
+    archive.close()
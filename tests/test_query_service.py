@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+Fantasy Premier League 2017-2018 scraper
+
+@author: Theodoros Panagiotakos
+"""
+
+# Query service: the endpoints over the views of a league database and their result cache
+
+import sqlite3
+import mock_server as ms
+import query_service as qs
+
+
+def test_summary_endpoints_read_the_summary_tables(season, pipeline):
+    pipeline(rebuild = True)
+    service = qs.QueryService()
+    summary = service.query(ms.MOCK_LEAGUE_ID, "gameweek-summary", gameweek = 2)
+    gains = service.query(ms.MOCK_LEAGUE_ID, "transfer-gains", gameweek = 2)
+    with sqlite3.connect("fpl_{0}.db".format(ms.MOCK_LEAGUE_ID)) as connection:
+        bench_points = sorted(row[0] for row in connection.execute("SELECT bench_points FROM ManagerGameweekSummary_MT WHERE gameweek = 2"))
+        net_gains = sorted(row[0] for row in connection.execute("SELECT net_gain FROM TransferGain_MT WHERE gameweek = 2"))
+    assert len(summary["rows"]) == season.managers and net_gains
+    assert sorted(row[summary["columns"].index("bench_points")] for row in summary["rows"]) == bench_points
+    assert sorted(row[gains["columns"].index("net_gain")] for row in gains["rows"]) == net_gains
+    service.close()
+
+def test_write_from_another_connection_empties_the_cache(tmp_path):
+    dbase = str(tmp_path / "fpl_1.db")
+    writer = sqlite3.connect(dbase)
+    with writer:
+        writer.execute("PRAGMA journal_mode = WAL")
+        writer.execute("CREATE TABLE users (entry INTEGER, player_name TEXT)")
+        writer.execute("CREATE TABLE tokens (entry_id INTEGER, gameweek INTEGER, token TEXT)")
+        writer.execute('CREATE VIEW "UserTokens_V" AS SELECT "player_name","gameweek","token" FROM tokens INNER JOIN users ON tokens."entry_id" = users."entry"')
+        writer.execute("INSERT INTO users VALUES (1, 'Manager 1')")
+        writer.execute("INSERT INTO tokens VALUES (1, 2, 'wildcard')")
+    service = qs.QueryService(str(tmp_path))
+    cached = service.query(1, "tokens")
+    assert service.query(1, "tokens") is cached
+    # a commit of another connection changes the PRAGMA data_version seen by the service
+    with writer:
+        writer.execute("INSERT INTO tokens VALUES (1, 5, 'bench boost')")
+    result = service.query(1, "tokens")
+    assert result is not cached
+    assert result["rows"] == [("Manager 1", 2, "wildcard"), ("Manager 1", 5, "bench boost")]
+    assert service.query(1, "tokens") is result
+    service.close()
+    writer.close()
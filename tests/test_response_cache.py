@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Fantasy Premier League 2017-2018 scraper
+
+@author: Theodoros Panagiotakos
+"""
+
+# Response cache: freshness from the TTL rules, least recently used pages evicted first
+
+import itertools
+import get_data as gd
+import http_client as hc
+import response_cache as rc
+
+TTL_RULES = [(r"/event/(?P<gameweek>\d+)/live", 60), (r"/bootstrap-static", 300)]
+
+
+def test_ttl_rules(tmp_path):
+    cache = rc.ResponseCache(str(tmp_path / "cache.db"), ttl_rules = TTL_RULES, default_ttl = 10)
+    cache.finished_gameweek = 4
+    assert cache.expiry("http://fpl/drf/event/5/live", now = 1000) == 1060
+    assert cache.expiry("http://fpl/drf/bootstrap-static", now = 1000) == 1300
+    assert cache.expiry("http://fpl/drf/entry/1/history", now = 1000) == 1010
+    # the pages of the finished gameweeks never change
+    assert cache.expiry("http://fpl/drf/event/4/live", now = 1000) is None
+    assert cache.expiry("http://fpl/drf/event/3/live", now = 1000) is None
+    cache.close()
+
+def test_gameweek_in_play_is_not_immutable(tmp_path, server, monkeypatch):
+    # the current event is gameweek 3 but its fixtures are still in play
+    server.season.play_live(speed = 0, minute = 30)
+    monkeypatch.setattr(gd, "PLAYERS_INFO_URL", server.url + gd.PLAYERS_INFO_SUBURL)
+    monkeypatch.setattr(gd, "_bootstrap", None)
+    client = hc.FPLClient(cache = rc.ResponseCache(str(tmp_path / "cache.db"), ttl_rules = TTL_RULES, default_ttl = 10))
+    gd.loadBootstrap(client)
+    assert (client.current_gameweek, client.cache.finished_gameweek) == (3, 2)
+    assert client.cache.expiry("http://fpl/drf/event/3/live", now = 1000) == 1060
+    assert client.cache.expiry("http://fpl/drf/event/2/live", now = 1000) is None
+    client.close()
+
+def test_stale_responses_are_kept_and_refreshed(tmp_path, monkeypatch):
+    clock = iter(itertools.count(1000, 30))
+    monkeypatch.setattr(rc.time, "time", lambda: next(clock))
+    cache = rc.ResponseCache(str(tmp_path / "cache.db"), ttl_rules = TTL_RULES, default_ttl = 10)
+    cache.store("http://fpl/drf/event/5/live", b"{}", etag = '"v1"')
+    cached = cache.lookup("http://fpl/drf/event/5/live")
+    assert cached.is_fresh(now = 1059) and not cached.is_fresh(now = 1061)
+    assert cached.validators() == {"If-None-Match": '"v1"'}
+    cache.refresh("http://fpl/drf/event/5/live")
+    assert cache.lookup("http://fpl/drf/event/5/live").expires_at > 1060
+    cache.close()
+
+def test_least_recently_used_responses_are_evicted(tmp_path, monkeypatch):
+    clock = iter(itertools.count(1000))
+    monkeypatch.setattr(rc.time, "time", lambda: next(clock))
+    cache = rc.ResponseCache(str(tmp_path / "cache.db"), max_bytes = 10)
+    cache.store("http://fpl/a", b"aaaa")
+    cache.store("http://fpl/b", b"bbbb")
+    cache.lookup("http://fpl/a")
+    cache.store("http://fpl/c", b"cccc")
+    assert cache.lookup("http://fpl/b") is None
+    assert cache.lookup("http://fpl/a").body == b"aaaa" and cache.lookup("http://fpl/c").body == b"cccc"
+    assert cache.total_bytes == 8
+    cache.close()
+    # the size is read back when the cache is opened again
+    cache = rc.ResponseCache(str(tmp_path / "cache.db"), max_bytes = 10)
+    assert cache.total_bytes == 8
+    cache.close()
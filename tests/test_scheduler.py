@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+Fantasy Premier League 2017-2018 scraper
+
+@author: Theodoros Panagiotakos
+"""
+
+# Request scheduler: priority order of the jobs and AIMD adaptation of the limits
+
+import time
+import fetch_engine as fe
+import get_data as gd
+import scheduler as sc
+
+
+HOST = "fantasy.premierleague.com"
+
+class RecordingClient:
+    ''' Client answering every url with an empty page and recording the order of the requests '''
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self.replay = False
+        self.urls = []
+
+    def get_json(self, url):
+        self.urls.append(url)
+        return {}
+
+
+def test_jobs_start_in_priority_order():
+    scheduler = sc.RequestScheduler()
+    scheduler.current_gameweek = 3
+    jobs = {"history": gd.userTeamHistoryUrl(1),
+            "old picks": gd.userGameweekPicksUrl(1, 2),
+            "picks": gd.userGameweekPicksUrl(1, 3),
+            "bootstrap": gd.PLAYERS_INFO_URL}
+    client = RecordingClient(scheduler)
+    fe.run_batch(jobs, lambda key, jsonResponse: None, max_workers = 1, client = client)
+    assert client.urls == [jobs["bootstrap"], jobs["picks"], jobs["history"], jobs["old picks"]]
+    client.urls = []
+    assert set(fe.fetch_batch(jobs, max_workers = 1, client = client)) == set(jobs)
+    assert client.urls == [jobs["bootstrap"], jobs["picks"], jobs["history"], jobs["old picks"]]
+
+def test_limits_drop_on_throttling():
+    scheduler = sc.RequestScheduler(rate = 1000, burst = 1000, min_concurrency = 1, max_concurrency = 8)
+    for status_code, limit in [(429, 4), (503, 2), (None, 1), (429, 1)]:
+        scheduler.release(scheduler.acquire(gd.userTeamHistoryUrl(1)), status_code)
+        assert scheduler.limit == limit
+    assert scheduler.active == 0
+    assert scheduler.buckets[HOST].rate == 1000 / 2 ** 4
+
+def test_limits_grow_back_under_the_latency_target():
+    scheduler = sc.RequestScheduler(rate = 1000, burst = 1000, min_concurrency = 1, max_concurrency = 8, latency_target = 2.0)
+    scheduler.release(scheduler.acquire(gd.userTeamHistoryUrl(1)), 503)
+    assert (scheduler.limit, scheduler.buckets[HOST].rate) == (4, 500)
+    scheduler.release(scheduler.acquire(gd.userTeamHistoryUrl(1)), 200)
+    assert (scheduler.limit, scheduler.buckets[HOST].rate) == (4.25, 550)
+    # a success slower than the latency target lowers the limit and keeps the rate
+    scheduler.acquire(gd.userTeamHistoryUrl(1))
+    scheduler.release((HOST, time.monotonic() - 3), 200)
+    assert (scheduler.limit, scheduler.buckets[HOST].rate) == (3.25, 550)